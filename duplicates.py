@@ -19,12 +19,16 @@
 Largely based on imagededup package, see: https://idealo.github.io/imagededup/
 """
 
+import io
 import logging
 # import pdb
+import tempfile
 from typing import Literal, Optional, Union, TypedDict
 
 from imagededup import methods as image_methods
+from imagededup.utils import image_utils
 import numpy as np
+from PIL import Image
 
 from fapfavorites import fapbase
 
@@ -75,6 +79,9 @@ ANIMATED_SENSITIVITY_DEFAULTS: _SensitivitiesType = {
 }
 
 _SCORE_PRECISION: float = 0.002
+_HAMMING_BLOCK_SIZE: int = 1 << 22  # max hash pairs compared at once (bounds memory: ~8 bytes each)
+_HAMMING_INDEX_MAX_DISTANCE: int = 16  # below this use multi-index hashing (chunks of >= 4 bits)
+_POPCOUNT_8_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 
 class DuplicateObjType(TypedDict):
@@ -145,15 +152,34 @@ class Duplicates:
       }
     return self._lazy_perceptual_hashers
 
-  def Encode(self, image_path: str) -> tuple[str, str, str, str, np.ndarray]:
-    """Get perceptual hash for one specific image in image_path.
+  def Encode(self, image: Union[str, bytes]) -> tuple[str, str, str, str, np.ndarray]:
+    """Get perceptual hash for one specific image, given by path or by its binary data.
+
+    The image is read and decoded only once, and the same pixels are handed to all hashers.
 
     Args:
-      image_path: The full image path to get the image from
+      image: The full image path to get the image from, or the image binary data itself
 
     Returns:
       (percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash)
     """
+    image_array = _LoadImageArray(image)
+    if image_array is not None:
+      return tuple(  # type: ignore
+          self.perceptual_hashers[method].encode_image(image_array=image_array)[0]
+          if method == 'cnn' else
+          self.perceptual_hashers[method].encode_image(image_array=image_array)
+          for method in DUPLICATE_HASHES)
+    # format imagededup does not know: let it handle (and report) the file the usual way
+    if isinstance(image, str):
+      return self._EncodeFile(image)
+    with tempfile.NamedTemporaryFile(delete=True) as temp_file:
+      temp_file.write(image)
+      temp_file.flush()
+      return self._EncodeFile(temp_file.name)
+
+  def _EncodeFile(self, image_path: str) -> tuple[str, str, str, str, np.ndarray]:
+    """Get perceptual hash for one specific image in image_path, letting imagededup read it."""
     return tuple(  # type: ignore
         self.perceptual_hashers[method].encode_image(image_file=image_path)[0]
         if method == 'cnn' else
@@ -271,9 +297,7 @@ class Duplicates:
     return (n_dup, n_img)
 
   # TODO: investigate if we can have a way to only match new images against old ones instead
-  #     of all against all... if possible will significantly speed duplicates up;
-  #     we would probably have to dig the comparison operation and implement ourselves;
-  #     maybe it helps to store the hashes as ints instead of hex strings, to save a conversion
+  #     of all against all... if possible will significantly speed duplicates up
   def FindDuplicates(  # noqa: C901
       self,
       hash_encodings_map: HashEncodingMapType,
@@ -331,10 +355,8 @@ class Duplicates:
         logging.info(
             'Computing diffs using %r, with regular threshold <=%d and animated <=%d',
             method.upper(), regular_sensitivities[method], animated_sensitivities[method])
-        method_dup = self.perceptual_hashers[method].find_duplicates(
-            encoding_map=hash_encodings_map[method],
-            max_distance_threshold=regular_sensitivities[method],
-            scores=True)
+        method_dup = _HammingDuplicates(
+            hash_encodings_map[method], regular_sensitivities[method])  # type: ignore
       # we filter them into pairs of duplicates and a score, eliminating symmetric relationships
       scored_duplicates: dict[DuplicatesKeyType, Union[int, float]] = {}
       for sha1, dup in method_dup.items():
@@ -426,3 +448,113 @@ class Duplicates:
     for k in remaining_digests:
       self.index[k] = new_key
     return False
+
+
+def _LoadImageArray(image: Union[str, bytes]) -> Optional[np.ndarray]:
+  """Decode image to an RGB array, the same way imagededup would read the file.
+
+  Args:
+    image: The full image path to get the image from, or the image binary data itself
+
+  Returns:
+    uint8 array of shape (height, width, 3), or None if imagededup does not support the format
+  """
+  with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as img:
+    if img.format not in image_utils.IMG_FORMATS:
+      return None
+    if img.mode != 'RGB':
+      return np.asarray(img.convert('RGBA').convert('RGB'))
+    return np.asarray(img)
+
+
+def _Popcount64(values: np.ndarray) -> np.ndarray:
+  """Count the set bits of each element of a uint64 array, returning a uint8 array."""
+  return _POPCOUNT_8_BITS[values.view(np.uint8)].reshape(values.shape + (8,)).sum(
+      axis=-1, dtype=np.uint8)
+
+
+def _HammingPairsBlocks(
+    hashes: np.ndarray, max_distance: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Brute-force all (upper triangle) hash pairs, in blocks of rows; returns (rows, cols, dist)."""
+  n_hashes = len(hashes)
+  block_rows = max(1, _HAMMING_BLOCK_SIZE // max(1, n_hashes))
+  rows, cols, distances = [], [], []
+  for start in range(0, n_hashes, block_rows):
+    block_distances = _Popcount64(
+        np.bitwise_xor(hashes[start:(start + block_rows), None], hashes[None, :]))
+    block_rows_idx, block_cols = np.nonzero(block_distances <= max_distance)
+    upper = block_cols > start + block_rows_idx  # no self-matches or symmetric repetitions
+    rows.append(block_rows_idx[upper] + start)
+    cols.append(block_cols[upper])
+    distances.append(block_distances[block_rows_idx[upper], block_cols[upper]])
+  return (np.concatenate(rows), np.concatenate(cols), np.concatenate(distances))
+
+
+def _HammingPairsIndexed(
+    hashes: np.ndarray, max_distance: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Find (upper triangle) hash pairs by multi-index hashing; returns (rows, cols, dist).
+
+  Splits the 64 bits into (max_distance + 1) disjoint chunks: by the pigeonhole principle any two
+  hashes within max_distance of each other are identical in at least one chunk. So for each chunk
+  we sort the hashes by that chunk and only compare hashes that fall in the same bucket, which is
+  about linear for real (well spread) hashes instead of comparing all N^2 pairs.
+  """
+  n_hashes = len(hashes)
+  n_chunks = max_distance + 1
+  found: list[np.ndarray] = []
+  bit = 0
+  for chunk in range(n_chunks):
+    width = 64 // n_chunks + (1 if chunk < 64 % n_chunks else 0)
+    chunk_keys = (hashes >> np.uint64(bit)) & np.uint64((1 << width) - 1)
+    bit += width
+    order = np.argsort(chunk_keys, kind='stable')
+    sorted_keys = chunk_keys[order]
+    # compare every hash with the one k positions after it, in sorted order, until no bucket has
+    # more than k elements (a bucket with > k elements always has a match at offset k)
+    for k in range(1, n_hashes):
+      same = sorted_keys[:-k] == sorted_keys[k:]
+      if not same.any():
+        break
+      first, second = order[:-k][same], order[k:][same]
+      first, second = np.minimum(first, second), np.maximum(first, second)
+      close = _Popcount64(np.bitwise_xor(hashes[first], hashes[second])) <= max_distance
+      found.append(first[close].astype(np.int64) * n_hashes + second[close])
+  # the same pair may match in many chunks; np.unique() also sorts them row-major
+  pairs = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+  rows, cols = pairs // n_hashes, pairs % n_hashes
+  return (rows, cols, _Popcount64(np.bitwise_xor(hashes[rows], hashes[cols])))
+
+
+def _HammingDuplicates(
+    encoding_map: dict[str, str], max_distance: int) -> dict[str, list[tuple[str, int]]]:
+  """Find all pairs of (64 bit, hex) hashes within a maximum Hamming distance, vectorized.
+
+  Does the job of imagededup's find_duplicates() for the hashing methods, but converts each hex
+  hash only once into a contiguous uint64 array and works on it with numpy (XOR + popcount). For
+  small distances (the usual sensitivities) it only compares hashes that share a chunk of bits
+  (see _HammingPairsIndexed()), otherwise it compares blocks of rows against all the hashes.
+
+  Args:
+    encoding_map: dict like {sha: hex_hash}
+    max_distance: Max Hamming distance (inclusive) to consider a pair a duplicate
+
+  Returns:
+    dict like {sha1: [(sha2, distance), ...]}; each pair is listed only once (under its first key)
+
+  Raises:
+    Error: if a hash is larger than 64 bits
+  """
+  keys = list(encoding_map.keys())
+  if any(len(encoding_map[k]) > 16 for k in keys):
+    raise Error('Hashes must be 64 bits (16 hex digits) at most')
+  if max_distance < 0 or len(keys) < 2:
+    return {}
+  hashes = np.array([int(encoding_map[k], 16) for k in keys], dtype=np.uint64)
+  if max_distance < _HAMMING_INDEX_MAX_DISTANCE:
+    rows, cols, distances = _HammingPairsIndexed(hashes, max_distance)
+  else:
+    rows, cols, distances = _HammingPairsBlocks(hashes, max_distance)
+  duplicates: dict[str, list[tuple[str, int]]] = {}
+  for row, col, distance in zip(rows.tolist(), cols.tolist(), distances.tolist()):
+    duplicates.setdefault(keys[row], []).append((keys[col], distance))
+  return duplicates
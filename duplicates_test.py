@@ -8,6 +8,7 @@
 import copy
 import os.path
 # import pdb
+import random
 import unittest
 from unittest import mock
 
@@ -26,6 +27,7 @@ _TESTDATA_PATH = os.path.join(os.path.dirname(__file__), 'testdata/')
 class TestDuplicates(unittest.TestCase):
   """Tests for duplicates.py."""
 
+  @mock.patch('fapfavorites.duplicates._LoadImageArray')
   @mock.patch('fapfavorites.duplicates.image_methods.PHash.encode_image')
   @mock.patch('fapfavorites.duplicates.image_methods.AHash.encode_image')
   @mock.patch('fapfavorites.duplicates.image_methods.DHash.encode_image')
@@ -33,16 +35,39 @@ class TestDuplicates(unittest.TestCase):
   @mock.patch('fapfavorites.duplicates.image_methods.CNN.encode_image')
   def test_Encode(
       self, mock_cnn: mock.MagicMock, mock_w: mock.MagicMock, mock_d: mock.MagicMock,
-      mock_a: mock.MagicMock, mock_p: mock.MagicMock) -> None:
+      mock_a: mock.MagicMock, mock_p: mock.MagicMock, mock_load: mock.MagicMock) -> None:
     """Test."""
     mock_p.return_value = 'abc'
     mock_a.return_value = 'def'
     mock_d.return_value = 'ghi'
     mock_w.return_value = 'jkl'
     mock_cnn.return_value = ['array']
+    image_array = np.zeros((2, 2, 3), dtype=np.uint8)
+    mock_load.return_value = image_array
     dup = duplicates.Duplicates({}, {})
     self.assertTupleEqual(dup.Encode('path'), ('abc', 'def', 'ghi', 'jkl', 'array'))
+    mock_load.assert_called_once_with('path')
+    mock_p.assert_called_once_with(image_array=image_array)
+    mock_cnn.assert_called_once_with(image_array=image_array)
+    # unsupported format falls back to letting imagededup read the file
+    mock_load.return_value = None
+    mock_p.reset_mock()
+    self.assertTupleEqual(dup.Encode('path'), ('abc', 'def', 'ghi', 'jkl', 'array'))
     mock_p.assert_called_once_with(image_file='path')
+    # ...even if we only have the data: it goes through a temporary file
+    mock_p.reset_mock()
+    self.assertTupleEqual(dup.Encode(b'data'), ('abc', 'def', 'ghi', 'jkl', 'array'))
+    self.assertNotEqual(mock_p.call_args.kwargs['image_file'], 'path')
+
+  def test_LoadImageArray(self) -> None:
+    """Test."""
+    f_name = os.path.join(_TESTDATA_PATH, '106.jpg')
+    image_array = duplicates._LoadImageArray(f_name)
+    self.assertIsNotNone(image_array)
+    self.assertEqual(image_array.dtype, np.uint8)  # type: ignore
+    self.assertEqual(image_array.shape[2], 3)  # type: ignore
+    with open(f_name, 'rb') as f_obj:
+      np.testing.assert_array_equal(duplicates._LoadImageArray(f_obj.read()), image_array)
 
   def test_Encode_Real_Data(self) -> None:
     """Test."""
@@ -53,20 +78,14 @@ class TestDuplicates(unittest.TestCase):
         ('89991f6f62a63479', '091b5f7761323000', '737394c5d3e66431', '091b7f7f71333018'))
     self.assertTupleEqual(dup.Encode(f_name)[-1].shape, (576,))
 
-  @mock.patch('fapfavorites.duplicates.image_methods.PHash.find_duplicates')
-  @mock.patch('fapfavorites.duplicates.image_methods.AHash.find_duplicates')
-  @mock.patch('fapfavorites.duplicates.image_methods.DHash.find_duplicates')
-  @mock.patch('fapfavorites.duplicates.image_methods.WHash.find_duplicates')
+  @mock.patch('fapfavorites.duplicates._HammingDuplicates')
   @mock.patch('fapfavorites.duplicates.image_methods.CNN.find_duplicates')
-  def test_FindDuplicates(
-      self, mock_cnn: mock.MagicMock, mock_w: mock.MagicMock, mock_d: mock.MagicMock,
-      mock_a: mock.MagicMock, mock_p: mock.MagicMock) -> None:
+  def test_FindDuplicates(self, mock_cnn: mock.MagicMock, mock_hamming: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
-    mock_p.return_value = _NEW_DUPLICATES['percept']
-    mock_a.return_value = _NEW_DUPLICATES['average']
-    mock_d.return_value = _NEW_DUPLICATES['diff']
-    mock_w.return_value = _NEW_DUPLICATES['wavelet']
+    mock_hamming.side_effect = [
+        _NEW_DUPLICATES['percept'], _NEW_DUPLICATES['average'],
+        _NEW_DUPLICATES['diff'], _NEW_DUPLICATES['wavelet']]
     mock_cnn.return_value = _NEW_DUPLICATES['cnn']
     dup = duplicates.Duplicates(
         copy.deepcopy(_DUPLICATES_DICT_BEFORE), copy.deepcopy(_DUPLICATES_INDEX_BEFORE))
@@ -93,19 +112,47 @@ class TestDuplicates(unittest.TestCase):
         dup.FindDuplicates(
             mock_encoding, {'yyy'},
             duplicates.METHOD_SENSITIVITY_DEFAULTS, duplicates.ANIMATED_SENSITIVITY_DEFAULTS), 4)
-    mock_p.assert_called_once_with(
-        encoding_map=mock_encoding['percept'], max_distance_threshold=4, scores=True)
-    mock_a.assert_called_once_with(
-        encoding_map=mock_encoding['average'], max_distance_threshold=1, scores=True)
-    mock_d.assert_called_once_with(
-        encoding_map=mock_encoding['diff'], max_distance_threshold=4, scores=True)
-    mock_w.assert_called_once_with(
-        encoding_map=mock_encoding['wavelet'], max_distance_threshold=1, scores=True)
+    self.assertListEqual(
+        mock_hamming.call_args_list,
+        [mock.call(mock_encoding['percept'], 4), mock.call(mock_encoding['average'], 1),
+         mock.call(mock_encoding['diff'], 4), mock.call(mock_encoding['wavelet'], 1)])
     mock_cnn.assert_called_once_with(
         encoding_map=mock_encoding['cnn'], min_similarity_threshold=0.95, scores=True)
     self.assertDictEqual(dup.registry, _DUPLICATES_DICT_AFTER)
     self.assertDictEqual(dup.index, _DUPLICATES_INDEX_AFTER)
 
+  def test_HammingDuplicates(self) -> None:
+    """Test."""
+    self.maxDiff = None
+    encodings = {
+        'a': '89991f6f62a63479',
+        'b': '89991f6f62a63478',  # 1 bit from 'a'
+        'c': '89991f6f62a6347e',  # 3 bits from 'a', 2 bits from 'b'
+        'd': '7666e0909d59cb86',  # all bits flipped from 'a'
+    }
+    self.assertDictEqual(duplicates._HammingDuplicates(encodings, 0), {})
+    self.assertDictEqual(duplicates._HammingDuplicates(encodings, 1), {'a': [('b', 1)]})
+    self.assertDictEqual(
+        duplicates._HammingDuplicates(encodings, 3), {'a': [('b', 1), ('c', 3)], 'b': [('c', 2)]})
+    with mock.patch('fapfavorites.duplicates._HAMMING_BLOCK_SIZE', 4):  # force 1 row blocks
+      self.assertDictEqual(
+          duplicates._HammingDuplicates(encodings, 64),
+          {'a': [('b', 1), ('c', 3), ('d', 64)], 'b': [('c', 2), ('d', 63)], 'c': [('d', 61)]})
+    with self.assertRaisesRegex(duplicates.Error, r'64 bits'):
+      duplicates._HammingDuplicates({'a': '89991f6f62a634790'}, 1)
+    # the indexed search must find exactly the same pairs as the brute force one
+    rand = random.Random(42)
+    encodings = {}
+    for i in range(60):
+      hash_int = rand.getrandbits(64) if i < 20 else int(encodings[f'k{i % 20}'], 16)
+      for _ in range(rand.randint(0, 8)):
+        hash_int ^= 1 << rand.randrange(64)
+      encodings[f'k{i}'] = f'{hash_int:016x}'
+    for max_distance in range(-1, 12):
+      indexed = duplicates._HammingDuplicates(encodings, max_distance)
+      with mock.patch('fapfavorites.duplicates._HAMMING_INDEX_MAX_DISTANCE', 0):
+        self.assertDictEqual(indexed, duplicates._HammingDuplicates(encodings, max_distance))
+
   def test_TrimDeletedBlob(self) -> None:
     """Test."""
     self.maxDiff = None
@@ -16,22 +16,21 @@
 #
 """Imagefap.com base methods and constants."""
 
+import concurrent.futures
 import functools
 import hashlib
 import html
-import http.client
 import logging
 import os
 import os.path
 # import pdb
 import random
 import re
-import socket
+import threading
 import time
-from typing import Optional
-import urllib.error
-import urllib.request
+from typing import Callable, Optional, Union
 
+import requests
 import sanitize_filename
 
 from baselib import base
@@ -45,6 +44,10 @@ __version__ = (2, 0)
 _MAX_RETRY = 10         # int number of retries for URL get
 _URL_TIMEOUT = 15.0     # URL timeout, in seconds
 _PAGE_BACKTRACKING_THRESHOLD = 5
+_MAX_CONNECTIONS = 4    # max concurrent (kept-alive) connections to the site
+_PAGE_READ_AHEAD = _MAX_CONNECTIONS  # listing pages fetched concurrently when paging
+_HASH_CHUNK_SIZE = 1 << 20  # bytes read at a time when hashing files (Python < 3.11)
+_LISTING_CACHE_TTL = 60.0   # seconds a listing page (favorites/album) that was read may be reused
 
 IMAGE_TYPES = {
     'bmp': 'image/bmp',
@@ -65,30 +68,47 @@ FAVORITES_URL = (
 FOLDER_URL = lambda u, f, p: f'{FAVORITES_URL(u, p)}&folderid={f}'  # cspell:disable-line
 IMG_URL = lambda id: f'https://www.imagefap.com/photo/{id}/'
 
-# the regular expressions we use to navigate the pages
-_FIND_ONLY_IN_PICTURE_FOLDER = re.compile(r'<\/a><\/td><\/tr>\s+<\/table>\s+<table')
+# the regular expressions we use to navigate the pages (all re.ASCII: their `\s` only ever match
+# the plain whitespace between HTML tags/attributes, no need for Unicode whitespace classes)
+_FIND_ONLY_IN_PICTURE_FOLDER = re.compile(
+    r'<\/a><\/td><\/tr>\s+<\/table>\s+<table', re.ASCII)
 _FIND_ONLY_IN_GALLERIES_FOLDER = re.compile(
-    r'<td\s+class=.blk_favorites_hdr.*<b>Gallery Name<\/span>')
+    r'<td\s+class=.blk_favorites_hdr.*<b>Gallery Name<\/span>', re.ASCII)
 _FIND_NAME_IN_FAVORITES = re.compile(
-    r'<a\s+class=.blk_header.\s+href="\/profile\.php\?user=(.*)"\s+style="')
+    r'<a\s+class=.blk_header.\s+href="\/profile\.php\?user=(.*)"\s+style="', re.ASCII)
 _FIND_USER_ID_RE = re.compile(  # cspell:disable-next-line
-    r'<a\s+class=.blk_header.\s+href="\/showfavorites.php\?userid=([0-9]+)".*>')
+    r'<a\s+class=.blk_header.\s+href="\/showfavorites.php\?userid=([0-9]+)".*>', re.ASCII)
 FIND_NAME_IN_FOLDER = re.compile(
-    r'<a\s+class=.blk_favorites.\s+href=".*none;">(.*)<\/a><\/td><\/tr>')
+    r'<a\s+class=.blk_favorites.\s+href=".*none;">(.*)<\/a><\/td><\/tr>', re.ASCII)
 FIND_FOLDERS = re.compile(
     r'<td\s+class=.blk_favorites.><a\s+class=.blk_galleries.\s+href="'
     r'https:\/\/www.imagefap.com\/showfavorites.php\?userid=[0-9]+'  # cspell:disable-line
-    r'&folderid=([0-9]+)".*>(.*)<\/a><\/td>')                        # cspell:disable-line
-_FAVORITE_IMAGE = re.compile(r'<td\s+class=.blk_favorites.\s+id="img-([0-9]+)"\s+align=')
-FULL_IMAGE = lambda img_id: re.compile(
-    r'<a\shref=\"(https:\/\/.*\/images\/full\/.*\/' + str(img_id) + r'\..*)"\sframed=')
+    r'&folderid=([0-9]+)".*>(.*)<\/a><\/td>', re.ASCII)              # cspell:disable-line
+_FAVORITE_IMAGE = re.compile(
+    r'<td\s+class=.blk_favorites.\s+id="img-([0-9]+)"\s+align=', re.ASCII)
+FULL_IMAGE = functools.lru_cache(maxsize=1 << 12)(lambda img_id: re.compile(
+    r'<a\shref=\"(https:\/\/.*\/images\/full\/.*\/' + str(img_id) + r'\..*)"\sframed=',
+    re.ASCII))
 _IMAGE_NAME = re.compile(
-    r'<meta\s+name="description"\s+content="View this hot (.*) porn pic uploaded by')
+    r'<meta\s+name="description"\s+content="View this hot (.*) porn pic uploaded by',
+    re.ASCII)
 
 
 # internal types definitions
 FailedTupleType = tuple[int, int, Optional[str], Optional[str]]
 
+# the shared HTTP session (keep-alive connection pool) and the lock that paces all requests to
+# the site, so that concurrent fetches never start requests faster than sequential ones would;
+# _NEXT_REQUEST_TIME is the time.monotonic() before which no new request may start
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+_PACING_LOCK = threading.Lock()
+_NEXT_REQUEST_TIME: float = 0.0
+
+# the recently read listing pages, as {url: (time read, page)}
+_LISTING_CACHE: dict[str, tuple[float, str]] = {}
+_LISTING_CACHE_LOCK = threading.Lock()
+
 
 class Error(base.Error):
   """Base fap exception."""
@@ -166,11 +186,11 @@ def GetUserDisplayName(user_id: int) -> str:
     raise Error('Empty user ID')
   url: str = FAVORITES_URL(user_id, 0)  # use the favorites page
   logging.info('Fetching favorites page: %s', url)
-  user_html = FapHTMLRead(url)
+  user_html = ListingHTMLRead(url)
   user_names: list[str] = _FIND_NAME_IN_FAVORITES.findall(user_html)
   if len(user_names) != 1:
     raise Error(f'Could not find user name for {user_id}')
-  return html.unescape(user_names[0])
+  return UnescapeHTML(user_names[0])
 
 
 def ConvertFavoritesName(user_id: int, favorites_name: str) -> tuple[int, str]:
@@ -189,17 +209,18 @@ def ConvertFavoritesName(user_id: int, favorites_name: str) -> tuple[int, str]:
   favorites_name = favorites_name.strip()
   if not user_id or not favorites_name:
     raise Error('Empty user ID or favorites name')
+  lower_name = favorites_name.lower()  # (lowercase the searched name only once)
   page_num: int = 0
   while True:
     url: str = FAVORITES_URL(user_id, page_num)
     logging.info('Fetching favorites page: %s', url)
-    fav_html = FapHTMLRead(url)
+    fav_html = ListingHTMLRead(url)
     favorites_page: list[tuple[str, str]] = FIND_FOLDERS.findall(fav_html)
     if not favorites_page:
       raise Error(f'Could not find picture folder {favorites_name!r} for user {user_id}')
     for f_id, f_name in favorites_page:
-      i_f_id, f_name = int(f_id), html.unescape(f_name)
-      if f_name.lower() == favorites_name.lower():
+      i_f_id, f_name = int(f_id), UnescapeHTML(f_name)
+      if f_name.lower() == lower_name:
         # found it!
         CheckFolderIsForImages(user_id, i_f_id)  # raises Error if not valid
         return (i_f_id, f_name)
@@ -236,26 +257,27 @@ def GetFolderPics(
   img_list = [] if img_list_hint is None else img_list_hint
   seen_pages = seen_pages_hint
   img_set: set[int] = set(img_list)
+  pages = PageReader(lambda p: FOLDER_URL(user_id, folder_id, p))
   if seen_pages >= _PAGE_BACKTRACKING_THRESHOLD:
     logging.warning('Backtracking from last seen page (%d) to save time', seen_pages)
     page_num = seen_pages - 1  # remember the site numbers pages starting on zero
     while page_num >= 0:
-      new_ids = ExtractFavoriteIDs(page_num, user_id, folder_id)
-      if set(new_ids).intersection(img_set):
+      new_ids = _FavoriteIDs(pages.Read(page_num, read_ahead=1))  # usually stops at 1st page
+      if any(img_id in img_set for img_id in new_ids):
         # found last page that matters to backtracking (because it has images we've seen before)
         break
       page_num -= 1
-  # get the pages of links, until they end
+  # get the pages of links, until they end (pages are read ahead, concurrently)
   while True:
-    new_ids = ExtractFavoriteIDs(page_num, user_id, folder_id)
+    new_ids = _FavoriteIDs(pages.Read(page_num))
     if not new_ids:
       # we should be able to stop (break) here, but the Imagefap site has this horrible bug
       # where we might have empty pages in the middle of the album and then have images again,
       # and because of this we should try a few more pages just to make sure, even if most times
       # it will be a complete waste of our time...
-      new_ids = ExtractFavoriteIDs(page_num + 1, user_id, folder_id)  # extra safety page 1
+      new_ids = _FavoriteIDs(pages.Read(page_num + 1))  # extra safety page 1
       if not new_ids:
-        new_ids = ExtractFavoriteIDs(page_num + 2, user_id, folder_id)  # extra safety page 2
+        new_ids = _FavoriteIDs(pages.Read(page_num + 2))  # extra safety page 2
         if not new_ids:
           break  # after 2 extra safety pages, we hope we can now safely give up...
         page_num += 2  # we found something (2nd extra page), remember to increment page counter
@@ -269,8 +291,8 @@ def GetFolderPics(
     for img_id in new_ids:
       if img_id not in img_set:
         img_list.append(img_id)
+        img_set.add(img_id)  # keep the set in sync as we go: never rebuild it from img_list
         new_count += 1
-    img_set = set(img_list)
     page_num += 1
   # finished, return results
   return (img_list, page_num, new_count)
@@ -321,36 +343,84 @@ def DownloadFavorites(user_id: int, folder_id: int, output_path: str) -> None:
   skipped_count: int = 0
   img_ids, pages_count, _ = GetFolderPics(user_id, folder_id)
   logging.info('Got %d images in %d pages from album', len(img_ids), pages_count)
-  for img_id in img_ids:
+
+  def _Fetch(img_id: int) -> tuple[Optional[str], Optional[bytes], Optional[Error404]]:
+    # get image's (name, full resolution data or None if the file already exists, error or None)
     sanitized_image_name: Optional[str] = None
     try:
       # get image's full resolution URL + name
       url_path, sanitized_image_name, _ = ExtractFullImageURL(img_id)
-      image_path = os.path.join(output_path, sanitized_image_name)
       # check if we already have this image
-      if os.path.exists(image_path):
-        skipped_count += 1
-        logging.warning('Image %r already exists at destination: SKIP', image_path)
-        continue
-      # get the binary data so we can compute the SHA for this image
-      image_bytes, _ = GetBinary(url_path)
+      if os.path.exists(os.path.join(output_path, sanitized_image_name)):
+        return (sanitized_image_name, None, None)
+      # get the binary data
+      return (sanitized_image_name, GetBinary(url_path)[0], None)
     except Error404 as err:
       err.image_id = img_id
       err.image_name = sanitized_image_name
-      logging.error('Image failure: %s', err)
-      failed_count += 1
-      continue
-    # write image to the final disk destination
-    SaveNoClash(output_path, sanitized_image_name, image_bytes)
-    total_sz += len(image_bytes)
-    saved_count += 1
+      return (sanitized_image_name, None, err)
+
+  # the images are fetched concurrently, a window at a time (so that we never hold too many
+  # images in memory), but they are saved here in album order
+  window = _MAX_CONNECTIONS * 4
+  with concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_CONNECTIONS) as pool:
+    for start in range(0, len(img_ids), window):
+      for sanitized_image_name, image_bytes, err in pool.map(
+          _Fetch, img_ids[start:(start + window)]):
+        if err is not None:
+          logging.error('Image failure: %s', err)
+          failed_count += 1
+          continue
+        image_path = os.path.join(output_path, sanitized_image_name)  # type: ignore
+        if image_bytes is None or os.path.exists(image_path):  # (could be saved in this window)
+          skipped_count += 1
+          logging.warning('Image %r already exists at destination: SKIP', image_path)
+          continue
+        # write image to the final disk destination
+        SaveNoClash(output_path, sanitized_image_name, image_bytes)  # type: ignore
+        total_sz += len(image_bytes)
+        saved_count += 1
   # all images were downloaded, the end
   print(f'Saved {saved_count} images to disk ({base.HumanizedBytes(total_sz)}), '
         f'skipped {skipped_count} name collisions, and had {failed_count} image failures')
 
 
+def _Session() -> requests.Session:
+  """Get the shared HTTP session, creating it on first use (connections are kept alive)."""
+  global _SESSION  # pylint: disable=global-statement
+  with _SESSION_LOCK:
+    if _SESSION is None:
+      _SESSION = requests.Session()
+      adapter = requests.adapters.HTTPAdapter(
+          pool_connections=_MAX_CONNECTIONS, pool_maxsize=_MAX_CONNECTIONS)
+      _SESSION.mount('https://', adapter)
+      _SESSION.mount('http://', adapter)
+    return _SESSION
+
+
+def _WaitForPacing(min_wait: float, max_wait: float) -> None:
+  """Wait until a new request to the site may start, and book the next start a while after.
+
+  Time already spent since the previous request started (for example, waiting on a slow
+  response) counts towards the wait, so there is no dead time when requests are naturally spaced.
+
+  Args:
+    min_wait: The minimum wait between request starts, in seconds
+    max_wait: The maximum wait between request starts, in seconds
+  """
+  global _NEXT_REQUEST_TIME  # pylint: disable=global-statement
+  with _PACING_LOCK:
+    now = time.monotonic()
+    if _NEXT_REQUEST_TIME > now:
+      time.sleep(_NEXT_REQUEST_TIME - now)
+    _NEXT_REQUEST_TIME = max(now, _NEXT_REQUEST_TIME) + random.uniform(min_wait, max_wait)  # nosec
+
+
 def LimpingURLRead(url: str, min_wait: float = 1.0, max_wait: float = 2.0) -> bytes:
-  """Read URL, but wait a semi-random time to protect site from overload.
+  """Read URL, but pace requests a semi-random time apart to protect site from overload.
+
+  The pacing is shared across threads: concurrent callers will overlap their network time
+  but will still start their requests at most one per wait period.
 
   Args:
     url: The URL to get
@@ -369,34 +439,157 @@ def LimpingURLRead(url: str, min_wait: float = 1.0, max_wait: float = 2.0) -> by
     raise AttributeError('Invalid min/max wait times')
   n_retry: int = 0
   last_error: Optional[str] = None
+  last_status: Optional[int] = None
   while n_retry <= _MAX_RETRY:
-    # sleep to keep Imagefap happy
-    time.sleep(random.uniform(min_wait, max_wait))  # nosec
+    # wait (if needed) to keep Imagefap happy
+    _WaitForPacing(min_wait, max_wait)
     try:
       # get the URL
-      last_error = None
-      return urllib.request.urlopen(url, timeout=_URL_TIMEOUT).read()  # nosec
-    except (
-        urllib.error.URLError,
-        urllib.error.HTTPError,
-        urllib.error.ContentTooShortError,
-        http.client.HTTPException,  # this is the parent for all HTTP exceptions
-        socket.timeout) as err:
+      last_error, last_status = None, None
+      with _Session().get(url, timeout=_URL_TIMEOUT) as response:
+        last_status = response.status_code
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException as err:
       # these errors sometimes happen and can be a case for retry
       n_retry += 1
       last_error = str(err)
       logging.error('%r error for URL %r, RETRY # %d', last_error, url, n_retry)
   # only way to reach here is exceeding retries
-  if last_error is not None and 'http error 404' in last_error.lower():
+  if last_status == 404:
     raise Error404(url)
   raise Error(f'Max retries reached on URL {url!r}')
 
 
+def URLContentLength(url: str) -> tuple[int, Optional[int]]:
+  """Get HTTP status and Content-Length for `url`, without transferring the body (kept-alive).
+
+  Uses a HEAD request; only if the server does not allow HEAD or omits the Content-Length header
+  will this fall back to a streaming GET.
+
+  Args:
+    url: The URL to check
+
+  Returns:
+    (HTTP status code, Content-Length or None if the header is missing)
+
+  Raises:
+    requests.exceptions.RequestException: on network errors (there is no retry here)
+  """
+  session = _Session()
+  with session.head(url, allow_redirects=True, timeout=_URL_TIMEOUT) as response:
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None or response.status_code not in (200, 405):
+      return (response.status_code, None if content_length is None else int(content_length))
+  # stream the response so leaving the context stops the download after just the header fetch
+  # see: https://docs.python-requests.org/en/latest/user/advanced/#body-content-workflow
+  with session.get(url, stream=True, timeout=_URL_TIMEOUT) as response:
+    content_length = response.headers.get('Content-Length')
+    return (response.status_code, None if content_length is None else int(content_length))
+
+
 def FapHTMLRead(url: str) -> str:
   """Plain wrapper for LimpingURLRead(), but it decodes page content as UTF-8 before returning."""
   return LimpingURLRead(url).decode('utf-8', errors='ignore')  # (let Error404 bubble through...)
 
 
+def ListingHTMLRead(url: str) -> str:
+  """FapHTMLRead() for listing pages (favorites, albums), reusing a page read in the last minute.
+
+  The same listing page is often read a few times in a short while: for example, an album's 1st
+  page is read to get its name, then to check it is an images album, then to get its images.
+  """
+  now = time.time()
+  with _LISTING_CACHE_LOCK:
+    cached = _LISTING_CACHE.get(url)
+    if cached is not None and now - cached[0] < _LISTING_CACHE_TTL:
+      return cached[1]
+  page = FapHTMLRead(url)  # (let Error404 bubble through... errors are never cached)
+  with _LISTING_CACHE_LOCK:
+    for old_url in [u for u, (t, _) in _LISTING_CACHE.items() if now - t >= _LISTING_CACHE_TTL]:
+      del _LISTING_CACHE[old_url]  # expired: the cache only ever holds the last minute of reads
+    _LISTING_CACHE[url] = (now, page)
+  return page
+
+
+def FapHTMLReadMany(urls: list[str]) -> list[Union[str, Error]]:
+  """Concurrent ListingHTMLRead() for many URLs, sharing connections and the site pacing.
+
+  Args:
+    urls: The URLs to get
+
+  Returns:
+    list of decoded pages, in the same order as `urls`; a URL that fails will have the Error
+    (or Error404) in its position instead of a page
+  """
+
+  def _Read(url: str) -> Union[str, Error]:
+    try:
+      return ListingHTMLRead(url)
+    except Error as err:
+      return err
+
+  if len(urls) < 2:
+    return [_Read(url) for url in urls]
+  with concurrent.futures.ThreadPoolExecutor(max_workers=min(_MAX_CONNECTIONS, len(urls))) as pool:
+    return list(pool.map(_Read, urls))
+
+
+class PageReader:
+  """Read the numbered pages of a site listing (favorites, album), reading ahead concurrently.
+
+  Listings are read page after page until an empty page is found, and each page is a full round
+  trip to the site. So when a page is not yet known we fetch it together with the next pages
+  (with FapHTMLReadMany()) and keep them for the next reads. A page that failed only raises its
+  error if (and when) it is actually read.
+  """
+
+  def __init__(self, url_maker: Callable[[int], str], read_ahead: int = _PAGE_READ_AHEAD) -> None:
+    """Constructor.
+
+    Args:
+      url_maker: Function that gives the URL for a page number, like `lambda p: FAVORITES_URL(u, p)`
+      read_ahead: (default _PAGE_READ_AHEAD) Number of pages to fetch at once, including the one
+          that was asked for
+    """
+    self._url_maker = url_maker
+    self._read_ahead = max(1, read_ahead)
+    self._pages: dict[int, Union[str, Error]] = {}
+
+  def Read(self, page_num: int, read_ahead: Optional[int] = None) -> str:
+    """Get page `page_num` HTML, fetching it (and the next pages) if needed.
+
+    Args:
+      page_num: Page to get (starting on 0!)
+      read_ahead: (default None) If given, overrides the number of pages to fetch at once
+
+    Returns:
+      decoded page HTML
+
+    Raises:
+      Error: (or Error404) if the page could not be read
+    """
+    if page_num not in self._pages:
+      n_pages = self._read_ahead if read_ahead is None else max(1, read_ahead)
+      page_nums = [n for n in range(page_num, page_num + n_pages) if n not in self._pages]
+      urls = [self._url_maker(n) for n in page_nums]
+      for url in urls:
+        logging.info('Fetching favorites page: %s', url)
+      self._pages.update(zip(page_nums, FapHTMLReadMany(urls)))
+    page = self._pages[page_num]
+    if isinstance(page, Error):
+      raise page
+    return page
+
+
+def _IsImagesFolderHTML(folder_html: str) -> bool:
+  """Check a folder's 1st page HTML is for an *image* folder, not a *galleries* folder."""
+  # we only need to know if the markers exist, so search() (that stops on the first hit) is
+  # enough and the picture marker is only looked for if the galleries marker is absent
+  return not (_FIND_ONLY_IN_GALLERIES_FOLDER.search(folder_html) or
+              not _FIND_ONLY_IN_PICTURE_FOLDER.search(folder_html))
+
+
 def CheckFolderIsForImages(user_id: int, folder_id: int) -> None:
   """Check that a folder is an *image* folder, not a *galleries* folder.
 
@@ -409,13 +602,32 @@ def CheckFolderIsForImages(user_id: int, folder_id: int) -> None:
   """
   url: str = FOLDER_URL(user_id, folder_id, 0)  # use the folder's 1st page
   logging.debug('Fetching favorites to check *not* a galleries folder: %s', url)
-  folder_html = FapHTMLRead(url)
-  should_have: list[str] = _FIND_ONLY_IN_PICTURE_FOLDER.findall(folder_html)
-  should_not_have: list[str] = _FIND_ONLY_IN_GALLERIES_FOLDER.findall(folder_html)
-  if should_not_have or not should_have:
+  if not _IsImagesFolderHTML(ListingHTMLRead(url)):
     raise Error('This is not a valid images folder! Maybe it is a galleries folder?')
 
 
+def FilterImagesFolders(user_id: int, folder_ids: list[int]) -> set[int]:
+  """Check many folders concurrently and return the ones that are *image* folders.
+
+  Args:
+    user_id: User int ID
+    folder_ids: Folder int IDs to check
+
+  Returns:
+    set of the folder IDs that are image folders; folders that fail to load are considered
+    not to be image folders (same as CheckFolderIsForImages() raising for them)
+  """
+  urls: list[str] = [FOLDER_URL(user_id, f_id, 0) for f_id in folder_ids]  # folder's 1st page
+  logging.debug('Fetching %d favorites to check *not* galleries folders', len(urls))
+  images_folders: set[int] = set()
+  for folder_id, folder_html in zip(folder_ids, FapHTMLReadMany(urls)):
+    if isinstance(folder_html, Error):
+      logging.warning('Could not check folder %d/%d: %s', user_id, folder_id, folder_html)
+    elif _IsImagesFolderHTML(folder_html):
+      images_folders.add(folder_id)
+  return images_folders
+
+
 def GetDirectoryName(dir_path: str) -> str:
   """Get the directory name for a directory path."""
   dir_path = dir_path.strip()
@@ -424,9 +636,21 @@ def GetDirectoryName(dir_path: str) -> str:
   return dir_path.rsplit('/', maxsplit=1)[-1]  # cspell:disable-line
 
 
+@functools.lru_cache(maxsize=1 << 12)
+def UnescapeHTML(text: str) -> str:
+  """Cached html.unescape(): the same user/folder/image names come up over and over in crawls."""
+  return html.unescape(text)
+
+
+@functools.lru_cache(maxsize=1 << 12)
+def _SanitizeFileName(file_name: str) -> str:
+  """Cached (pure) part of NormalizeFileName()."""
+  return sanitize_filename.sanitize(UnescapeHTML(file_name.strip()).replace('/', '-'))
+
+
 def NormalizeFileName(file_name: str) -> str:
   """Normalize image file name."""
-  new_name: str = sanitize_filename.sanitize(html.unescape(file_name.strip()).replace('/', '-'))
+  new_name: str = _SanitizeFileName(file_name)
   if new_name != file_name:
     logging.warning('Filename sanitization necessary %r ==> %r', file_name, new_name)
   return new_name
@@ -454,7 +678,11 @@ def ExtractFavoriteIDs(page_num: int, user_id: int, folder_id: int) -> list[int]
   """
   url: str = FOLDER_URL(user_id, folder_id, page_num)
   logging.info('Fetching favorites page: %s', url)
-  fav_html = FapHTMLRead(url)
+  return _FavoriteIDs(ListingHTMLRead(url))
+
+
+def _FavoriteIDs(fav_html: str) -> list[int]:
+  """Get numerical IDs of all images in a picture folder page HTML (empty list on last page)."""
   images: list[str] = _FAVORITE_IMAGE.findall(fav_html)
   image_ids = [int(id) for id in images]
   logging.info('Got %d image IDs', len(image_ids))
@@ -481,22 +709,40 @@ def ExtractFullImageURL(img_id: int) -> tuple[str, str, str]:
   except Error404 as err:
     err.image_id = img_id
     raise
-  full_res_urls: list[str] = FULL_IMAGE(img_id).findall(img_html)
-  if not full_res_urls:
+  full_res_url = FULL_IMAGE(img_id).search(img_html)  # (we only ever need the 1st match)
+  if full_res_url is None:
     # invalid full resolution page
     invalid_page = Error404(url)
     invalid_page.image_id = img_id
     raise invalid_page
   # from the same source extract image file name
-  img_name: list[str] = _IMAGE_NAME.findall(img_html)
-  if not img_name:
+  img_name = _IMAGE_NAME.search(img_html)
+  if img_name is None:
     raise Error(f'No image name path in {url!r}')
   # sanitize image name, figure out the file name, sanitize extension
-  new_name = NormalizeFileName(img_name[0])
+  new_name = NormalizeFileName(img_name.group(1))
   main_name, extension = new_name.rsplit('.', 1) if '.' in new_name else (new_name, 'jpg')
   sanitized_extension = NormalizeExtension(extension)
   sanitized_image_name = f'{main_name}.{sanitized_extension}'
-  return (full_res_urls[0], sanitized_image_name, sanitized_extension)
+  return (full_res_url.group(1), sanitized_image_name, sanitized_extension)
+
+
+def FileSHA256(file_path: str) -> str:
+  """Compute SHA256 hexdigest of a file on disk, streaming it instead of reading it all to memory.
+
+  Args:
+    file_path: Path of file to hash
+
+  Returns:
+    sha256 hexdigest of the file contents
+  """
+  with open(file_path, 'rb') as file_obj:
+    if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+      return hashlib.file_digest(file_obj, 'sha256').hexdigest()
+    digest_obj = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(_HASH_CHUNK_SIZE), b''):
+      digest_obj.update(chunk)
+    return digest_obj.hexdigest()
 
 
 def SaveNoClash(dir_path: str, file_name: str, file_data: bytes) -> Optional[str]:
@@ -527,9 +773,8 @@ def SaveNoClash(dir_path: str, file_name: str, file_data: bytes) -> Optional[str
   if os.path.exists(file_path):
     # it exists... but is it the same, or a name clash?
     old_sha = hashlib.sha256(file_data).hexdigest()
-    with open(file_path, 'rb') as file_obj:
-      existing_sha = hashlib.sha256(file_obj.read()).hexdigest()
-    if old_sha == existing_sha:
+    # only hash the existing file if it has the same size: if not, it can't be the same
+    if os.path.getsize(file_path) == len(file_data) and FileSHA256(file_path) == old_sha:
       # it is exactly the same, so we can safely skip
       logging.info('Already exists: %s (SKIP)', file_path)
       return None
@@ -13,7 +13,7 @@ import os
 import os.path
 # import pdb
 import tempfile
-from typing import Union
+from typing import Optional, Union
 import unittest
 from unittest import mock
 
@@ -30,6 +30,10 @@ _TESTDATA_PATH = os.path.join(os.path.dirname(__file__), 'testdata/')
 class TestFapBase(unittest.TestCase):
   """Tests for fapbase.py."""
 
+  def setUp(self) -> None:
+    """Set up."""
+    fapbase._LISTING_CACHE.clear()  # pages read in one test must not be served in the next
+
   @mock.patch('fapfavorites.fapbase.base.INT_TIME')
   def test_Error404(self, mock_time: mock.MagicMock):
     """Test."""
@@ -43,51 +47,147 @@ class TestFapBase(unittest.TestCase):
     self.assertEqual(
         str(err), 'Error404(ID: 999, @2023/Feb/02-20:11:10-UTC, \'foo-name\', \'foo-url\')')
 
-  @mock.patch('fapfavorites.fapbase.urllib.request.urlopen')
+  @mock.patch('fapfavorites.fapbase._Session')
   @mock.patch('fapfavorites.fapbase.time.sleep')
-  def test_LimpingURLRead(self, unused_time: mock.MagicMock, mock_url: mock.MagicMock) -> None:
+  def test_LimpingURLRead(self, unused_time: mock.MagicMock, mock_session: mock.MagicMock) -> None:
     """Test."""
     # test args error
     with self.assertRaises(AttributeError):
       fapbase.LimpingURLRead('no.url', min_wait=1.0, max_wait=0.5)
     # test direct success
-
-    class _MockResponse1:
-
-      def read(self):
-        """Read."""
-        return b'foo.response'
-
-    mock_url.return_value = _MockResponse1()
+    mock_get = mock_session.return_value.get
+    mock_response = mock_get.return_value.__enter__.return_value
+    mock_response.status_code = 200
+    mock_response.content = b'foo.response'
     self.assertEqual(fapbase.LimpingURLRead('foo.url'), b'foo.response')
-    mock_url.assert_called_once_with('foo.url', timeout=fapbase._URL_TIMEOUT)
-    mock_url.reset_mock(side_effect=True)  # reset calls and side_effect
+    mock_get.assert_called_once_with('foo.url', timeout=fapbase._URL_TIMEOUT)
+    mock_get.reset_mock()  # reset calls
     # test exceptions and retry
-
-    class _MockResponse2:
-
-      def read(self):
-        """Read."""
-        raise fapbase.socket.timeout('timeout in page')
-
     fapbase._MAX_RETRY = 2
-    mock_url.return_value = _MockResponse2()
-    with self.assertRaises(fapbase.Error):
+    mock_response.raise_for_status.side_effect = fapbase.requests.exceptions.Timeout('timeout')
+    with self.assertRaisesRegex(fapbase.Error, r'Max retries'):
       fapbase.LimpingURLRead('bar.url')
     self.assertListEqual(
-        mock_url.call_args_list,
+        mock_get.call_args_list,
         [mock.call('bar.url', timeout=15.0),   # 1st try
          mock.call('bar.url', timeout=15.0),   # retry 1
          mock.call('bar.url', timeout=15.0)])  # retry 2
+    # test 404
+    mock_response.status_code = 404
+    mock_response.raise_for_status.side_effect = fapbase.requests.exceptions.HTTPError('404')
+    with self.assertRaises(fapbase.Error404):
+      fapbase.LimpingURLRead('baz.url')
+
+  @mock.patch('fapfavorites.fapbase.random.uniform')
+  @mock.patch('fapfavorites.fapbase.time.monotonic')
+  @mock.patch('fapfavorites.fapbase.time.sleep')
+  def test_WaitForPacing(
+      self, mock_sleep: mock.MagicMock, mock_time: mock.MagicMock,
+      mock_uniform: mock.MagicMock) -> None:
+    """Test."""
+    fapbase._NEXT_REQUEST_TIME = 0.0
+    mock_uniform.return_value = 1.5
+    mock_time.return_value = 100.0
+    fapbase._WaitForPacing(1.0, 2.0)  # first request: no wait
+    mock_sleep.assert_not_called()
+    self.assertEqual(fapbase._NEXT_REQUEST_TIME, 101.5)
+    mock_time.return_value = 101.0
+    fapbase._WaitForPacing(1.0, 2.0)  # too soon: wait for the rest of the period
+    mock_sleep.assert_called_once_with(0.5)
+    self.assertEqual(fapbase._NEXT_REQUEST_TIME, 103.0)
+    mock_sleep.reset_mock()
+    mock_time.return_value = 110.0
+    fapbase._WaitForPacing(1.0, 2.0)  # previous request was slow: no dead time
+    mock_sleep.assert_not_called()
+    self.assertEqual(fapbase._NEXT_REQUEST_TIME, 111.5)
+    mock_uniform.assert_called_with(1.0, 2.0)
+    fapbase._NEXT_REQUEST_TIME = 0.0
+
+  @mock.patch('fapfavorites.fapbase._Session')
+  def test_URLContentLength(self, mock_session: mock.MagicMock) -> None:
+    """Test."""
+    mock_head = mock_session.return_value.head
+    mock_head_response = mock_head.return_value.__enter__.return_value
+    mock_get = mock_session.return_value.get
+    mock_get_response = mock_get.return_value.__enter__.return_value
+    # HEAD is enough
+    mock_head_response.status_code = 200
+    mock_head_response.headers = {'Content-Length': '1234'}
+    self.assertTupleEqual(fapbase.URLContentLength('foo.url'), (200, 1234))
+    mock_head.assert_called_once_with('foo.url', allow_redirects=True, timeout=15.0)
+    mock_get.assert_not_called()
+    # HEAD errors are final
+    mock_head_response.status_code = 404
+    mock_head_response.headers = {}
+    self.assertTupleEqual(fapbase.URLContentLength('bar.url'), (404, None))
+    mock_get.assert_not_called()
+    # HEAD without Content-Length falls back to a streaming GET
+    mock_head_response.status_code = 200
+    mock_get_response.status_code = 200
+    mock_get_response.headers = {'Content-Length': '5678'}
+    self.assertTupleEqual(fapbase.URLContentLength('baz.url'), (200, 5678))
+    mock_get.assert_called_once_with('baz.url', stream=True, timeout=15.0)
+
+  @mock.patch('fapfavorites.fapbase.LimpingURLRead')
+  def test_FapHTMLReadMany(self, mock_read: mock.MagicMock) -> None:
+    """Test."""
+    not_found = fapbase.Error404('url-3')
+    mock_read.side_effect = lambda url: (
+        _RaiseError(not_found) if url == 'url-3' else url.replace('url', 'page').encode('utf-8'))
+    self.assertListEqual(fapbase.FapHTMLReadMany([]), [])
+    self.assertListEqual(fapbase.FapHTMLReadMany(['url-0']), ['page-0'])
+    urls = [f'url-{i}' for i in range(10)]
+    pages = fapbase.FapHTMLReadMany(urls)
+    self.assertIs(pages[3], not_found)
+    self.assertListEqual(pages[:3] + pages[4:], [f'page-{i}' for i in range(10) if i != 3])
+    self.assertEqual(mock_read.call_count, 10)  # 'url-0' was read recently, so it is re-used
+
+  @mock.patch('fapfavorites.fapbase.time.time')
+  @mock.patch('fapfavorites.fapbase.FapHTMLRead')
+  def test_ListingHTMLRead(self, mock_read: mock.MagicMock, mock_time: mock.MagicMock) -> None:
+    """Test."""
+    mock_read.side_effect = lambda url: _RaiseError(fapbase.Error404(url)) if url == 'bad' else url
+    mock_time.return_value = 1000.0
+    self.assertEqual(fapbase.ListingHTMLRead('url-1'), 'url-1')
+    self.assertEqual(fapbase.ListingHTMLRead('url-1'), 'url-1')  # re-used
+    with self.assertRaises(fapbase.Error404):
+      fapbase.ListingHTMLRead('bad')
+    with self.assertRaises(fapbase.Error404):
+      fapbase.ListingHTMLRead('bad')  # errors are never cached
+    mock_time.return_value = 1059.0
+    self.assertEqual(fapbase.ListingHTMLRead('url-2'), 'url-2')
+    self.assertEqual(fapbase.ListingHTMLRead('url-1'), 'url-1')  # still re-used
+    mock_time.return_value = 1061.0
+    self.assertEqual(fapbase.ListingHTMLRead('url-1'), 'url-1')  # expired: read again
+    self.assertListEqual(
+        mock_read.call_args_list,
+        [mock.call('url-1'), mock.call('bad'), mock.call('bad'), mock.call('url-2'),
+         mock.call('url-1')])
+    self.assertListEqual(sorted(fapbase._LISTING_CACHE), ['url-1', 'url-2'])
+
+  @mock.patch('fapfavorites.fapbase.FapHTMLReadMany')
+  def test_FilterImagesFolders(self, mock_read: mock.MagicMock) -> None:
+    """Test."""
+    mock_read.return_value = ['page-20', 'page-30', fapbase.Error404('url'), 'page-50']
+    fapbase._FIND_ONLY_IN_PICTURE_FOLDER = MockRegex(
+        {'page-20': ['true'], 'page-30': [], 'page-50': ['true']})
+    fapbase._FIND_ONLY_IN_GALLERIES_FOLDER = MockRegex(
+        {'page-20': [], 'page-30': ['true'], 'page-50': []})
+    self.assertSetEqual(fapbase.FilterImagesFolders(10, [20, 30, 40, 50]), {20, 50})
+    mock_read.assert_called_once_with(
+        ['https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=20',
+         'https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=30',
+         'https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=40',
+         'https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=50'])
+    fapbase._FIND_ONLY_IN_PICTURE_FOLDER = None    # set to None for safety
+    fapbase._FIND_ONLY_IN_GALLERIES_FOLDER = None  # set to None for safety
 
   @mock.patch('fapfavorites.fapbase.LimpingURLRead')
   def test_GetFolderPics(self, mock_read: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
-    mock_read.side_effect = [
-        b'page-7', b'page-6', b'page-5',  # backtrack
-        b'page-5', b'page-6', b'page-7', b'page-8', b'page-9', b'page-10', b'page-11',
-        b'page-12', b'page-13', b'page-14', b'page-15', b'page-16', b'page-17', b'page-18']
+    mock_read.side_effect = (  # pages are read concurrently, so answer by URL
+        lambda url: f'page-{url.split("page=")[1].split("&")[0]}'.encode('utf-8'))
     fapbase._FAVORITE_IMAGE = MockRegex({
         'page-5': ['102', '103', '104'],  # <- last known image (103) is here
         'page-6': ['105'],
@@ -103,31 +203,43 @@ class TestFapBase(unittest.TestCase):
         'page-16': [],                    # <- three empty pages means it should stop
         'page-17': [],
         'page-18': [],
+        'page-19': ['115'],               # <- read ahead, but never looked at
     })
     self.assertTupleEqual(
         fapbase.GetFolderPics(10, 20, img_list_hint=[100, 101, 102, 103], seen_pages_hint=8),
         ([100, 101, 102, 103, 104, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114], 16, 11))
+    # backtracking reads one page at a time, then pages are read ahead in batches; no page is
+    # read twice, even if the backtracking and the forward reads both use it
     self.assertListEqual(
-        mock_read.call_args_list,
+        mock_read.call_args_list[:3],
         [mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=7&folderid=20'),
          mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=6&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=5&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=5&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=6&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=7&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=8&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=9&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=10&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=11&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=12&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=13&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=14&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=15&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=16&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=17&folderid=20'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=18&folderid=20')])
+         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=5&folderid=20')])
+    self.assertCountEqual(
+        mock_read.call_args_list[3:],
+        [mock.call(f'https://www.imagefap.com/showfavorites.php?userid=10&page={p}&folderid=20')
+         for p in range(8, 20)])
     fapbase._FAVORITE_IMAGE = None  # set to None for safety
 
+  @mock.patch('fapfavorites.fapbase.FapHTMLRead')
+  def test_PageReader(self, mock_read: mock.MagicMock) -> None:
+    """Test."""
+    self.maxDiff = None
+    mock_read.side_effect = (
+        lambda url: _RaiseError(fapbase.Error('read failed')) if url == 'url-2' else f'html-{url}')
+    pages = fapbase.PageReader(lambda p: f'url-{p}', read_ahead=3)
+    self.assertEqual(pages.Read(0), 'html-url-0')
+    self.assertCountEqual(mock_read.call_args_list, [mock.call('url-0'), mock.call('url-1'),
+                                                     mock.call('url-2')])
+    self.assertEqual(pages.Read(1), 'html-url-1')  # already read ahead
+    with self.assertRaisesRegex(fapbase.Error, r'failed'):
+      pages.Read(2)  # error only shows when the page is actually read
+    self.assertEqual(mock_read.call_count, 3)
+    self.assertEqual(pages.Read(5, read_ahead=1), 'html-url-5')
+    self.assertEqual(pages.Read(4), 'html-url-4')  # page 5 is not fetched again
+    self.assertCountEqual(mock_read.call_args_list[3:], [mock.call('url-5'), mock.call('url-4'),
+                                                         mock.call('url-6')])
+
   @mock.patch('fapfavorites.fapbase.LimpingURLRead')
   def test_GetBinary(self, mock_read: mock.MagicMock) -> None:
     """Test."""
@@ -151,10 +263,12 @@ class TestFapBase(unittest.TestCase):
     """Test."""
     self.maxDiff = None
     folder_pics.return_value = ([100, 101, 102], 5, 3)
-    image_url.side_effect = [('url-100', 'f100.jpg', 'jpg'),  # <- this file will already exist
-                             ('url-101', 'f101.gif', 'gif'),
-                             ('url-102', 'f102.jpg', 'jpg')]  # <- this file's URL will 404
-    get_binary.side_effect = [(b'img-101', ''), fapbase.Error404('url-102')]
+    image_urls = {100: ('url-100', 'f100.jpg', 'jpg'),  # <- this file will already exist
+                  101: ('url-101', 'f101.gif', 'gif'),
+                  102: ('url-102', 'f102.jpg', 'jpg')}  # <- this file's URL will 404
+    image_url.side_effect = image_urls.get  # images are fetched concurrently: answer by ID/URL
+    get_binary.side_effect = lambda url: (
+        (b'img-101', '') if url == 'url-101' else _RaiseError(fapbase.Error404(url)))
     with self.assertRaisesRegex(fapbase.Error, r'Empty inputs'):
       fapbase.DownloadFavorites(10, 20, ' ')
     with tempfile.TemporaryDirectory() as db_path:
@@ -168,10 +282,10 @@ class TestFapBase(unittest.TestCase):
       with open(os.path.join(db_path, 'f101.gif'), 'rb') as file_obj:
         self.assertEqual(file_obj.read(), b'img-101')  # check 'f101.gif' content is as expected
     folder_pics.assert_called_once_with(10, 20)
-    self.assertListEqual(
+    self.assertCountEqual(
         image_url.call_args_list,
         [mock.call(100), mock.call(101), mock.call(102)])
-    self.assertListEqual(
+    self.assertCountEqual(
         get_binary.call_args_list,
         [mock.call('url-101'), mock.call('url-102')])
 
@@ -224,6 +338,12 @@ class TestFapBase(unittest.TestCase):
     self.assertEqual(fapbase.NormalizeFileName(' GIF '), 'gif')
     self.assertEqual(fapbase.NormalizeFileName(' JPEG '), 'jpg')
 
+  def test_UnescapeHTML(self) -> None:
+    """Test."""
+    self.assertEqual(fapbase.UnescapeHTML('foo &amp; bar'), 'foo & bar')
+    self.assertEqual(fapbase.UnescapeHTML('foo &amp; bar'), 'foo & bar')  # cached
+    self.assertEqual(fapbase.UnescapeHTML('plain'), 'plain')
+
   def test_NormalizeExtension(self) -> None:
     """Test."""
     self.assertEqual(fapbase.NormalizeExtension(' GIF '), 'gif')
@@ -234,10 +354,11 @@ class TestFapBase(unittest.TestCase):
     """Test."""
     self.maxDiff = None
     mock_read.side_effect = [b'page-10', b'page-11', b'page-12', fapbase.Error404('url-13')]
-    fapbase.FULL_IMAGE = MockRegex({'page-10': ['url-10'], 'page-11': [], 'page-12': ['url-12']})
+    fapbase.FULL_IMAGE = lambda unused_id: MockRegex(
+        {'page-10': ['url-10'], 'page-11': [], 'page-12': ['url-12']})
     fapbase._IMAGE_NAME = MockRegex({'page-10': [' crazy/name.JPEG '], 'page-12': []})
     self.assertTupleEqual(fapbase.ExtractFullImageURL(10), ('url-10', 'crazy-name.jpg', 'jpg'))
-    with self.assertRaisesRegex(fapbase.Error, r'No full resolution'):
+    with self.assertRaisesRegex(fapbase.Error404, r'Error404\(ID: 11'):  # no full-res URL
       fapbase.ExtractFullImageURL(11)
     with self.assertRaisesRegex(fapbase.Error, r'No image name'):
       fapbase.ExtractFullImageURL(12)
@@ -252,6 +373,28 @@ class TestFapBase(unittest.TestCase):
     fapbase.FULL_IMAGE = None  # set to None for safety
     fapbase._IMAGE_NAME = None  # set to None for safety
 
+  def test_SaveNoClash(self) -> None:
+    """Test."""
+    with tempfile.TemporaryDirectory() as dir_path:
+      self.assertEqual(fapbase.SaveNoClash(dir_path, 'foo.jpg', b'abc'), 'foo.jpg')
+      self.assertEqual(
+          fapbase.FileSHA256(os.path.join(dir_path, 'foo.jpg')),
+          'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad')
+      self.assertIsNone(fapbase.SaveNoClash(dir_path, 'foo.jpg', b'abc'))       # identical
+      self.assertEqual(fapbase.SaveNoClash(dir_path, 'foo.jpg', b'xyz'),        # same size
+                       '3608bca1e4-foo.jpg')
+      with mock.patch('fapfavorites.fapbase.FileSHA256', wraps=fapbase.FileSHA256) as file_sha:
+        self.assertEqual(fapbase.SaveNoClash(dir_path, 'foo.jpg', b'abcdef'),   # other size
+                         'bef57ec7f5-foo.jpg')
+        file_sha.assert_not_called()  # a file of another size is never read
+      self.assertCountEqual(
+          os.listdir(dir_path), ['foo.jpg', '3608bca1e4-foo.jpg', 'bef57ec7f5-foo.jpg'])
+
+
+def _RaiseError(err: Exception) -> bytes:
+  """Raise `err` (for use in lambdas)."""
+  raise err
+
 
 class MockRegex:
   """Mock regex for testing use only."""
@@ -264,6 +407,23 @@ class MockRegex:
     """Find all."""
     return self._return_values[query]
 
+  def search(self, query: str) -> Optional['MockMatch']:
+    """Search."""
+    values = self._return_values[query]
+    return MockMatch(values[0]) if values else None
+
+
+class MockMatch:
+  """Mock regex match for testing use only."""
+
+  def __init__(self, value: Union[str, tuple[str, ...]]):
+    """Init."""
+    self._value = value
+
+  def group(self, unused_index: int = 0) -> Union[str, tuple[str, ...]]:
+    """Group."""
+    return self._value
+
 
 SUITE = unittest.TestLoader().loadTestsFromTestCase(TestFapBase)
 
@@ -17,24 +17,27 @@
 """Imagefap.com database."""
 
 import base64
+import concurrent.futures
 import enum
 import getpass
 import hashlib
-import html
+import io
 import logging
 import math
+import mmap
+import operator
 import os
 import os.path
 # import pdb
+import pickle
 import random
-import shutil
-import statistics
-import tempfile
-from typing import Iterator, Optional, TypedDict
+import struct
+import sys
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional, TypedDict, Union
 
 from PIL import Image, ImageSequence
 import numpy as np
-import requests
 
 from baselib import base
 from fapfavorites import fapbase
@@ -47,12 +50,22 @@ __version__ = (2, 0)
 
 # useful globals
 DEFAULT_DB_DIRECTORY = '~/Downloads/imagefap/'
-_DEFAULT_DB_NAME = 'imagefap.database'
+_DEFAULT_DB_NAME = 'imagefap.database'  # DB manifest (or, in older DBs, the whole monolithic DB)
+_DB_SHARD_NAME = 'imagefap.%s.db'       # one file per main DB key, e.g. 'imagefap.users.db'
+_DB_BUFFERS_SUFFIX = '.buffers'          # shard's out-of-band pickle buffers (numpy arrays)
+_DB_BUFFERS_DIGEST_SIZE = 64             # blake2b digests (of pickle & buffers) in buffers header
 _DEFAULT_BLOB_DIR_NAME = 'blobs/'
 DEFAULT_THUMBS_DIR_NAME = 'thumbs/'
 _DEFAULT_TAG_EXPORT_DIR_NAME = 'tag_export/'
 _THUMBNAIL_MAX_DIMENSION = 280
+_THUMBNAIL_REDUCING_GAP = 2.0  # same default Image.thumbnail() uses for its resampling
+_MAX_SHARD_WRITERS = 4         # max shard files written (encrypted & synced) concurrently on save
+_MAX_IMAGE_FETCHERS = 4        # max new images fetched concurrently while others are processed
+_IMAGE_FETCH_AHEAD = 8         # max new images fetched ahead of processing (held in memory)
+_MAX_AUDIT_WORKERS = 4         # max image locations checked concurrently by the audit
+_AUDIT_CHECK_AHEAD = 8         # max images with location checks running ahead of the audit
 CHECKPOINT_LENGTH = 10         # int number of downloads between database checkpoints
+CHECKPOINT_MIN_INTERVAL = 30.0  # min seconds between download checkpoints (Save() is O(database))
 AUDIT_CHECKPOINT_LENGTH = 100  # int number of audits between database checkpoints
 FAVORITES_MIN_DOWNLOAD_WAIT = 3 * (60 * 60 * 24)  # 3 days (in seconds)
 AUDIT_MIN_DOWNLOAD_WAIT = 10 * (60 * 60 * 24)     # 10 days (in seconds)
@@ -134,6 +147,30 @@ _BlobType = dict[str, _BlobObjType]
 _ImagesIdIndexType = dict[int, str]
 _DB_MAIN_KEYS = {'configs', 'users', 'favorites', 'tags', 'blobs', 'image_ids_index',
                  'duplicates_registry', 'duplicates_key_index'}
+_BLOB_FIELDS: tuple[str, ...] = tuple(_BlobObjType.__annotations__.keys())  # codec field order
+_BLOB_HEX_FIELDS = frozenset(('percept', 'average', 'diff', 'wavelet'))  # stored as bytes on disk
+_BLOBS_CODEC_TAG = 'blobs-tuples-v1'
+_BLOBS_SHARDS = 64  # blobs are split in this many shards (by SHA prefix): saves write only a few
+
+
+class BlobColumnsType(TypedDict):
+  """Columnar snapshot of the blobs' numeric fields, for fast aggregations (`BlobColumns()`)."""
+
+  rows: dict[str, int]  # {sha: row in all the column arrays below}
+  sz: np.ndarray        # np.int64
+  sz_thumb: np.ndarray  # np.int64
+  width: np.ndarray     # np.int64
+  height: np.ndarray    # np.int64
+  date: np.ndarray      # np.int64
+  animated: np.ndarray  # bool
+  gone: np.ndarray      # bool
+  n_loc: np.ndarray     # np.int64, number of locations ('loc') of the blob
+
+
+class _ManifestType(TypedDict):
+  """Database manifest type: what is saved in the main DB file."""
+
+  shards: dict[str, str]  # {main DB key: hex blake2b digest of the clear-text shard pickle}
 
 
 class _DatabaseType(TypedDict):
@@ -183,7 +220,13 @@ class FapDatabase:
     self._blobs_dir = os.path.join(self._db_dir, _DEFAULT_BLOB_DIR_NAME)     # where to put blobs
     self._thumbs_dir = os.path.join(self._db_dir, DEFAULT_THUMBS_DIR_NAME)   # thumbnails dir
     self._key: Optional[bytes] = None  # Fernet crypto key in use; None = crypto not in use
+    self._shard_digests: dict[str, str] = {}  # digests of shards on disk, to skip clean shards
+    self._save_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None  # see Save(wait=False)
+    self._pending_save: Optional[concurrent.futures.Future] = None  # the background Save() writes
+    self._tag_index: Optional[dict[int, tuple[int, TagObjType]]] = None  # see _TagIndex()
+    self._tag_index_root: Optional[_TagType] = None  # the self.tags object _tag_index was built on
     self._sha_encoder: Optional[base.BlockEncoder256] = None  # encoder for SHA256 digests
+    self._file_sizes: Optional[dict[str, int]] = None  # file sizes snapshot, see _ScanFileSizes()
     self._db: _DatabaseType = {  # creates empty DB
         'configs': {
             'duplicates_sensitivity_regular': duplicates.METHOD_SENSITIVITY_DEFAULTS.copy(),
@@ -278,6 +321,10 @@ class FapDatabase:
   def Load(self) -> bool:
     """Load DB from file. If no DB file does not do anything.
 
+    The main DB file is a small manifest listing the shards (one file per main DB key, see
+    _DB_SHARD_NAME) and their digests. An older monolithic DB file is also accepted, and will
+    be migrated to shards on the next Save().
+
     Returns:
       True if a file was found and loaded, False if not
 
@@ -290,8 +337,7 @@ class FapDatabase:
         # we turned compression off: it was responsible for ~95% of save time
         try:
           # try to load the DB with what we have first, no user intervention
-          self._db: _DatabaseType = base.BinDeSerialize(
-              file_path=self._db_path, compress=False, key=self._key)
+          loaded_obj = base.BinDeSerialize(file_path=self._db_path, compress=False, key=self._key)
         except base.pickle.UnpicklingError:
           # could not load it: if we don't have a key, we might ask for one
           if self._key is not None:
@@ -301,7 +347,7 @@ class FapDatabase:
             self._key = base.DeriveKeyFromStaticPassword(
                 getpass.getpass(prompt=(f'{base.TERM_WARNING}{base.TERM_BOLD}{base.TERM_UNDERLINE}'
                                         f'Database Password:{base.TERM_END} ')))
-            self._db: _DatabaseType = base.BinDeSerialize(
+            loaded_obj = base.BinDeSerialize(
                 file_path=self._db_path, compress=False, key=self._key)
           except base.bin_fernet.InvalidToken as err:
             raise Error('Invalid password given!') from err
@@ -313,6 +359,13 @@ class FapDatabase:
           # not reflected in os.environ, except for changes made by modifying os.environ directly."
           os.environ['IMAGEFAP_FAVORITES_DB_KEY'] = self._key.decode('utf-8')
           self._sha_encoder = base.BlockEncoder256(base64.urlsafe_b64decode(self._key))
+        if 'shards' in loaded_obj:
+          self._db: _DatabaseType = self._LoadShards(loaded_obj)
+        else:
+          # old monolithic DB: all shards are "dirty" so next save will migrate to shards
+          logging.warning('Loaded a monolithic DB: it will be split into shards on next save')
+          self._db: _DatabaseType = loaded_obj
+          self._shard_digests = {}
         # just a quick dirty check that we got what we expected
         if any(k not in self._db for k in _DB_MAIN_KEYS):
           raise Error('Loaded DB is invalid!')
@@ -344,16 +397,210 @@ class FapDatabase:
       logging.warning('Database will be created with a password')
     return False
 
-  def Save(self) -> None:
-    """Save DB to file."""
+  def _ShardPath(self, db_key: str) -> str:
+    """Path for the shard file of a main DB key."""
+    return os.path.join(self._db_dir, _DB_SHARD_NAME % db_key)
+
+  def _ReadShardFile(self, file_path: str) -> bytes:
+    """Read (and decrypt, if needed) a shard file."""
+    with open(file_path, 'rb') as file_obj:
+      raw_data = file_obj.read()
+    return raw_data if self._key is None else base.Decrypt(raw_data, self._key)
+
+  def _MapShardFile(self, file_path: str) -> Union[bytes, mmap.mmap]:
+    """Memory-map a (vanilla) shard file read-only, or read & decrypt it if DB is encrypted.
+
+    Arrays loaded out-of-band from the mapped file are zero-copy views of the file pages, so the
+    OS only keeps them in memory while they are being used (and they are not duplicated in the
+    process heap), which matters for the big 'cnn' embeddings that most commands never touch.
+    """
+    if self._key is not None or not os.path.getsize(file_path):
+      return self._ReadShardFile(file_path)
+    with open(file_path, 'rb') as file_obj:
+      return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)  # stays valid after close
+
+  def _WriteShardFile(self, file_path: str, bin_chunks: list) -> None:
+    """Atomically write (and encrypt, if needed) a shard file from a list of bytes-like chunks."""
+    if self._key is None:
+      _AtomicWrite(file_path, *bin_chunks)
+    else:
+      _AtomicWrite(file_path, base.Encrypt(b''.join(bin_chunks), self._key))
+
+  def _WriteShardFiles(self, shard_files: list[tuple[str, list]]) -> None:
+    """Write (and encrypt, if needed) many shard files concurrently, returning when all are done.
+
+    Each file is synced to disk before being moved into place (see _AtomicWrite()), so writing
+    them in parallel overlaps the encryption and the disk syncs of the different shards.
+
+    Args:
+      shard_files: list of (file_path, list of bytes-like chunks) to write
+    """
+    if len(shard_files) < 2:
+      for file_path, bin_chunks in shard_files:
+        self._WriteShardFile(file_path, bin_chunks)
+      return
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(_MAX_SHARD_WRITERS, len(shard_files))) as pool:
+      for future in [pool.submit(self._WriteShardFile, file_path, bin_chunks)
+                     for file_path, bin_chunks in shard_files]:
+        future.result()  # re-raises any error from the writes
+
+  def _LoadShards(self, manifest: _ManifestType) -> _DatabaseType:
+    """Load all DB shards listed in the manifest, remembering their digests.
+
+    Args:
+      manifest: The loaded manifest object
+
+    Returns:
+      loaded database object
+
+    Raises:
+      Error: if a shard is missing, or does not match its buffers file
+    """
+    db: dict = {'blobs': {}}  # (the blobs come split in many shards, see _ShardObjects())
+    self._shard_digests = {}
+    for db_key, manifest_digest in sorted(manifest['shards'].items()):
+      shard_path = self._ShardPath(db_key)
+      if not os.path.exists(shard_path):
+        raise Error(f'DB shard {shard_path!r} not found')
+      pickle_data = self._ReadShardFile(shard_path)
+      buffers_data = (self._MapShardFile(shard_path + _DB_BUFFERS_SUFFIX)
+                      if os.path.exists(shard_path + _DB_BUFFERS_SUFFIX) else b'')
+      digest_obj = hashlib.blake2b(pickle_data)
+      digest_obj.update(_BuffersHeader(buffers_data))  # (has the buffers digest: not read here)
+      digest = digest_obj.hexdigest()
+      if digest != manifest_digest:
+        # a save was interrupted after writing this shard but before the manifest: the shard is
+        # newer than the manifest; we keep it but the DB might need an integrity check (its
+        # buffers are only used if they were saved with it: see _LoadShard())
+        logging.error('DB shard %r does not match manifest: run the integrity checks', db_key)
+      if db_key.startswith('blobs.'):
+        db['blobs'].update(_DecodeBlobs(_LoadShard(pickle_data, buffers_data)))
+      else:
+        db[db_key] = _LoadShard(pickle_data, buffers_data)
+      self._shard_digests[db_key] = digest
+    # each shard un-pickles its own copy of every SHA string: make the image index point to the
+    # same string objects as the blobs keys, so only one copy of each SHA is kept in memory
+    shas: dict[str, str] = {sha: sha for sha in db['blobs']}
+    index: dict[int, str] = db.get('image_ids_index', {})
+    for img_id, sha in index.items():
+      index[img_id] = shas.get(sha, sha)
+    return db  # type: ignore
+
+  def Save(self, wait: bool = True) -> None:
+    """Save DB to files: only the shards that changed are written, then the manifest.
+
+    The DB is always serialized (pickled) before this method returns, so later changes to it do
+    not affect what is saved. A previous background save is always waited for (and its errors
+    re-raised) before starting a new one.
+
+    Args:
+      wait: (default True) If False, the writing of the files (encryption, disk syncs) is left
+          to a background thread and this method returns right away; good for checkpoints,
+          as long as the caller finishes with _StopSaves(); a failed background write leaves
+          its shards as changed, so the next Save() writes them again
+    """
     # TODO: mutex save (crypto/corruption)
-    with base.Timer() as tm_save:
+    self._WaitForSave()
+    with base.Timer() as tm_dump:
       # we turned compression off: it was responsible for ~95% of save time
-      base.BinSerialize(self._db, file_path=self._db_path, compress=False, key=self._key)
-    logging.info(
-        'Saved %s DB to %r (%s)',
-        'a VANILLA (unencrypted)' if self._key is None else 'an ENCRYPTED',
-        self._db_path, tm_save.readable)
+      changed_count: int = 0
+      shard_files: list[tuple[str, list]] = []
+      stale_buffers: list[str] = []  # buffers files of shards that have no buffers anymore
+      new_digests: dict[str, str] = self._shard_digests.copy()  # only kept if the writes work
+      shard_objs = self._ShardObjects()
+      for db_key, shard_obj in shard_objs.items():
+        pickle_data, buffer_chunks = _DumpShard(shard_obj)
+        digest_obj = hashlib.blake2b(pickle_data)
+        if buffer_chunks:
+          digest_obj.update(buffer_chunks[0])  # the header, with the digest of all the buffers
+        digest = digest_obj.hexdigest()
+        if self._shard_digests.get(db_key, None) == digest:
+          continue  # shard on disk is already up to date
+        shard_path = self._ShardPath(db_key)
+        if buffer_chunks:
+          shard_files.append((shard_path + _DB_BUFFERS_SUFFIX, buffer_chunks))
+        else:
+          stale_buffers.append(shard_path + _DB_BUFFERS_SUFFIX)
+        shard_files.append((shard_path, [pickle_data]))
+        new_digests[db_key] = digest
+        changed_count += 1
+      # the manifest is written last, and only if something changed (or it does not exist)
+      manifest: Optional[_ManifestType] = (
+          {'shards': new_digests.copy()}
+          if changed_count or not os.path.exists(self._db_path) else None)
+
+    def _Write() -> None:
+      with base.Timer() as tm_write:
+        self._WriteShardFiles(shard_files)
+        # the manifest is the way into all the shards, so it is synced to disk like them
+        # (see _AtomicWrite())
+        if manifest is not None:
+          self._WriteShardFile(
+              self._db_path, [pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)])
+          _SyncDirectory(self._db_dir)  # makes the renames themselves durable
+        # stale buffers only go after the manifest: until then the old shards might be in use
+        for buffers_path in stale_buffers:
+          if os.path.exists(buffers_path):
+            os.remove(buffers_path)
+      # only now are the shards really on disk: if any write failed, the next Save() redoes them
+      self._shard_digests = new_digests
+      logging.info(
+          'Saved %s DB to %r (%d of %d shards changed) (%s + %s)',
+          'a VANILLA (unencrypted)' if self._key is None else 'an ENCRYPTED',
+          self._db_path, changed_count, len(shard_objs), tm_dump.readable, tm_write.readable)
+
+    if wait:
+      _Write()
+      return
+    if self._save_pool is None:
+      self._save_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    self._pending_save = self._save_pool.submit(_Write)
+
+  def _ShardObjects(self) -> dict[str, Any]:
+    """The objects to save, by shard key: one per main DB key, but blobs split by SHA prefix.
+
+    The blobs are by far the biggest part of the DB, and checkpoints usually change only a few
+    of them, so splitting them means only a few (small) blobs shards are written on each save.
+    """
+    shard_objs: dict[str, Any] = {
+        db_key: db_obj for db_key, db_obj in sorted(self._db.items(), key=operator.itemgetter(0))
+        if db_key in _DB_MAIN_KEYS and db_key != 'blobs'}
+    blobs_shards: list[_BlobType] = [{} for _ in range(_BLOBS_SHARDS)]
+    for sha, blob in self.blobs.items():
+      blobs_shards[_BlobsShard(sha)][sha] = blob
+    for n_shard, blobs in enumerate(blobs_shards):
+      shard_objs[f'blobs.{n_shard:02x}'] = _EncodeBlobs(blobs)
+    return shard_objs
+
+  def _WaitForSave(self) -> None:
+    """Wait for the background Save(wait=False) writes, if any, re-raising their errors."""
+    if self._pending_save is not None:
+      pending_save, self._pending_save = self._pending_save, None
+      pending_save.result()
+
+  def _StopSaves(self) -> None:
+    """Wait for the background Save(wait=False) writes (re-raising their errors), stop the thread.
+
+    Call this (in a `finally`) at the end of any method that checkpoints with Save(wait=False),
+    so the thread is not left behind and no background error goes unseen, even on exceptions.
+    """
+    try:
+      self._WaitForSave()
+    finally:
+      if self._save_pool is not None:
+        self._save_pool.shutdown(wait=True)
+        self._save_pool = None
+
+  @property
+  def _db_size(self) -> int:
+    """Size of all the DB files on disk (manifest + known shards + their buffers)."""
+    db_size = os.path.getsize(self._db_path)
+    for db_key in self._shard_digests:
+      db_size += os.path.getsize(self._ShardPath(db_key))
+      if os.path.exists(self._ShardPath(db_key) + _DB_BUFFERS_SUFFIX):
+        db_size += os.path.getsize(self._ShardPath(db_key) + _DB_BUFFERS_SUFFIX)
+    return db_size
 
   def UserStr(self, user_id: int) -> str:
     """Produce standard user representation, like 'UserName (id)'."""
@@ -380,7 +627,7 @@ class FapDatabase:
 
   def LocationsStr(self, location: _LocationType) -> str:
     """Produce standard locations repr, like 'loc1 + loc2 + ...' where each one is a LocationStr."""
-    return ' + '.join(self.LocationStr(loc_k, location[loc_k]) for loc_k in sorted(location.keys()))
+    return ' + '.join(self.LocationStr(loc_k, loc_v) for loc_k, loc_v in sorted(location.items()))
 
   def TagStr(self, tag_id: int, add_id: bool = True) -> str:
     """Produce standard tag representation, like 'TagName (id)'."""
@@ -392,6 +639,26 @@ class FapDatabase:
     name = '/'.join(n for _, n, _ in self.GetTag(tag_id))
     return f'{name} ({tag_id})' if add_id else name
 
+  def TagLineageStrs(self, add_id: bool = True) -> dict[int, str]:
+    """TagLineageStr() for all tags at once, in one single walk of the tags tree.
+
+    Use this (once) instead of calling TagLineageStr() for every tag of every image.
+
+    Args:
+      add_id: (default True) If true will add ' (id)' to the end, like TagLineageStr()
+
+    Returns:
+      {tag_id: 'grand_name/parent_name/tag_name (id)'}
+    """
+    lineages: dict[int, str] = {}
+    names: list[str] = []  # the names from the root down to the current tag
+    for tag_id, tag_name, depth, _ in self.TagsWalk():
+      del names[depth:]
+      names.append(tag_name)
+      name = '/'.join(names)
+      lineages.setdefault(tag_id, f'{name} ({tag_id})' if add_id else name)
+    return lineages
+
   def SortedUserAlbums(self, user_id: int, filter_keys: Optional[set] = None):
     """Get sorted albums for a user.
 
@@ -455,13 +722,41 @@ class FapDatabase:
     except KeyError as err:
       raise Error(f'Thumbnail {sha!r} not found') from err
 
+  def _ScanFileSizes(self) -> dict[str, int]:
+    """Get the sizes of all files in blobs/ and thumbs/, by full path, in one pass over each dir.
+
+    While the snapshot is in self._file_sizes, HasBlob() & co. answer from it instead of doing
+    a stat() per call, so only set it during read-only scans over all the blobs.
+    """
+    file_sizes: dict[str, int] = {}
+    for dir_path in (self._blobs_dir, self._thumbs_dir):
+      if not os.path.isdir(dir_path):
+        continue
+      with os.scandir(dir_path) as dir_entries:
+        for entry in dir_entries:
+          if entry.is_file():
+            file_sizes[entry.path] = entry.stat().st_size
+    return file_sizes
+
+  def _FileExists(self, file_path: str) -> bool:
+    """Check if `file_path` exists (looks in self._file_sizes snapshot, if there is one)."""
+    if self._file_sizes is not None:
+      return file_path in self._file_sizes
+    return os.path.exists(file_path)
+
+  def _FileSize(self, file_path: str) -> int:
+    """Get `file_path` size (looks in self._file_sizes snapshot, if there is one)."""
+    if self._file_sizes is not None and file_path in self._file_sizes:
+      return self._file_sizes[file_path]
+    return os.path.getsize(file_path)
+
   def HasBlob(self, sha: str) -> bool:
     """Check if blob `sha` is available in blobs/ directory."""
-    return os.path.exists(self._BlobPath(sha))
+    return self._FileExists(self._BlobPath(sha))
 
   def HasThumbnail(self, sha: str) -> bool:
     """Check if thumbnail `sha` is available in thumbs/ directory."""
-    return os.path.exists(self._ThumbnailPath(sha))
+    return self._FileExists(self._ThumbnailPath(sha))
 
   def GetBlob(self, sha: str) -> bytes:
     """Get the blob binary data for `sha` entry (decrypts it if needed)."""
@@ -475,6 +770,24 @@ class FapDatabase:
       raw_data = file_obj.read()
     return raw_data if self._key is None else base.Decrypt(raw_data, self._key)
 
+  def GetBlobSize(self, sha: str) -> int:
+    """Get the (decrypted) blob size for `sha` entry, without reading the file if not encrypted."""
+    if self._key is None:
+      return self._FileSize(self._BlobPath(sha))
+    return len(self.GetBlob(sha))  # encrypted: must decrypt to know (& verify)
+
+  def GetThumbnailSize(self, sha: str) -> int:
+    """Get the (decrypted) thumbnail size for `sha` entry, without reading it if not encrypted."""
+    if self._key is None:
+      return self._FileSize(self._ThumbnailPath(sha))
+    return len(self.GetThumbnail(sha))  # encrypted: must decrypt to know (& verify)
+
+  def VerifyBlob(self, sha: str) -> bool:
+    """Check that the blob data for `sha` entry really hashes to `sha` (decrypts it if needed)."""
+    if self._key is not None:
+      return hashlib.sha256(self.GetBlob(sha)).hexdigest() == sha
+    return fapbase.FileSHA256(self._BlobPath(sha)) == sha  # not encrypted: hash w/o reading all
+
   def _SHAFromFileName(self, file_name: str) -> str:
     """Get database blob/thumb hash (SHA-256) from file name on disk.
 
@@ -495,8 +808,26 @@ class FapDatabase:
     except ValueError as err:
       raise Error('Unexpected or invalid blob/thumb file name {file_name!r}') from err
 
-  def GetTag(self, tag_id: int) -> list[tuple[int, str, TagObjType]]:  # noqa: C901
-    """Search recursively for specific tag object, returning parents too, if any.
+  def _TagIndex(self) -> dict[int, tuple[int, TagObjType]]:
+    """Flat tag index, built lazily: {tag_id: (parent_tag_id, tag_obj)}; parent is 0 for root.
+
+    The index is only a hint: tags can be changed directly in self.tags, so users of the index
+    must check entries against the actual tags structure (see GetTag()).
+    """
+    if self._tag_index is None or self._tag_index_root is not self.tags:
+      tag_index: dict[int, tuple[int, TagObjType]] = {}
+      pending: list[tuple[int, _TagType]] = [(0, self.tags)]
+      while pending:
+        parent_id, tags_obj = pending.pop()
+        for tag_id, tag_obj in tags_obj.items():
+          tag_index.setdefault(tag_id, (parent_id, tag_obj))
+          if tag_obj.get('tags', {}):
+            pending.append((tag_id, tag_obj['tags']))  # type: ignore
+      self._tag_index, self._tag_index_root = tag_index, self.tags
+    return self._tag_index
+
+  def GetTag(self, tag_id: int) -> list[tuple[int, str, TagObjType]]:
+    """Search for specific tag object, returning parents too, if any.
 
     Args:
       tag_id: The wanted tag ID
@@ -510,51 +841,60 @@ class FapDatabase:
     """
     if not tag_id:
       raise Error('tag_id cannot be empty')
-    hierarchy: list[tuple[int, str, TagObjType]] = []
-
-    def _GetRecursive(obj: _TagType) -> bool:
-      if tag_id in obj:
-        try:
-          hierarchy.append((tag_id, obj[tag_id]['name'], obj[tag_id]))  # found!
-        except KeyError as err:
-          raise Error(f'Found tag {tag_id} is empty (has no \'name\')!') from err
-        return True
-      for i, inner_obj in obj.items():
-        if inner_obj.get('tags', {}):
-          if _GetRecursive(inner_obj['tags']):  # type: ignore
-            try:
-              hierarchy.append((i, inner_obj['name'], inner_obj))  # parent to a found tag
-            except KeyError as err:
-              raise Error(f'Parent tag {i} (of {tag_id}) is empty (has no \'name\')!') from err
-            return True
-      return False
-
-    if not _GetRecursive(self.tags):
+    for retry in (False, True):
+      if retry:
+        self._tag_index = None  # index did not check out (tags changed directly?): rebuild
+      tag_index = self._TagIndex()
+      lineage: list[tuple[int, TagObjType]] = []  # starts with the tag and goes up to the root
+      current_id = tag_id
+      while current_id and current_id in tag_index:
+        parent_id, obj = tag_index[current_id]
+        parent_tags: dict = (
+            self.tags if not parent_id else
+            tag_index[parent_id][1].get('tags', {}) if parent_id in tag_index else {})
+        if parent_tags.get(current_id, None) is not obj:
+          break  # stale index entry
+        lineage.append((current_id, obj))
+        current_id = parent_id
+      if not current_id:
+        break  # we got all the way to the root
+    else:
       raise Error(f'Tag ID {tag_id} was not found')
-    hierarchy.reverse()
-    return hierarchy
+    for i, obj in lineage:  # check the tag itself first, then its parents
+      if 'name' not in obj:
+        if i == tag_id:
+          raise Error(f'Found tag {tag_id} is empty (has no \'name\')!')
+        raise Error(f'Parent tag {i} (of {tag_id}) is empty (has no \'name\')!')
+    return [(i, obj['name'], obj) for i, obj in reversed(lineage)]
 
   def TagsWalk(
       self, start_tag: Optional[_TagType] = None, depth: int = 0) -> Iterator[
           tuple[int, str, int, _TagType]]:
-    """Walk all tags recursively, depth first.
+    """Walk all tags, depth first (iteratively, with an explicit stack of levels).
 
     Args:
       start_tag: (Default None) The tag to start at; None means start at root
-      depth: (Default 0) DO NOT USE - Internal depth count
+      depth: (Default 0) The depth to report for the `start_tag` level
 
     Yields:
       (tag_id, tag_name, depth, sub_tags)
     """
-    if start_tag is None:
-      start_tag = self.tags
-    for tag_name, tag_id, tag_tags in sorted(
-        (t['name'], k, t['tags']) for k, t in start_tag.items()):  # will sort by name in this level
-      yield (tag_id, tag_name, depth, tag_tags)  # type: ignore
-      if start_tag[tag_id]['tags']:
-        for obj in self.TagsWalk(
-            start_tag=start_tag[tag_id]['tags'], depth=depth + 1):  # type: ignore
-          yield obj
+
+    def _SortedLevel(tags_obj: _TagType) -> Iterator[tuple[str, int, _TagType]]:
+      return iter(sorted(  # will sort by name in this level
+          (t['name'], k, t['tags']) for k, t in tags_obj.items()))  # type: ignore
+
+    levels: list[Iterator[tuple[str, int, _TagType]]] = [
+        _SortedLevel(self.tags if start_tag is None else start_tag)]
+    while levels:
+      next_tag = next(levels[-1], None)
+      if next_tag is None:
+        levels.pop()  # this level is done
+        continue
+      tag_name, tag_id, tag_tags = next_tag
+      yield (tag_id, tag_name, depth + len(levels) - 1, tag_tags)
+      if tag_tags:
+        levels.append(_SortedLevel(tag_tags))
 
   def _TagNameOKOrDie(self, new_tag_name: str) -> None:
     """Check tag name is OK: does not clash and has no invalid chars. If not will raise exception.
@@ -569,8 +909,9 @@ class FapDatabase:
     if '/' in new_tag_name or '\\' in new_tag_name:
       raise Error(f'Don\'t use "/" or "\\" in tag name (tried to use {new_tag_name!r} as tag name)')
     # check if name does not clash with any already existing tag
+    lower_name = new_tag_name.lower()  # (lowercase the proposed name only once)
     for tid, name, _, _ in self.TagsWalk():
-      if new_tag_name.lower() == name.lower():
+      if name.lower() == lower_name:
         raise Error(
             f'Proposed tag name {new_tag_name!r} clashes with existing tag {self.TagStr(tid)}')
 
@@ -590,13 +931,13 @@ class FapDatabase:
     # check tag name and find the parent
     self._TagNameOKOrDie(new_tag_name)
     parent_obj = self.GetTag(parent_id)[-1][-1]['tags'] if parent_id else self.tags
-    # tag name is OK: find a free ID by incrementing until we hit one (inefficient but will do...)
-    all_tag_ids = {tid for tid, _, _, _ in self.TagsWalk()}
-    current_id = 1
-    while current_id in all_tag_ids:
-      current_id += 1
+    # tag name is OK: find the lowest free ID (rebuild index first, so we know all IDs for sure)
+    self._tag_index = None
+    all_tag_ids = self._TagIndex().keys()
+    current_id = min(set(range(1, len(all_tag_ids) + 2)) - all_tag_ids)
     # we have a number, so insert the tag
     parent_obj[current_id] = {'name': new_tag_name, 'tags': {}}  # type: ignore
+    self._tag_index[current_id] = (parent_id, parent_obj[current_id])  # type: ignore
     return current_id
 
   def RenameTag(self, tag_id: int, new_tag_name: str) -> None:
@@ -640,6 +981,8 @@ class FapDatabase:
     else:
       # in this case we have a non-root parent
       del tag_hierarchy[-2][-1]['tags'][tag_id]
+    if self._tag_index is not None:
+      self._tag_index.pop(tag_id, None)
     # we must remove the tags from any images that have it too!
     tag_deletions: set[str] = set()
     for sha, blob in self.blobs.items():
@@ -648,6 +991,51 @@ class FapDatabase:
         tag_deletions.add(sha)
     return tag_deletions
 
+  def BlobColumns(self) -> BlobColumnsType:
+    """Build a columnar (numpy) snapshot of the numeric blob fields, in one pass over the blobs.
+
+    This is a snapshot: it will *not* reflect later changes to self.blobs, so build it right before
+    the aggregations that need it.
+
+    Returns:
+      BlobColumnsType with one row per blob, in self.blobs order
+    """
+    n_blobs = len(self.blobs)
+    columns: BlobColumnsType = {
+        'rows': {},
+        'sz': np.empty(n_blobs, dtype=np.int64),
+        'sz_thumb': np.empty(n_blobs, dtype=np.int64),
+        'width': np.empty(n_blobs, dtype=np.int64),
+        'height': np.empty(n_blobs, dtype=np.int64),
+        'date': np.empty(n_blobs, dtype=np.int64),
+        'animated': np.empty(n_blobs, dtype=bool),
+        'gone': np.empty(n_blobs, dtype=bool),
+        'n_loc': np.empty(n_blobs, dtype=np.int64),
+    }
+    rows, sz, sz_thumb = columns['rows'], columns['sz'], columns['sz_thumb']
+    width, height, date = columns['width'], columns['height'], columns['date']
+    animated, gone, n_loc = columns['animated'], columns['gone'], columns['n_loc']
+    for i, (sha, blob) in enumerate(self.blobs.items()):
+      rows[sha] = i
+      sz[i], sz_thumb[i], width[i], height[i] = (
+          blob['sz'], blob['sz_thumb'], blob['width'], blob['height'])
+      date[i], animated[i], gone[i] = blob['date'], blob['animated'], bool(blob['gone'])
+      n_loc[i] = len(blob['loc'])
+    return columns
+
+  def BlobRows(self, columns: BlobColumnsType, img_ids: Iterable[int]) -> np.ndarray:
+    """Get the `columns` rows for the blobs of `img_ids` (image IDs not in the index are skipped).
+
+    Args:
+      columns: BlobColumnsType snapshot, from BlobColumns()
+      img_ids: Image IDs
+
+    Returns:
+      np.int64 array of rows, to index any of the `columns` arrays with
+    """
+    rows, index = columns['rows'], self.image_ids_index
+    return np.fromiter((rows[index[i]] for i in img_ids if i in index), dtype=np.int64)
+
   def PrintStats(self, actually_print=True) -> list[str]:
     """Print database stats.
 
@@ -657,10 +1045,16 @@ class FapDatabase:
     Returns:
       list of strings to print as status
     """
-    file_sizes: list[int] = [s['sz'] for s in self.blobs.values()]
-    thumb_sizes: list[int] = [s['sz_thumb'] for s in self.blobs.values()]
-    all_files_size, all_thumb_size = sum(file_sizes), sum(thumb_sizes)
-    db_size = os.path.getsize(self._db_path)
+    # gather all blob data in columns, then use numpy for the statistics
+    columns = self.BlobColumns()
+    n_blobs = len(columns['rows'])
+    file_sizes, thumb_sizes = columns['sz'], columns['sz_thumb']
+    widths, heights = columns['width'], columns['height']
+    animated_count, gone_count = int(columns['animated'].sum()), int(columns['gone'].sum())
+    n_loc = columns['n_loc']
+    all_loc_count, duplicated_loc_count = int(n_loc.sum()), int(n_loc[n_loc > 1].sum())
+    all_files_size, all_thumb_size = int(file_sizes.sum()), int(thumb_sizes.sum())
+    db_size = self._db_size
     all_lines: list[str] = []
 
     def _PrintLine(line: str = ''):
@@ -672,36 +1066,27 @@ class FapDatabase:
         f'Database is located in {self._db_path!r}, and is {base.HumanizedBytes(db_size)} '
         f'({(100.0 * db_size) / (all_files_size if all_files_size else 1):0.3f}% of '
         'total images size)')
+    size_min, size_max, size_mean, size_dev = StatsStrs(file_sizes, base.HumanizedBytes)
     _PrintLine(
         f'{base.HumanizedBytes(all_files_size)} total (unique) images size '
-        f'({base.HumanizedBytes(min(file_sizes)) if file_sizes else "-"} min, '
-        f'{base.HumanizedBytes(max(file_sizes)) if file_sizes else "-"} max, '
-        f'{base.HumanizedBytes(int(statistics.mean(file_sizes))) if file_sizes else "-"} mean with '
-        f'{base.HumanizedBytes(int(statistics.stdev(file_sizes))) if len(file_sizes) > 2 else "-"} '
-        f'standard deviation, {sum(int(s["animated"]) for s in self.blobs.values())} are animated)')
-    if file_sizes:
-      wh_sizes: list[tuple[int, int]] = [
-          (s['width'], s['height']) for s in self.blobs.values()]
-      pixel_sizes: list[int] = [
-          s['width'] * s['height'] for s in self.blobs.values()]
-      std_dev = base.HumanizedDecimal(
-          int(statistics.stdev(pixel_sizes))) if len(pixel_sizes) > 2 else '-'
+        f'({size_min} min, {size_max} max, {size_mean} mean with {size_dev} '
+        f'standard deviation, {animated_count} are animated)')
+    if n_blobs:
+      pixel_sizes = widths * heights
+      i_min, i_max = int(pixel_sizes.argmin()), int(pixel_sizes.argmax())  # first occurrences
+      _, _, size_mean, size_dev = StatsStrs(pixel_sizes, base.HumanizedDecimal)
       _PrintLine(  # cspell:disable-line
-          f'Pixel size (width, height): {base.HumanizedDecimal(min(pixel_sizes))} pixels min '
-          f'{wh_sizes[pixel_sizes.index(min(pixel_sizes))]!r}, '
-          f'{base.HumanizedDecimal(max(pixel_sizes))} pixels max '
-          f'{wh_sizes[pixel_sizes.index(max(pixel_sizes))]!r}, '
-          f'{base.HumanizedDecimal(int(statistics.mean(pixel_sizes)))} mean with '
-          f'{std_dev} standard deviation')
+          f'Pixel size (width, height): {base.HumanizedDecimal(int(pixel_sizes[i_min]))} pixels '
+          f'min {(int(widths[i_min]), int(heights[i_min]))!r}, '
+          f'{base.HumanizedDecimal(int(pixel_sizes[i_max]))} pixels max '
+          f'{(int(widths[i_max]), int(heights[i_max]))!r}, '
+          f'{size_mean} mean with {size_dev} standard deviation')
     if all_files_size and all_thumb_size:
-      std_dev = base.HumanizedBytes(
-          int(statistics.stdev(thumb_sizes))) if len(thumb_sizes) > 2 else '-'
+      size_min, size_max, size_mean, size_dev = StatsStrs(thumb_sizes, base.HumanizedBytes)
       _PrintLine(
           f'{base.HumanizedBytes(all_thumb_size)} total thumbnail size ('
-          f'{base.HumanizedBytes(min(thumb_sizes)) if thumb_sizes else "-"} min, '
-          f'{base.HumanizedBytes(max(thumb_sizes)) if thumb_sizes else "-"} max, '
-          f'{base.HumanizedBytes(int(statistics.mean(thumb_sizes))) if thumb_sizes else "-"} mean '
-          f'with {std_dev} standard deviation), '
+          f'{size_min} min, {size_max} max, {size_mean} mean '
+          f'with {size_dev} standard deviation), '
           f'{(100.0 * all_thumb_size) / all_files_size:0.1f}% of total images size')
     _PrintLine()
     _PrintLine(f'{len(self.users)} users')
@@ -712,16 +1097,13 @@ class FapDatabase:
                f'(oldest: {base.STD_TIME_STRING(min_date) if min_date else "pending"} / '
                f'newer: {base.STD_TIME_STRING(max_date) if max_date else "pending"})')
     _PrintLine(
-        f'{len(self.blobs)} unique images ({sum(len(b["loc"]) for b in self.blobs.values())} '
-        f'total, {sum(len(b["loc"]) for b in self.blobs.values() if len(b["loc"]) > 1)} '
+        f'{n_blobs} unique images ({all_loc_count} total, {duplicated_loc_count} '
         'exact duplicates)')
-    unique_failed: set[int] = set()
-    for failed in (
-        fav['failed_images'] for user in self.favorites.values() for fav in user.values()):
-      unique_failed.update(img for img, _, _, _ in failed)
+    unique_failed: set[int] = {  # only goes over the failures, not over all the images
+        failed[0] for user in self.favorites.values() for fav in user.values()
+        for failed in fav['failed_images']}
     _PrintLine(f'{len(unique_failed)} unique failed images in all user albums')
-    _PrintLine(f'{sum(1 for b in self.blobs.values() if b["gone"])} unique images are now '
-               'disappeared from imagefap site')
+    _PrintLine(f'{gone_count} unique images are now disappeared from imagefap site')
     _PrintLine(f'{len(self.duplicates.index)} perceptual duplicates in '
                f'{len(self.duplicates.registry)} groups')
     return all_lines
@@ -746,38 +1128,34 @@ class FapDatabase:
     _PrintLine('    FILE STATS FOR USER')
     _PrintLine('    => ID: FAVORITE_NAME (IMAGE_COUNT / FAILED_COUNT / PAGE_COUNT / DATE DOWNLOAD)')
     _PrintLine('           FILE STATS FOR FAVORITES')
+    columns = self.BlobColumns()
     for uid in sorted(self.users.keys()):
       _PrintLine()
       _PrintLine(f'{uid}: {self.users[uid]["name"]!r}')
-      file_sizes: list[int] = [
-          self.blobs[self.image_ids_index[i]]['sz']
-          for d, u in self.favorites.items() if d == uid
-          for f in u.values()
-          for i in f['images'] if i in self.image_ids_index]
-      std_dev = base.HumanizedBytes(
-          int(statistics.stdev(file_sizes))) if len(file_sizes) > 2 else '-'
-      _PrintLine(f'    {base.HumanizedBytes(sum(file_sizes) if file_sizes else 0)} files size '
-                 f'({base.HumanizedBytes(min(file_sizes)) if file_sizes else "-"} min, '
-                 f'{base.HumanizedBytes(max(file_sizes)) if file_sizes else "-"} max, '
-                 f'{base.HumanizedBytes(int(statistics.mean(file_sizes))) if file_sizes else "-"} '
-                 f'mean with {std_dev} standard deviation)')
-      for fid in sorted(self.favorites.get(uid, {}).keys()):
-        obj = self.favorites[uid][fid]
-        file_sizes: list[int] = [
-            self.blobs[self.image_ids_index[i]]['sz']
-            for i in obj['images'] if i in self.image_ids_index]
+      # look up each album's sizes only once: the user's sizes are just all of them together
+      user_favorites = self.favorites.get(uid, {})
+      favorite_sizes: dict[int, np.ndarray] = {
+          fid: columns['sz'][self.BlobRows(columns, obj['images'])]
+          for fid, obj in user_favorites.items()}
+      file_sizes: np.ndarray = (
+          np.concatenate(list(favorite_sizes.values())) if favorite_sizes else
+          np.empty(0, dtype=np.int64))
+      size_min, size_max, size_mean, size_dev = StatsStrs(file_sizes, base.HumanizedBytes)
+      _PrintLine(f'    {base.HumanizedBytes(int(file_sizes.sum()))} files size '
+                 f'({size_min} min, {size_max} max, {size_mean} '
+                 f'mean with {size_dev} standard deviation)')
+      for fid in sorted(user_favorites.keys()):
+        obj = user_favorites[fid]
+        file_sizes = favorite_sizes[fid]
         date_str = base.STD_TIME_STRING(obj['date_blobs']) if obj['date_blobs'] else 'pending'
         _PrintLine(f'    => {fid}: {obj["name"]!r} ({len(obj["images"])} / '
                    f'{len(obj["failed_images"])} / {obj["pages"]} / {date_str})')
-        if file_sizes:
-          std_dev = base.HumanizedBytes(
-              int(statistics.stdev(file_sizes))) if len(file_sizes) > 2 else '-'
+        if len(file_sizes):
+          size_min, size_max, size_mean, size_dev = StatsStrs(file_sizes, base.HumanizedBytes)
           _PrintLine(
-              f'           {base.HumanizedBytes(sum(file_sizes))} files size '
-              f'({base.HumanizedBytes(min(file_sizes))} min, '
-              f'{base.HumanizedBytes(max(file_sizes))} max, '
-              f'{base.HumanizedBytes(int(statistics.mean(file_sizes)))} mean with '
-              f'{std_dev} standard deviation)')
+              f'           {base.HumanizedBytes(int(file_sizes.sum()))} files size '
+              f'({size_min} min, {size_max} max, {size_mean} mean with '
+              f'{size_dev} standard deviation)')
     return all_lines
 
   def PrintTags(self, actually_print=True) -> list[str]:
@@ -801,15 +1179,17 @@ class FapDatabase:
       return all_lines
     _PrintLine('TAG_ID: TAG_NAME (NUMBER_OF_IMAGES_WITH_TAG / SIZE_OF_IMAGES_WITH_TAG)')
     _PrintLine()
+    # one pass over the blobs' tags, instead of one pass over all the blobs for every tag
+    tag_counts: dict[int, int] = {}
+    tag_sizes: dict[int, int] = {}
+    for blob in self.blobs.values():
+      for tag_id in blob['tags']:
+        tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+        tag_sizes[tag_id] = tag_sizes.get(tag_id, 0) + blob['sz']
     for tag_id, tag_name, depth, _ in self.TagsWalk():
-      count: int = 0
-      total_sz: int = 0
-      for blob in self.blobs.values():
-        if tag_id in blob['tags']:
-          count += 1
-          total_sz += blob['sz']
       _PrintLine(
-          f'{"    " * depth}{tag_id}: {tag_name!r} ({count} / {base.HumanizedBytes(total_sz)})')
+          f'{"    " * depth}{tag_id}: {tag_name!r} ({tag_counts.get(tag_id, 0)} / '
+          f'{base.HumanizedBytes(tag_sizes.get(tag_id, 0))})')
     return all_lines
 
   def PrintBlobs(self, actually_print=True) -> list[str]:
@@ -832,13 +1212,16 @@ class FapDatabase:
                '(WIDTH, HEIGHT) [ANIMATED]')
     _PrintLine('    => {\'TAG1\', \'TAG2\', ...}')
     _PrintLine()
-    for sha in sorted(self.blobs.keys()):
-      blob = self.blobs[sha]
+    tag_strs: dict[int, str] = {tid: f'{name} ({tid})' for tid, name, _, _ in self.TagsWalk()}
+    for sha, blob in sorted(self.blobs.items()):  # SHAs are unique: blobs are never compared
       _PrintLine(f'{sha}: {self.LocationsStr(blob["loc"])}, '
                  f'{base.HumanizedDecimal(blob["width"] * blob["height"])} '
                  f'({blob["width"]}, {blob["height"]}){" animated" if blob["animated"] else ""}')
       if blob['tags']:
-        _PrintLine(f'    => {{{", ".join(self.TagStr(tid) for tid in sorted(blob["tags"]))}}}')
+        blob_tags = ', '.join(
+            tag_strs[tid] if tid in tag_strs else self.TagStr(tid)  # TagStr() raises if invalid
+            for tid in sorted(blob['tags']))
+        _PrintLine(f'    => {{{blob_tags}}}')
     return all_lines
 
   def AddUserByID(self, user_id: int) -> str:
@@ -876,8 +1259,9 @@ class FapDatabase:
       Error: if conversion failed
     """
     # first try to find in DB
+    lower_name = user_name.lower()  # (lowercase the searched name only once)
     for uid, user in self.users.items():
-      if user['name'].lower() == user_name.lower():
+      if user['name'].lower() == lower_name:
         logging.info('Known user %s', self.UserStr(uid))
         return (uid, user['name'])
     # not found: we have to find in actual site
@@ -903,13 +1287,13 @@ class FapDatabase:
       status = 'New'
       url: str = fapbase.FOLDER_URL(user_id, folder_id, 0)  # use the folder page
       logging.info('Fetching favorites page: %s', url)
-      folder_html = fapbase.FapHTMLRead(url)
+      folder_html = fapbase.ListingHTMLRead(url)
       folder_names: list[str] = fapbase.FIND_NAME_IN_FOLDER.findall(folder_html)
       if len(folder_names) != 1:
         raise Error(f'Could not find folder name for {user_id}/{folder_id}')
       fapbase.CheckFolderIsForImages(user_id, folder_id)  # raises Error if not valid
       self.favorites.setdefault(user_id, {})[folder_id] = {
-          'name': html.unescape(folder_names[0]), 'pages': 0,
+          'name': fapbase.UnescapeHTML(folder_names[0]), 'pages': 0,
           'date_blobs': 0, 'images': [], 'failed_images': set()}
     logging.info('%s folder %s added', status, self.AlbumStr(user_id, folder_id))
     return self.favorites[user_id][folder_id]['name']
@@ -928,9 +1312,10 @@ class FapDatabase:
       Error: if conversion failed
     """
     # first try to find in DB
+    lower_name = favorites_name.lower()  # (lowercase the searched name only once)
     if user_id in self.favorites:
       for fid, f_data in self.favorites[user_id].items():
-        if f_data['name'].lower() == favorites_name.lower():
+        if f_data['name'].lower() == lower_name:
           logging.info('Known folder %s', self.AlbumStr(user_id, fid))
           return (fid, f_data['name'])
     # not found: we have to find in actual site
@@ -964,15 +1349,15 @@ class FapDatabase:
     non_galleries: int = 0
     found_folder_ids: set[int] = set()
     self.favorites.setdefault(user_id, {})  # just to make sure user is in _favorites
+    pages = fapbase.PageReader(lambda p: fapbase.FAVORITES_URL(user_id, p))  # reads ahead
     while True:
-      url: str = fapbase.FAVORITES_URL(user_id, page_num)
-      logging.info('Fetching favorites page: %s', url)
-      fav_html = fapbase.FapHTMLRead(url)
+      fav_html = pages.Read(page_num)
       favorites_page: list[tuple[str, str]] = fapbase.FIND_FOLDERS.findall(fav_html)
       if not favorites_page:
         break  # no favorites found, so we passed the last page
+      new_folders: dict[int, str] = {}
       for f_id, f_name in favorites_page:
-        i_f_id, f_name = int(f_id), html.unescape(f_name)
+        i_f_id, f_name = int(f_id), fapbase.UnescapeHTML(f_name)
         # first check if we know it (for speed)
         if i_f_id in self.favorites[user_id]:
           # we already know of this gallery
@@ -980,10 +1365,12 @@ class FapDatabase:
           found_folder_ids.add(i_f_id)
           known_favorites += 1
           continue
-        # check if we can accept it as a images gallery
-        try:
-          fapbase.CheckFolderIsForImages(user_id, i_f_id)  # raises Error if not valid
-        except fapbase.Error:
+        new_folders[i_f_id] = f_name
+      # check (concurrently) which new folders we can accept as images galleries
+      images_folders: set[int] = (
+          fapbase.FilterImagesFolders(user_id, list(new_folders.keys())) if new_folders else set())
+      for i_f_id, f_name in new_folders.items():
+        if i_f_id not in images_folders:
           # this is a galleries favorite, so we can skip: we want images gallery!
           logging.info('Discarded galleries folder %r (%d/%d)', f_name, user_id, i_f_id)
           non_galleries += 1
@@ -1034,7 +1421,7 @@ class FapDatabase:
     logging.info(
         'Found a total of %d image IDs in %d pages (%d are new in set, %d need downloading)',
         len(img_list), page_num + 1, new_count,
-        sum(1 for i in img_list if i not in self.image_ids_index))
+        len(set(img_list).difference(self.image_ids_index)))  # (IDs in img_list are unique)
     return img_list
 
   def _CheckWorkHysteresis(self, force_download: bool, tm_last: int, task_message: str) -> bool:
@@ -1066,8 +1453,9 @@ class FapDatabase:
     Args:
       user_id: User ID
       folder_id: Folder ID
-      checkpoint_size: Commit database to disk every `checkpoint_size` images actually downloaded;
-          if zero will not checkpoint at all
+      checkpoint_size: Commit database to disk every `checkpoint_size` images actually downloaded
+          (but not more often than every CHECKPOINT_MIN_INTERVAL seconds); if zero will not
+          checkpoint at all
       force_download: If True will download even if recently downloaded
 
     Returns:
@@ -1086,6 +1474,10 @@ class FapDatabase:
                    f'Checkpoint DB every {checkpoint_size} database actions')
     except KeyError as err:
       raise Error(f'This user/folder was not added to DB yet: {user_id}/{folder_id}') from err
+    album_str = self.AlbumStr(user_id, folder_id)  # build once: it is logged in the image loop
+    folder = self.favorites[user_id][folder_id]  # bind once: it is updated in the image loop
+    img_ids: list[int] = folder['images']  # not copied: failed images are only dropped later
+    failed_ids: set[int] = set()
     # download all full resolution images we don't yet have
     total_sz: int = 0
     thumb_sz: int = 0
@@ -1094,98 +1486,132 @@ class FapDatabase:
     known_count: int = 0
     exists_count: int = 0
     failed_count: int = 0
-    for img_id in list(self.favorites[user_id][folder_id]['images']):  # copy b/c we might change it
-      # checkpoint database, if asked to and all actions accumulate to threshold (checkpoint_size)
-      action_count = saved_count + exists_count + failed_count
-      if checkpoint_size and (action_count and not action_count % checkpoint_size):
-        logging.info('Album %s checkpoint @ saved=%d / existing=%d / failed=%d',
-                     self.AlbumStr(user_id, folder_id), saved_count, exists_count, failed_count)
-        self.Save()
-      # the logic below if very similar to FapDatabase._AddDiskFile(): KEEP IN SYNC
-      # figure out if we have it in the index, i.e., if we've seen img_id before
-      sha = self.image_ids_index.get(img_id, None)
-      sanitized_image_name: str = 'unknown'
-      if sha is not None and self.HasBlob(sha):
-        # we have seen this img_id before, and can skip a lot of stuff
-        # also: we only have to add it if it is not an exact match user_id+folder_id+img_id
-        if (user_id, folder_id, img_id) in self.blobs[sha]['loc']:
-          # and we are done for this image, since it is a complete duplicate
-          known_count += 1
-          logging.info('Image %d already in %s', img_id, self.AlbumStr(user_id, folder_id))
-          continue
-        # in this last case we know the img_id but it seems to be duplicated in another album,
-        # so we have to get the image name at least so we can add it to the database
-        try:
-          _, sanitized_image_name, _ = fapbase.ExtractFullImageURL(img_id)
-          self.blobs[sha]['date'] = base.INT_TIME()
-          logging.info('New location added for known image %d (%r)', img_id, sanitized_image_name)
-        except fapbase.Error404:
-          # image failed, but we can trust to add it with 'unknown' name because the SHA is the same
-          logging.warning('Image %d failed to fetch but is being added with name "unknown"', img_id)
-        # either way we are done with this image
-        self.blobs[sha]['loc'][(user_id, folder_id, img_id)] = (sanitized_image_name, 'new')
-        exists_count += 1
-        continue
-      # we don't know about this specific img_id yet: we need more information
-      try:
-        # get image's full resolution URL + name
-        url_path, sanitized_image_name, extension = fapbase.ExtractFullImageURL(img_id)
-        # get the binary data so we can compute the SHA for this image
-        image_bytes, sha = fapbase.GetBinary(url_path)
-      except fapbase.Error404 as err:
-        err.image_id = img_id
-        err.image_name = sanitized_image_name  # this might be None or this might be filled in
-        self.favorites[user_id][folder_id]['images'].remove(img_id)
-        self.favorites[user_id][folder_id]['failed_images'].add(err.FailureTuple(log=True))
-        failed_count += 1
-        logging.error('Image %d failed retrieval in %s', img_id, self.AlbumStr(user_id, folder_id))
-        continue
-      # we now have binary data and a SHA for sure: check if SHA is in DB
-      if sha in self.blobs and self.HasBlob(sha):
-        # we already have this image, so we just add it to 'loc' and to the index
-        self.blobs[sha]['loc'][(user_id, folder_id, img_id)] = (sanitized_image_name, 'new')
-        self.blobs[sha]['date'] = base.INT_TIME()
-        self.image_ids_index[img_id] = sha
-        exists_count += 1
-        logging.info('New location added for duplicate image %d (%r)', img_id, sanitized_image_name)
-        continue
-      # now we know we have a truly new image that needs perceptual hashes, thumbnail, etc
-      # create a temporary file so we can do all the clear-text operations we need on the file
-      with tempfile.NamedTemporaryFile(delete=True) as temp_file:
-        # write the data we already have to the temp file
-        temp_file.write(image_bytes)
-        temp_file.flush()
-        try:
-          # generate thumbnail and get dimensions and other image info;
-          # do this *first* because the extension can change here on PIL's advice
-          thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
-              sha, extension, temp_file)
-          total_thumb_sz += thumb_sz
-          # write binary data to the final disk destination
-          total_sz += self._SaveImage(self._BlobPath(sha, extension_hint=extension), image_bytes)
-          # calculate image hashes
-          percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
-              temp_file.name)
-          # create blob and index entries
-          self.blobs[sha] = {
-              'loc': {(user_id, folder_id, img_id): (sanitized_image_name, 'new')},
-              'tags': set(), 'sz': len(image_bytes), 'sz_thumb': thumb_sz, 'ext': extension,
-              'percept': percept_hash, 'average': average_hash, 'diff': diff_hash,
-              'wavelet': wavelet_hash, 'cnn': cnn_hash, 'width': width, 'height': height,
-              'animated': is_animated, 'date': base.INT_TIME(), 'gone': {}}
-          self.image_ids_index[img_id] = sha
-          saved_count += 1
-          logging.info('New image %d (%r) finished processing', img_id, sanitized_image_name)
-        except Error:
-          self.favorites[user_id][folder_id]['images'].remove(img_id)
-          self.favorites[user_id][folder_id]['failed_images'].add(
-              (img_id, base.INT_TIME(), sanitized_image_name, url_path))
-          failed_count += 1
-          logging.error(
-              'Image %d failed processing in %s', img_id, self.AlbumStr(user_id, folder_id))
-    # all images were downloaded: mark as done, log, and save if anything actually changed
-    self.favorites[user_id][folder_id]['date_blobs'] = base.INT_TIME()  # marks album as done
-    print(f'Album {self.AlbumStr(user_id, folder_id)}: '
+    last_checkpoint: tuple[int, float] = (0, time.monotonic())  # (action count, time) of last Save
+    # the network part of new images (full-res URL + binary data) is fetched ahead, on a thread
+    # pool, while the main thread does the CPU work (thumbnails, hashes) and all DB changes
+    fetches: dict[int, concurrent.futures.Future] = {}
+    next_fetch: int = 0
+    blobs_on_disk: set[str] = set()  # SHAs already seen on disk: spares repeated stat() calls
+
+    def _OnDisk(sha: str) -> bool:
+      if sha not in blobs_on_disk:  # (only positive results are kept: blobs are never removed)
+        if not self.HasBlob(sha):
+          return False
+        blobs_on_disk.add(sha)
+      return True
+
+    def _FetchAhead(pool: concurrent.futures.ThreadPoolExecutor) -> None:
+      nonlocal next_fetch
+      while len(fetches) < _IMAGE_FETCH_AHEAD and next_fetch < len(img_ids):
+        ahead_id = img_ids[next_fetch]
+        next_fetch += 1
+        ahead_sha = self.image_ids_index.get(ahead_id, None)
+        if ahead_id not in fetches and (ahead_sha is None or not _OnDisk(ahead_sha)):
+          fetches[ahead_id] = pool.submit(_FetchImage, ahead_id)  # unknown: will need the data
+
+    try:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_IMAGE_FETCHERS) as fetch_pool:
+        for img_id in img_ids:
+          _FetchAhead(fetch_pool)
+          fetch = fetches.pop(img_id, None)
+          # checkpoint database, if asked to and actions since last one accumulate to threshold
+          # (checkpoint_size); known images are not actions, so they never cause a (repeated) Save
+          action_count = saved_count + exists_count + failed_count
+          if (checkpoint_size and action_count - last_checkpoint[0] >= checkpoint_size and
+              time.monotonic() - last_checkpoint[1] >= CHECKPOINT_MIN_INTERVAL):
+            logging.info('Album %s checkpoint @ saved=%d / existing=%d / failed=%d',
+                         album_str, saved_count, exists_count, failed_count)
+            if failed_ids:  # (a new list: we are still looping over the original one)
+              folder['images'] = [i for i in img_ids if i not in failed_ids]
+            self.Save(wait=False)  # the files are written while the downloads go on
+            last_checkpoint = (action_count, time.monotonic())
+          # the logic below if very similar to FapDatabase._AddDiskFile(): KEEP IN SYNC
+          # figure out if we have it in the index, i.e., if we've seen img_id before
+          sha = self.image_ids_index.get(img_id, None)
+          sanitized_image_name: str = 'unknown'
+          if sha is not None and _OnDisk(sha):
+            # we have seen this img_id before, and can skip a lot of stuff
+            # also: we only have to add it if it is not an exact match user_id+folder_id+img_id
+            blob = self.blobs[sha]
+            if (user_id, folder_id, img_id) in blob['loc']:
+              # and we are done for this image, since it is a complete duplicate
+              known_count += 1
+              logging.info('Image %d already in %s', img_id, album_str)
+              continue
+            # in this last case we know the img_id but it seems to be duplicated in another album,
+            # so we have to get the image name at least so we can add it to the database
+            try:
+              _, sanitized_image_name, _ = fapbase.ExtractFullImageURL(img_id)
+              blob['date'] = base.INT_TIME()
+              logging.info(
+                  'New location added for known image %d (%r)', img_id, sanitized_image_name)
+            except fapbase.Error404:
+              # image failed, but we can trust to add it with 'unknown' name because SHA is the same
+              logging.warning(
+                  'Image %d failed to fetch but is being added with name "unknown"', img_id)
+            # either way we are done with this image
+            blob['loc'][(user_id, folder_id, img_id)] = (sanitized_image_name, 'new')
+            exists_count += 1
+            continue
+          # we don't know about this specific img_id yet: we need more information
+          try:
+            # get image's full resolution URL + name + binary data (we usually already fetched it)
+            url_path, sanitized_image_name, extension, image_bytes, sha = (
+                _FetchImage(img_id) if fetch is None else fetch.result())
+          except fapbase.Error404 as err:
+            failed_ids.add(img_id)
+            folder['failed_images'].add(err.FailureTuple(log=True))
+            failed_count += 1
+            logging.error('Image %d failed retrieval in %s', img_id, album_str)
+            continue
+          # we now have binary data and a SHA for sure: check if SHA is in DB
+          if sha in self.blobs and _OnDisk(sha):
+            # we already have this image, so we just add it to 'loc' and to the index
+            blob = self.blobs[sha]
+            blob['loc'][(user_id, folder_id, img_id)] = (sanitized_image_name, 'new')
+            blob['date'] = base.INT_TIME()
+            self.image_ids_index[img_id] = sha
+            exists_count += 1
+            logging.info(
+                'New location added for duplicate image %d (%r)', img_id, sanitized_image_name)
+            continue
+          # now we know we have a truly new image that needs perceptual hashes, thumbnail, etc
+          # (all the clear-text operations we need are done on the data in memory)
+          try:
+            # generate thumbnail and get dimensions and other image info;
+            # do this *first* because the extension can change here on PIL's advice
+            thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
+                sha, extension, image_bytes)
+            total_thumb_sz += thumb_sz
+            # write binary data to the final disk destination
+            total_sz += self._SaveImage(self._BlobPath(sha, extension_hint=extension), image_bytes)
+            # calculate image hashes
+            percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
+                image_bytes)
+            # create blob and index entries
+            self.blobs[sha] = {
+                'loc': {(user_id, folder_id, img_id): (sanitized_image_name, 'new')},
+                'tags': set(), 'sz': len(image_bytes), 'sz_thumb': thumb_sz, 'ext': extension,
+                'percept': percept_hash, 'average': average_hash, 'diff': diff_hash,
+                'wavelet': wavelet_hash, 'cnn': cnn_hash, 'width': width, 'height': height,
+                'animated': is_animated, 'date': base.INT_TIME(), 'gone': {}}
+            self.image_ids_index[img_id] = sha
+            blobs_on_disk.add(sha)
+            saved_count += 1
+            logging.info('New image %d (%r) finished processing', img_id, sanitized_image_name)
+          except Error:
+            failed_ids.add(img_id)
+            folder['failed_images'].add(
+                (img_id, base.INT_TIME(), sanitized_image_name, url_path))
+            failed_count += 1
+            logging.error('Image %d failed processing in %s', img_id, album_str)
+    finally:
+      self._StopSaves()  # (re-raises the errors of background saves)
+    # all images were downloaded: drop failed ones from album, mark as done, log, and save
+    if failed_ids:
+      folder['images'] = [i for i in img_ids if i not in failed_ids]
+    folder['date_blobs'] = base.INT_TIME()  # marks album as done
+    print(f'Album {album_str}: '
           f'Saved {saved_count} images to disk ({base.HumanizedBytes(total_sz)}) and '
           f'{base.HumanizedBytes(total_thumb_sz)} in thumbnails; also {known_count} images were '
           f'already in DB and {exists_count} images were already saved to destination, '
@@ -1197,14 +1623,13 @@ class FapDatabase:
   def _MakeThumbnailForBlob(  # noqa: C901
       self, sha: str,
       extension: str,
-      temp_file: tempfile._TemporaryFileWrapper) -> tuple[int, int, int, bool, str]:
+      image_bytes: bytes) -> tuple[int, int, int, bool, str]:
     """Make equivalent thumbnail for `sha` entry. Will overwrite destination.
 
     Args:
       sha: the SHA256 key
       extension: the extension of the original blob (image)
-      temp_file: Temporary file, like created with tempfile.NamedTemporaryFile, in saved state,
-          so this method can call open it to read the original binary data
+      image_bytes: the original (clear-text) binary data of the blob (image)
 
     Returns:
       (int size of saved file, original width, original height, is animated image, actual extension)
@@ -1213,72 +1638,59 @@ class FapDatabase:
       Error: if image has inconsistencies or could not be processed
     """
     # open image and generate a thumbnail
-    with Image.open(temp_file.name) as img:
+    with Image.open(io.BytesIO(image_bytes)) as img:  # (decoded from memory: no temp file)
       # check that extension (coming from imagefap) matches the perception PIL has of the image
       if img.format is not None:
         fmt = fapbase.NormalizeExtension(img.format)
         if extension != fmt:
           logging.error('Extension is marked %r while PIL identified image as %r', extension, fmt)
           extension = fmt  # change it to what PIL advises
-      # figure paths to use
       output_path = self._ThumbnailPath(sha, extension_hint=extension)
-      output_prefix, output_name = os.path.split(output_path)
-      output_name = f'unencrypted.{output_name}'
-      unencrypted_path = os.path.join(output_prefix, output_name)
-      try:  # this try block is to ensure `unencrypted_path` gets deleted from disk
-        # figure out the new size that will be used
-        width, height = img.width, img.height
-        is_animated: bool = getattr(img, 'is_animated', False)
-        if max((width, height)) <= _THUMBNAIL_MAX_DIMENSION:
-          # the image is already smaller than the putative thumbnail: just copy it as thumbnail
-          shutil.copyfile(temp_file.name, unencrypted_path)
-          logging.info('Copied image as thumbnail for %r', sha)
+      # figure out the new size that will be used
+      width, height = img.width, img.height
+      is_animated: bool = getattr(img, 'is_animated', False)
+      thumb_data: bytes = image_bytes
+      if max((width, height)) <= _THUMBNAIL_MAX_DIMENSION:
+        # the image is already smaller than the putative thumbnail: just copy it as thumbnail
+        logging.info('Copied image as thumbnail for %r', sha)
+      else:
+        # figure out width & height to use
+        if width > height:
+          new_width, factor = _THUMBNAIL_MAX_DIMENSION, width / _THUMBNAIL_MAX_DIMENSION
+          new_height = math.floor(height / factor)
         else:
-          # figure out width & height to use
-          if width > height:
-            new_width, factor = _THUMBNAIL_MAX_DIMENSION, width / _THUMBNAIL_MAX_DIMENSION
-            new_height = math.floor(height / factor)
+          new_height, factor = _THUMBNAIL_MAX_DIMENSION, height / _THUMBNAIL_MAX_DIMENSION
+          new_width = math.floor(width / factor)
+        # do the thumbnail generation per se (encoded in memory), protected by exception handling
+        thumb_obj = io.BytesIO()
+        thumb_format = img.format or Image.registered_extensions()[f'.{extension}']
+        try:
+          if is_animated and extension == 'gif':
+            # special process for animated images, specifically an animated 'gif'
+            frames: Iterator[Image.Image] = _ThumbnailFrames(
+                ImageSequence.Iterator(img), sha, new_width, new_height)
+            first_frame = next(frames)   # handle first frame separately: will be used to save
+            first_frame.info = img.info  # copy sequence info into first frame
+            first_frame.save(
+                thumb_obj, format=thumb_format, save_all=True, append_images=list(frames))
+            logging.info('Saved animated thumbnail for %r', sha)
           else:
-            new_height, factor = _THUMBNAIL_MAX_DIMENSION, height / _THUMBNAIL_MAX_DIMENSION
-            new_width = math.floor(width / factor)
-          # do the thumbnail generation per se, protected by some exception handling
-          try:
-            if is_animated and extension == 'gif':
-              # special process for animated images, specifically an animated 'gif'
-              frames: Iterator[Image.Image] = _ThumbnailFrames(
-                  ImageSequence.Iterator(img), sha, new_width, new_height)
-              first_frame = next(frames)   # handle first frame separately: will be used to save
-              first_frame.info = img.info  # copy sequence info into first frame
-              first_frame.save(unencrypted_path, save_all=True, append_images=list(frames))
-              logging.info('Saved animated thumbnail for %r', sha)
-            else:
-              # simpler process for regular (non-animated) images
-              img.thumbnail((new_width, new_height), resample=Image.LANCZOS)
-              img.save(unencrypted_path)
-              logging.info('Saved thumbnail for %r', sha)
-          except (Error, OSError) as err:
-            err_msg = ('Thumbnail generation failed '
-                       f'for{" animated" if is_animated and extension == "gif" else " regular"} '
-                       f'image {sha!r} ({err})')
-            if 'file is truncated' in str(err).lower() and 'not processed' in str(err).lower():
-              raise Error(err_msg) from err
-            logging.error('%s: using regular copy as workaround', err_msg)
-            shutil.copyfile(temp_file.name, unencrypted_path)  # just copy, a simple solution
-        # we get the size of the created file so we can return it
-        sz_thumb = os.path.getsize(unencrypted_path)
-        # we now encrypt the temporary file into its final destination (or copy if no encryption)
-        if self._key is None:
-          shutil.copyfile(unencrypted_path, output_path)
-        else:
-          with open(unencrypted_path, 'rb') as unencrypted_obj:
-            bin_data = unencrypted_obj.read()
-          with open(output_path, 'wb') as encrypted_obj:
-            encrypted_obj.write(base.Encrypt(bin_data, self._key))
-        return (sz_thumb, width, height, is_animated, extension)
-      finally:
-        # we really have to try to delete the unencrypted file
-        if os.path.exists(unencrypted_path):
-          os.remove(unencrypted_path)
+            # simpler process for regular (non-animated) images
+            img.thumbnail((new_width, new_height), resample=Image.LANCZOS)
+            img.save(thumb_obj, format=thumb_format)
+            logging.info('Saved thumbnail for %r', sha)
+          thumb_data = thumb_obj.getvalue()
+        except (Error, OSError) as err:
+          err_msg = ('Thumbnail generation failed '
+                     f'for{" animated" if is_animated and extension == "gif" else " regular"} '
+                     f'image {sha!r} ({err})')
+          if 'file is truncated' in str(err).lower() and 'not processed' in str(err).lower():
+            raise Error(err_msg) from err
+          logging.error('%s: using regular copy as workaround', err_msg)  # just copy the image
+    # write the thumbnail into its final destination (encrypted, if we have a key)
+    with open(output_path, 'wb') as file_obj:
+      file_obj.write(thumb_data if self._key is None else base.Encrypt(thumb_data, self._key))
+    return (len(thumb_data), width, height, is_animated, extension)
 
   def _SaveImage(self, full_path: str, bin_data: bytes) -> int:
     """Save bin_data, the image data, to full_path.
@@ -1301,8 +1713,9 @@ class FapDatabase:
 
     Args:
       local_dir: Local directory path, to be read recursively
-      checkpoint_size: Commit database to disk every `checkpoint_size` images actually downloaded;
-          if zero will not checkpoint at all
+      checkpoint_size: Commit database to disk every `checkpoint_size` images actually downloaded
+          (but not more often than every CHECKPOINT_MIN_INTERVAL seconds); if zero will not
+          checkpoint at all
 
     Returns:
       number of read bytes
@@ -1322,50 +1735,56 @@ class FapDatabase:
     n_dirs: int = 0
     n_files: int = 0
     total_sz: int = 0
-    for dir_path, _, file_names in os.walk(local_dir):
-      # we have a directory to look at
-      logging.info('Reading directory %s', dir_path)
-      file_names.sort()  # we ingest files in alphabetical order
-      found_in_dir, folder_id = False, 0
-      for file_name in file_names:
-        # checkpoint, if needed
-        if checkpoint_size and (n_files and not n_files % checkpoint_size):
-          logging.info('Album %s checkpoint @ saved=%d', self.AlbumStr(1, folder_id), n_files)
-          self.Save()
-        # we have a file: is it an image?
-        extension = file_name.rsplit('.', maxsplit=1)[-1].lower()  # cspell:disable-line
-        if extension not in fapbase.IMAGE_TYPES:
-          continue  # not an image, we skip this file
-        # it is an image
-        if not found_in_dir:
-          # first file in this directory, so we must make sure the directory entry exists
-          # deduce 128-bit int ID from full path and inode:
-          # int(sha256(f'{full_directory_path}-{directory_inode}')[:32])
-          found_in_dir = True
-          folder_id = int.from_bytes(hashlib.sha256(  # TODO: make into method
-              f'{dir_path}-{os.stat(dir_path).st_ino}'.encode('utf-8')).digest()[:16], 'big')
-          self.favorites[1].setdefault(
-              folder_id, {'name': fapbase.GetDirectoryName(dir_path), 'date_blobs': 0,
-                          'failed_images': set(), 'images': [], 'pages': 1})
-        # read file data, compute SHA256
-        # TODO: make read+SHA into method
-        file_path = os.path.join(dir_path, file_name)
-        with open(file_path, 'rb') as file_obj:
-          file_data = file_obj.read()
-        sha = hashlib.sha256(file_data).hexdigest()
-        # deduce a 128-bit int image ID from SHA and inode:
-        # int(sha256(f'{sha256(image_data).digest()}-{image_inode}')[:32])
-        img_id = int.from_bytes(hashlib.sha256(  # TODO: make into method
-            f'{sha}-{os.stat(file_path).st_ino}'.encode('utf-8')).digest()[:16], 'big')
-        self.favorites[1][folder_id]['images'].append(img_id)
-        # we add the image to the database
-        if self._AddDiskFile(folder_id, dir_path, file_name, file_data, sha, img_id):
-          total_sz += len(file_data)
-          n_files += 1
-      # finished the directory, so make sure the album entry is up-to-date
-      if found_in_dir:
-        self.favorites[1][folder_id]['date_blobs'] = base.INT_TIME()
-        n_dirs += 1
+    last_checkpoint: tuple[int, float] = (0, time.monotonic())  # (file count, time) of last Save
+    try:
+      for dir_path, _, file_names in os.walk(local_dir):
+        # we have a directory to look at
+        logging.info('Reading directory %s', dir_path)
+        file_names.sort()  # we ingest files in alphabetical order
+        found_in_dir, folder_id = False, 0
+        for file_name in file_names:
+          # checkpoint, if needed (non-image files are skipped, so they never cause a repeated Save)
+          if (checkpoint_size and n_files - last_checkpoint[0] >= checkpoint_size and
+              time.monotonic() - last_checkpoint[1] >= CHECKPOINT_MIN_INTERVAL):
+            logging.info('Album %s checkpoint @ saved=%d', self.AlbumStr(1, folder_id), n_files)
+            self.Save(wait=False)  # the files are written while the reading goes on
+            last_checkpoint = (n_files, time.monotonic())
+          # we have a file: is it an image?
+          extension = file_name.rsplit('.', maxsplit=1)[-1].lower()  # cspell:disable-line
+          if extension not in fapbase.IMAGE_TYPES:
+            continue  # not an image, we skip this file
+          # it is an image
+          if not found_in_dir:
+            # first file in this directory, so we must make sure the directory entry exists
+            # deduce 128-bit int ID from full path and inode:
+            # int(sha256(f'{full_directory_path}-{directory_inode}')[:32])
+            found_in_dir = True
+            folder_id = int.from_bytes(hashlib.sha256(  # TODO: make into method
+                f'{dir_path}-{os.stat(dir_path).st_ino}'.encode('utf-8')).digest()[:16], 'big')
+            self.favorites[1].setdefault(
+                folder_id, {'name': fapbase.GetDirectoryName(dir_path), 'date_blobs': 0,
+                            'failed_images': set(), 'images': [], 'pages': 1})
+          # read file data, compute SHA256
+          # TODO: make read+SHA into method
+          file_path = os.path.join(dir_path, file_name)
+          with open(file_path, 'rb') as file_obj:
+            file_data = file_obj.read()
+          sha = hashlib.sha256(file_data).hexdigest()
+          # deduce a 128-bit int image ID from SHA and inode:
+          # int(sha256(f'{sha256(image_data).digest()}-{image_inode}')[:32])
+          img_id = int.from_bytes(hashlib.sha256(  # TODO: make into method
+              f'{sha}-{os.stat(file_path).st_ino}'.encode('utf-8')).digest()[:16], 'big')
+          self.favorites[1][folder_id]['images'].append(img_id)
+          # we add the image to the database
+          if self._AddDiskFile(folder_id, dir_path, file_name, file_data, sha, img_id):
+            total_sz += len(file_data)
+            n_files += 1
+        # finished the directory, so make sure the album entry is up-to-date
+        if found_in_dir:
+          self.favorites[1][folder_id]['date_blobs'] = base.INT_TIME()
+          n_dirs += 1
+    finally:
+      self._StopSaves()  # (re-raises the errors of background saves)
     # success, mark as done, save, return
     logging.info('Finished reading files; found %d images in %d directories', n_files, n_dirs)
     if n_files:
@@ -1387,45 +1806,43 @@ class FapDatabase:
     # check if SHA is in DB
     if sha in self.blobs and self.HasBlob(sha):
       # we have seen this sha before, and can skip a lot of stuff
-      if (1, folder_id, img_id) in self.blobs[sha]['loc']:
+      blob = self.blobs[sha]
+      if (1, folder_id, img_id) in blob['loc']:
         return False  # and we are done for this image, since it is a complete duplicate
       # we already have this image, so we just add it to 'loc' and to the index
-      self.blobs[sha]['loc'][(1, folder_id, img_id)] = (sanitized_image_name, 'new')
-      self.blobs[sha]['date'] = base.INT_TIME()
+      blob['loc'][(1, folder_id, img_id)] = (sanitized_image_name, 'new')
+      blob['date'] = base.INT_TIME()
       self.image_ids_index[img_id] = sha
       return False
     # now we know we have a truly new image that needs perceptual hashes, thumbnail, etc
-    # create a temporary file so we can do all the clear-text operations we need on the file
-    with tempfile.NamedTemporaryFile(delete=True) as temp_file:
-      # write the data we already have to the temp file
-      temp_file.write(file_data)
-      temp_file.flush()
-      try:
-        # generate thumbnail and get dimensions and other image info;
-        # do this *first* because the extension can change here on PIL's advice
-        thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
-            sha, extension, temp_file)
-        # write binary data to the final disk destination
-        self._SaveImage(self._BlobPath(sha, extension_hint=extension), file_data)
-        # calculate image hashes
-        percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
-            temp_file.name)
-        # create blob and index entries
-        self.blobs[sha] = {
-            'loc': {(1, folder_id, img_id): (sanitized_image_name, 'new')},
-            'tags': set(), 'sz': len(file_data), 'sz_thumb': thumb_sz, 'ext': extension,
-            'percept': percept_hash, 'average': average_hash, 'diff': diff_hash,
-            'wavelet': wavelet_hash, 'cnn': cnn_hash, 'width': width, 'height': height,
-            'animated': is_animated, 'date': base.INT_TIME(), 'gone': {}}
-        self.image_ids_index[img_id] = sha
-        logging.info('New image %r finished processing', sanitized_image_name)
-      except Error:
-        self.favorites[1][folder_id]['images'].remove(img_id)
-        self.favorites[1][folder_id]['failed_images'].add(
-            (img_id, base.INT_TIME(), sanitized_image_name, os.path.join(dir_path, file_name)))
-        logging.error(
-            'Image %d failed processing in %s', img_id, self.AlbumStr(1, folder_id))
-      return True
+    # (all the clear-text operations we need are done on the data in memory)
+    try:
+      # generate thumbnail and get dimensions and other image info;
+      # do this *first* because the extension can change here on PIL's advice
+      thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
+          sha, extension, file_data)
+      # write binary data to the final disk destination
+      self._SaveImage(self._BlobPath(sha, extension_hint=extension), file_data)
+      # calculate image hashes
+      percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
+          file_data)
+      # create blob and index entries
+      self.blobs[sha] = {
+          'loc': {(1, folder_id, img_id): (sanitized_image_name, 'new')},
+          'tags': set(), 'sz': len(file_data), 'sz_thumb': thumb_sz, 'ext': extension,
+          'percept': percept_hash, 'average': average_hash, 'diff': diff_hash,
+          'wavelet': wavelet_hash, 'cnn': cnn_hash, 'width': width, 'height': height,
+          'animated': is_animated, 'date': base.INT_TIME(), 'gone': {}}
+      self.image_ids_index[img_id] = sha
+      logging.info('New image %r finished processing', sanitized_image_name)
+    except Error:
+      folder = self.favorites[1][folder_id]
+      folder['images'].remove(img_id)
+      folder['failed_images'].add(
+          (img_id, base.INT_TIME(), sanitized_image_name, os.path.join(dir_path, file_name)))
+      logging.error(
+          'Image %d failed processing in %s', img_id, self.AlbumStr(1, folder_id))
+    return True
 
   def DeleteUserAndAlbums(self, user_id: int) -> tuple[int, int]:
     """Delete an user, together with favorites and orphaned blobs, thumbs, indexes and duplicates.
@@ -1445,7 +1862,7 @@ class FapDatabase:
     # delete the favorite albums first
     img_count: int = 0
     duplicate_count: int = 0
-    for folder_id in set(self.favorites.get(user_id, {}).keys()):
+    for folder_id in tuple(self.favorites.get(user_id, {})):  # copy: DeleteAlbum() changes it
       img, duplicate = self.DeleteAlbum(user_id, folder_id)
       img_count += img
       duplicate_count += duplicate
@@ -1476,6 +1893,8 @@ class FapDatabase:
     img_count: int = 0
     duplicate_count: int = 0
     images: list[int] = self.favorites[user_id][folder_id]['images']
+    other_images: Optional[set[int]] = None  # images used by other albums: built once, if needed
+    images_by_sha: Optional[dict[str, list[int]]] = None  # reverse index: built once, if needed
     for img_id in images:
       # get the blob
       sha = self.image_ids_index[img_id]
@@ -1488,20 +1907,26 @@ class FapDatabase:
       # now we either still have locations for this blob, or it is orphaned
       if self.blobs[sha]['loc']:
         # we still have locations using this blob: the blob stays and we might remove index
-        self._DeleteIndexIfOrphan(folder_id, img_id)
+        if other_images is None:
+          other_images = self._OtherAlbumsImages(folder_id)
+        self._DeleteIndexIfOrphan(img_id, other_images)
         continue
       # this blob is orphaned and must be purged; start by deleting the files on disk, if they exist
-      duplicate_count += int(self._DeleteOrphanBlob(sha))
+      if images_by_sha is None:
+        images_by_sha = self._ImagesBySHA()
+      duplicate_count += int(self._DeleteOrphanBlob(sha, images_by_sha=images_by_sha))
       img_count += 1
     # finally delete the actual album entry and return the counts
     del self.favorites[user_id][folder_id]
     return (img_count, duplicate_count)
 
-  def _DeleteOrphanBlob(self, sha: str) -> bool:
+  def _DeleteOrphanBlob(
+      self, sha: str, images_by_sha: Optional[dict[str, list[int]]] = None) -> bool:
     """Delete orphaned blob `sha` and take care of its dependencies.
 
     Args:
       sha: the blob to delete
+      images_by_sha: (default None) Optional reverse image index, see _DeleteIndexesToBlob()
 
     Returns:
       True if a duplicates group was deleted too; False otherwise
@@ -1519,20 +1944,48 @@ class FapDatabase:
     # now delete the blob entry
     del self.blobs[sha]
     # purge the duplicates and the indexes associated with this blob
-    self._DeleteIndexesToBlob(sha)
+    self._DeleteIndexesToBlob(sha, images_by_sha=images_by_sha)
     return self.duplicates.TrimDeletedBlob(sha)
 
-  def _DeleteIndexesToBlob(self, sha: str) -> None:
-    """Delete all index entries pointing to (recently deleted) blob `sha`."""
-    for img in {i for i, s in self.image_ids_index.items() if s == sha}:
-      del self.image_ids_index[img]
-
-  def _DeleteIndexIfOrphan(self, folder_id: int, imagefap_image_id: int) -> None:
-    """Delete index entry for `imagefap_image_id` IFF no album uses the index."""
-    if not any(
-        imagefap_image_id in favorite_obj['images'] and fid != folder_id
-        for user_obj in self.favorites.values()
-        for fid, favorite_obj in user_obj.items()):
+  def _ImagesBySHA(self) -> dict[str, list[int]]:
+    """Reverse of the image index, like {sha: [img_id1, img_id2, ...]}."""
+    images_by_sha: dict[str, list[int]] = {}
+    for img_id, sha in self.image_ids_index.items():
+      images_by_sha.setdefault(sha, []).append(img_id)
+    return images_by_sha
+
+  def _DeleteIndexesToBlob(
+      self, sha: str, images_by_sha: Optional[dict[str, list[int]]] = None) -> None:
+    """Delete all index entries pointing to (recently deleted) blob `sha`.
+
+    Args:
+      sha: the deleted blob
+      images_by_sha: (default None) If given, a reverse index from _ImagesBySHA() to use instead
+          of going over the whole index; it may be stale (built before other deletions) because
+          every entry is checked before being deleted
+    """
+    img_ids: Iterable[int] = (
+        [i for i, s in self.image_ids_index.items() if s == sha] if images_by_sha is None else
+        images_by_sha.get(sha, []))
+    for img in img_ids:
+      if self.image_ids_index.get(img, None) == sha:
+        del self.image_ids_index[img]
+
+  def _OtherAlbumsImages(self, folder_id: int) -> set[int]:
+    """Set of all image IDs in albums other than `folder_id` (the one being deleted)."""
+    return {img_id
+            for user_obj in self.favorites.values()
+            for fid, favorite_obj in user_obj.items() if fid != folder_id
+            for img_id in favorite_obj['images']}
+
+  def _DeleteIndexIfOrphan(self, imagefap_image_id: int, other_images: set[int]) -> None:
+    """Delete index entry for `imagefap_image_id` IFF no other album uses the index.
+
+    Args:
+      imagefap_image_id: Image ID
+      other_images: The image IDs of all the other albums, from _OtherAlbumsImages()
+    """
+    if imagefap_image_id not in other_images:
       del self.image_ids_index[imagefap_image_id]
 
   @property
@@ -1583,6 +2036,7 @@ class FapDatabase:
   def AlbumIntegrityCheck(self) -> None:
     """Go over user albums in DB and check that all images are accounted for."""
     self._UsersIntegrityCheck()
+    self._RebuildImageIdsIndex()
     all_valid_ids = self._AlbumIdsIntegrityCheck()
     self._CheckForIndexOrphans(all_valid_ids)
     self._CheckLocationIntegrity()
@@ -1599,6 +2053,35 @@ class FapDatabase:
         logging.info('Corrected: added user %s', self.UserStr(user_id))
     logging.info('Finished users integrity audit')
 
+  def _RebuildImageIdsIndex(self) -> None:
+    """Regenerate the image ID index from the blobs' 'loc' entries, the real source of truth.
+
+    Any difference between the existing index and the rebuilt one is logged before replacing it,
+    so the album checks that follow start from an index that is consistent with the blobs.
+    """
+    rebuilt: _ImagesIdIndexType = {}
+    for sha, blob in self.blobs.items():
+      for _, _, img_id in blob['loc'].keys():
+        if rebuilt.setdefault(img_id, sha) != sha:
+          logging.error(
+              'Image ID %d is in locations of 2 blobs: %r and %r', img_id, rebuilt[img_id], sha)
+          if self.image_ids_index.get(img_id) == sha:
+            rebuilt[img_id] = sha  # prefer what the index already said
+    for img_id in sorted(self.image_ids_index.keys() - rebuilt.keys()):
+      logging.error('Image ID %d (SHA %r) is in index but not in any blob location',
+                    img_id, self.image_ids_index[img_id])
+    for img_id in sorted(rebuilt.keys() - self.image_ids_index.keys()):
+      logging.error('Image ID %d (SHA %r) is in a blob location but not in index',
+                    img_id, rebuilt[img_id])
+    for img_id in sorted(rebuilt.keys() & self.image_ids_index.keys()):
+      if rebuilt[img_id] != self.image_ids_index[img_id]:
+        logging.error('Image ID %d is indexed as %r but its blob location is in %r',
+                      img_id, self.image_ids_index[img_id], rebuilt[img_id])
+    # replace contents, keeping the same dict object that is stored in the DB
+    self.image_ids_index.clear()
+    self.image_ids_index.update(rebuilt)
+    logging.info('Rebuilt image ID index from blob locations: %d entries', len(rebuilt))
+
   def _AlbumIdsIntegrityCheck(self) -> set[int]:  # noqa: C901
     """Check all images in albums are valid pointers.
 
@@ -1611,8 +2094,9 @@ class FapDatabase:
     all_valid_ids: set[int] = set()
     for user_id in sorted(self.favorites.keys()):
       for album_id, _ in self.SortedUserAlbums(user_id):
+        album_str = self.AlbumStr(user_id, album_id)  # build once per album, not once per image
         if not self.favorites[user_id][album_id]['date_blobs']:
-          logging.info('Skipping unfinished album %s', self.AlbumStr(user_id, album_id))
+          logging.info('Skipping unfinished album %s', album_str)
           all_valid_ids.update(self.favorites[user_id][album_id]['images'])
           continue
         for img_id in self.favorites[user_id][album_id]['images'].copy():  # copy to allow change
@@ -1620,7 +2104,7 @@ class FapDatabase:
           if img_id not in self.image_ids_index:
             logging.error(
                 'Image ID %d in %s is not listed in index',
-                img_id, self.AlbumStr(user_id, album_id))
+                img_id, album_str)
             # fix by trying to download the image and adding it to the database
             try:
               sha, blob_data = self._CreateFilesOnDiskAndProposeBlob(user_id, album_id, img_id)
@@ -1634,7 +2118,7 @@ class FapDatabase:
             except fapbase.Error404 as err:
               logging.error(
                   'Failed to download/fix image ID %d in %s',
-                  img_id, self.AlbumStr(user_id, album_id))
+                  img_id, album_str)
               self.favorites[user_id][album_id]['images'].remove(img_id)
               self.favorites[user_id][album_id]['failed_images'].add(
                   (img_id, err.timestamp, None, err.url))
@@ -1644,7 +2128,7 @@ class FapDatabase:
           if sha not in self.blobs:
             logging.error(
                 'Image ID %d in %s translates to SHA %r not listed in blobs',
-                img_id, self.AlbumStr(user_id, album_id), sha)
+                img_id, album_str, sha)
             try:
               new_sha, blob_data = self._CreateFilesOnDiskAndProposeBlob(user_id, album_id, img_id)
               if new_sha == sha:
@@ -1652,8 +2136,9 @@ class FapDatabase:
                 logging.info('Corrected: Image %d added to blobs', img_id)
               else:
                 self.favorites[user_id][album_id]['images'].remove(img_id)
+                failed_name = blob_data['loc'][(user_id, album_id, img_id)][0]
                 self.favorites[user_id][album_id]['failed_images'].add(
-                    (img_id, base.INT_TIME(), blob_data['loc'].popitem()[1][0], None))
+                    (img_id, base.INT_TIME(), failed_name, None))
                 del self.image_ids_index[img_id]
                 logging.error(
                     'Failed to fix image %d because of SHA mismatch (got %r, expected %r)',
@@ -1666,7 +2151,7 @@ class FapDatabase:
               del self.image_ids_index[img_id]
               logging.error(
                   'Failed to download/fix image ID %d in %s',
-                  img_id, self.AlbumStr(user_id, album_id))
+                  img_id, album_str)
               continue
           all_valid_ids.add(img_id)
         for failed_id in sorted(self.favorites[user_id][album_id]['failed_images']):
@@ -1675,7 +2160,7 @@ class FapDatabase:
             sha = self.image_ids_index[img_id]
             logging.error(
                 'Image ID %d in %s failed list is actually listed in the index as %r',
-                img_id, self.AlbumStr(user_id, album_id), sha)
+                img_id, album_str, sha)
             if sha in self.blobs:
               # in this case we can fix by promoting the image and adding it to the blob entry
               self.favorites[user_id][album_id]['images'].append(img_id)
@@ -1704,18 +2189,28 @@ class FapDatabase:
 
   def _CheckLocationIntegrity(self) -> None:
     """Make sure all 'loc' entries in blobs are for real user/album and known IDs."""
-    for sha in sorted(self.blobs.keys()):
-      for user_id, album_id, img_id in sorted(self.blobs[sha]['loc'].keys()):
-        if (user_id not in self.users or album_id not in self.favorites[user_id] or
-            img_id not in self.favorites[user_id][album_id]['images']):
-          logging.error('Blob %r has invalid location %d/%d/%d', sha, user_id, album_id, img_id)
-          # we fix by removing from 'loc'
-          del self.blobs[sha]['loc'][(user_id, album_id, img_id)]
-          logging.info('Corrected: deleted invalid location %d/%d/%d', user_id, album_id, img_id)
-          # we must make sure to leave a viable blob behind, so we check for that
-          if not self.blobs[sha]['loc']:
-            self._DeleteOrphanBlob(sha)
-            logging.info('Corrected: orphaned blob %r was deleted', sha)
+    # build all valid locations once, so each blob is checked with a single set difference
+    valid_locations: frozenset[LocationKeyType] = frozenset(
+        (user_id, album_id, img_id)
+        for user_id, albums in self.favorites.items() if user_id in self.users
+        for album_id, album in albums.items()
+        for img_id in album['images'])
+    images_by_sha: Optional[dict[str, list[int]]] = None  # reverse index: built once, if needed
+    for sha, blob in list(self.blobs.items()):  # list() to allow deletion of orphaned blobs
+      bad_locations = blob['loc'].keys() - valid_locations
+      if not bad_locations:
+        continue
+      for user_id, album_id, img_id in sorted(bad_locations):
+        logging.error('Blob %r has invalid location %d/%d/%d', sha, user_id, album_id, img_id)
+        # we fix by removing from 'loc'
+        del blob['loc'][(user_id, album_id, img_id)]
+        logging.info('Corrected: deleted invalid location %d/%d/%d', user_id, album_id, img_id)
+      # we must make sure to leave a viable blob behind, so we check for that
+      if not blob['loc']:
+        if images_by_sha is None:
+          images_by_sha = self._ImagesBySHA()
+        self._DeleteOrphanBlob(sha, images_by_sha=images_by_sha)
+        logging.info('Corrected: orphaned blob %r was deleted', sha)
     logging.info('Finished blob location entries integrity audit')
 
   def _CheckTagsIntegrity(self) -> None:
@@ -1730,57 +2225,78 @@ class FapDatabase:
           logging.info('Corrected: removed tag %d from blob %r', tag_id, sha)
     logging.info('Finished blob tags entries integrity audit')
 
-  def BlobIntegrityCheck(self) -> None:
+  def BlobIntegrityCheck(self, verify_hashes: bool = False) -> None:
     """Go over blobs in DB and on disk checking for missing entries on either side.
 
     This means both checking for blob files that are orphaned (don't have a DB entry) *and*
     checking that all SHA entries in DB have a blob and a thumb files.
+
+    Args:
+      verify_hashes: (default False) If True will also check that the (not encrypted) blob data
+          hashes to its SHA; this reads every blob, so it takes as long as reading the library
     """
-    self._SHAOrphanedCheck()
+    self._SHAOrphanedCheck(verify_hashes=verify_hashes)
     self._FileOrphanedCheck()
 
-  def _SHAOrphanedCheck(self) -> None:
-    """Check that all SHA entries in DB have a blob and a thumb files and sizes are OK."""
+  def _SHAOrphanedCheck(self, verify_hashes: bool = False) -> None:
+    """Check that all SHA entries in DB have a blob and a thumb files and sizes are OK.
+
+    Args:
+      verify_hashes: (default False) If True will also VerifyBlob() the (not encrypted) blobs
+    """
     # PHASE 1: Make sure all blobs in DB exist on disk, both as a blob and as a thumbnail
     logging.info('Searching for missing files...')
     missing_sha: set[str] = set()
     missing_count: int = 0
     decrypt_count: int = 0
     size_count: int = 0
-    for sha in sorted(self.blobs.keys()):
-      # check for files existence
-      has_blob, has_thumb = self.HasBlob(sha), self.HasThumbnail(sha)
-      if not has_blob or not has_thumb:
-        missing_sha.add(sha)
-        missing_count += 1
-        logging.error(
-            'Missing file entry %r: %s\n    %s blob / %s thumbnail',
-            sha, self.LocationsStr(self.blobs[sha]['loc']),
-            'OK' if has_blob else 'MISSING', 'OK' if has_thumb else 'MISSING')
-        continue  # no need to check for sizes here
-      # check that files decrypt correctly (no point in having them if they are corrupted)
-      try:
-        got_blob = len(self.GetBlob(sha))
-        got_thumb = len(self.GetThumbnail(sha))
-      except base.bin_fernet.InvalidToken:
-        missing_sha.add(sha)
-        decrypt_count += 1
-        logging.error('Decryption error in %r: %s', sha, self.LocationsStr(self.blobs[sha]['loc']))
-        continue  # we know this was a problem already
-      # check that sizes are precisely as reported in the database
-      blob_sz, thumb_sz = self.blobs[sha]['sz'], self.blobs[sha]['sz_thumb']
-      if got_blob != blob_sz or got_thumb != thumb_sz:
-        missing_sha.add(sha)
-        size_count += 1
-        logging.error(
-            'Inconsistent sizes in %r: %s\n    wanted %s / %s, got %s / %s',
-            sha, self.LocationsStr(self.blobs[sha]['loc']),
-            base.HumanizedBytes(blob_sz), base.HumanizedBytes(thumb_sz),
-            base.HumanizedBytes(got_blob), base.HumanizedBytes(got_thumb))
+    hash_count: int = 0
+    self._file_sizes = self._ScanFileSizes()  # one scandir() instead of a stat() per file
+    try:
+      for sha in sorted(self.blobs.keys()):
+        # check for files existence
+        has_blob, has_thumb = self.HasBlob(sha), self.HasThumbnail(sha)
+        if not has_blob or not has_thumb:
+          missing_sha.add(sha)
+          missing_count += 1
+          logging.error(
+              'Missing file entry %r: %s\n    %s blob / %s thumbnail',
+              sha, self.LocationsStr(self.blobs[sha]['loc']),
+              'OK' if has_blob else 'MISSING', 'OK' if has_thumb else 'MISSING')
+          continue  # no need to check for sizes here
+        # check that files decrypt correctly (no point in having them if they are corrupted)
+        try:
+          got_blob = self.GetBlobSize(sha)
+          got_thumb = self.GetThumbnailSize(sha)
+        except base.bin_fernet.InvalidToken:
+          missing_sha.add(sha)
+          decrypt_count += 1
+          logging.error(
+              'Decryption error in %r: %s', sha, self.LocationsStr(self.blobs[sha]['loc']))
+          continue  # we know this was a problem already
+        # check that sizes are precisely as reported in the database
+        blob_sz, thumb_sz = self.blobs[sha]['sz'], self.blobs[sha]['sz_thumb']
+        if got_blob != blob_sz or got_thumb != thumb_sz:
+          missing_sha.add(sha)
+          size_count += 1
+          logging.error(
+              'Inconsistent sizes in %r: %s\n    wanted %s / %s, got %s / %s',
+              sha, self.LocationsStr(self.blobs[sha]['loc']),
+              base.HumanizedBytes(blob_sz), base.HumanizedBytes(thumb_sz),
+              base.HumanizedBytes(got_blob), base.HumanizedBytes(got_thumb))
+          continue
+        # check that the blob data is what its SHA says it is, if asked to; encrypted blobs were
+        # already authenticated by their successful decryption above, so don't decrypt them again
+        if verify_hashes and self._key is None and not self.VerifyBlob(sha):
+          missing_sha.add(sha)
+          hash_count += 1
+          logging.error('Corrupted blob %r: %s', sha, self.LocationsStr(self.blobs[sha]['loc']))
+    finally:
+      self._file_sizes = None  # phase 2 writes files: the snapshot would be stale
     logging.warning(
         'Found %d missing or inconsistent blob entries '
-        '(%d missing, %d decryption errors, %d size inconsistencies)',
-        len(missing_sha), missing_count, decrypt_count, size_count)
+        '(%d missing, %d decryption errors, %d size inconsistencies, %d corrupted)',
+        len(missing_sha), missing_count, decrypt_count, size_count, hash_count)
     # PHASE 2: fix the entries that are missing
     if missing_sha:
       logging.warning('Starting DOWNLOAD of missing files...')
@@ -1838,17 +2354,13 @@ class FapDatabase:
     # get the image data afresh
     url_path, sanitized_image_name, extension = fapbase.ExtractFullImageURL(img_id)  # might 404
     image_bytes, sha = fapbase.GetBinary(url_path)                                   # might 404
-    # create a temporary file so we can do all the clear-text operations we need on the file
-    with tempfile.NamedTemporaryFile(delete=True) as temp_file:
-      # write the data we already have to the temp file
-      temp_file.write(image_bytes)
-      temp_file.flush()
-      # generate thumbnail and get dimensions and other image info, save image
-      thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
-          sha, extension, temp_file)
-      self._SaveImage(self._BlobPath(sha, extension_hint=extension), image_bytes)
-      percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
-          temp_file.name)
+    # generate thumbnail and get dimensions and other image info, save image
+    # (all the clear-text operations we need are done on the data in memory)
+    thumb_sz, width, height, is_animated, extension = self._MakeThumbnailForBlob(
+        sha, extension, image_bytes)
+    self._SaveImage(self._BlobPath(sha, extension_hint=extension), image_bytes)
+    percept_hash, average_hash, diff_hash, wavelet_hash, cnn_hash = self.duplicates.Encode(
+        image_bytes)
     # update blob, leave 'loc', 'tags' and 'gone' alone
     return (sha, {
         'loc': {(user_id, folder_id, img_id): (sanitized_image_name, 'new')},
@@ -1866,6 +2378,7 @@ class FapDatabase:
     orphaned_thumbs: dict[str, tuple[str, str]] = {}
     for dir_path, orphaned_obj, search_str in ((self._blobs_dir, orphaned_blobs, 'BLOB'),
                                                (self._thumbs_dir, orphaned_thumbs, 'THUMBNAIL')):
+      disk_files: dict[str, tuple[str, str]] = {}
       for _, _, file_names in os.walk(dir_path):
         for file_name in sorted(file_names):
           file_name = file_name.strip()
@@ -1873,12 +2386,14 @@ class FapDatabase:
             orphaned_unencrypted_leftovers.append((os.path.join(dir_path, file_name), file_name))
             logging.error('Leftover %s file found: %s', search_str, file_name)
             continue  # we already know this file is in the wrong place
-          sha = self._SHAFromFileName(file_name)
-          if sha not in self.blobs:
-            orphaned_obj[sha] = (os.path.join(dir_path, file_name), file_name)
-            logging.error('Orphaned %s file found: %s (%s)', search_str, file_name, sha)
+          disk_files[self._SHAFromFileName(file_name)] = (
+              os.path.join(dir_path, file_name), file_name)
         # stop after first directory (we don't want to "os.walk" into any other directory)
         break
+      # one C-level set difference instead of probing the (possibly huge) blobs dict per file
+      for sha in sorted(disk_files.keys() - self.blobs.keys()):
+        orphaned_obj[sha] = disk_files[sha]
+        logging.error('Orphaned %s file found: %s (%s)', search_str, disk_files[sha][1], sha)
     logging.warning('Found %d unencrypted file left-overs', len(orphaned_unencrypted_leftovers))
     logging.warning('Found %d orphaned BLOBs and %d orphaned THUMBNAILs',
                     len(orphaned_blobs), len(orphaned_thumbs))
@@ -1900,8 +2415,9 @@ class FapDatabase:
 
     Args:
       user_id: User ID
-      checkpoint_size: Commit database to disk every `checkpoint_size` images checked;
-          if zero will not checkpoint at all
+      checkpoint_size: Commit database to disk every `checkpoint_size` images checked
+          (but not more often than every CHECKPOINT_MIN_INTERVAL seconds); if zero will not
+          checkpoint at all
       force_audit: If True will audit even if recently audited
 
     Raises:
@@ -1917,71 +2433,98 @@ class FapDatabase:
         base.STD_TIME_STRING(self.users[user_id]['date_audit']))
     logging.info('*NO* checkpoints used (work may be lost!)' if checkpoint_size == 0 else
                  f'Checkpoint DB every {checkpoint_size} downloads')
-    # go over the albums and images for each album, in order
+    # go over the albums and images for each album, in order; the network checks for the
+    # locations of upcoming images run ahead, on a thread pool, and are still paced by
+    # fapbase.LimpingURLRead(); results (all the DB changes) are applied here, in order
     checked_count: int = 0
+    skipped_count: int = 0  # (recently audited images are only counted: there can be very many)
     problem_count: int = 0
-    for folder_id, _ in self.SortedUserAlbums(user_id):
-      logging.info('Audit folder %s', self.AlbumStr(user_id, folder_id))
-      for original_id in self.favorites[user_id][folder_id]['images']:
-        # audit this image: get hash and locations; we always audit all known locations of the image
-        sha = self.image_ids_index[original_id]
-        tm_last = max(
-            [self.blobs[sha]['date']] +
-            [g[0] for i, g in self.blobs[sha]['gone'].items() if i == original_id])
-        if not force_audit and tm_last and (tm_last + AUDIT_MIN_DOWNLOAD_WAIT) > base.INT_TIME():
-          logging.info('Image %d (%s) recently audited: SKIP (%s)',
-                       original_id, sha, base.STD_TIME_STRING(tm_last))
-          continue
-        for img_id in sorted({loc[2] for loc in self.blobs[sha]['loc'].keys()}):  # de-dup with set
-          # this is one known location of this image, so read the image page
-          # we can't use the full-res URL directly because it expires;
-          # also, using _FapHTMLRead() here will help pace the audit with pauses
-          url: str = fapbase.IMG_URL(img_id)
-          try:
-            img_html = fapbase.FapHTMLRead(url)
-          except fapbase.Error as err:  # Error, not just Error404: here we want to capture all
-            self.blobs[sha]['gone'][img_id] = (base.INT_TIME(), _FailureLevel.IMAGE_PAGE, url)
-            problem_count += 1
-            logging.warning('Image %d: ERROR on %r page: %s', img_id, url, err)
-            continue  # stop on first error for this img_id: do not update date
-          # we have a page, so extract the full-res URL
-          full_res_urls: list[str] = fapbase.FULL_IMAGE(img_id).findall(img_html)
-          if not full_res_urls:
-            self.blobs[sha]['gone'][img_id] = (base.INT_TIME(), _FailureLevel.URL_EXTRACTION, url)
-            problem_count += 1
-            logging.warning('Image %d: ERROR on %r full-res extraction', img_id, url)
-            continue  # stop on first error for this img_id: do not update date
-          full_res_url = full_res_urls[0]
-          # finally, stream the actual image to make sure it is there, but avoid data transfer:
-          # use the requests.get() with streaming to avoid a full download
-          # see: https://docs.python-requests.org/en/latest/user/advanced/#body-content-workflow
-          with requests.get(full_res_url, stream=True, timeout=None) as bin_request:  # nosec
-            # leaving context stops the download, closes connection, after just the header fetch
-            if (bin_request.status_code != 200 or
-                int(bin_request.headers['Content-Length']) != self.blobs[sha]['sz']):
-              self.blobs[sha]['gone'][img_id] = (
-                  base.INT_TIME(), _FailureLevel.FULL_RES, full_res_url)
+    last_checkpoint: tuple[int, float] = (0, time.monotonic())  # (checked count, time) of last Save
+    audit_ids: list[tuple[int, int]] = [
+        (folder_id, original_id) for folder_id, _ in self.SortedUserAlbums(user_id)
+        for original_id in self.favorites[user_id][folder_id]['images']]
+    checks: dict[int, dict[int, concurrent.futures.Future]] = {}  # audit_ids index: checks
+    checking_shas: set[str] = set()  # SHAs with checks in `checks`: de-dups repeated images
+    location_ids: dict[str, list[int]] = {}  # SHA: sorted location image IDs ('loc' is constant)
+    location_checks_done: dict[int, concurrent.futures.Future] = {}  # image ID: check, this run
+    next_check: int = 0
+
+    def _LastAudit(original_id: int) -> tuple[str, bool]:
+      # get hash and if the last audit was recent enough to skip a new audit now
+      sha = self.image_ids_index[original_id]
+      blob = self.blobs[sha]
+      gone = blob['gone'].get(original_id)  # ('gone' is keyed by image ID)
+      tm_last = blob['date'] if gone is None else max(blob['date'], gone[0])
+      return (sha, bool(
+          not force_audit and tm_last and (tm_last + AUDIT_MIN_DOWNLOAD_WAIT) > base.INT_TIME()))
+
+    def _CheckLocations(
+        pool: concurrent.futures.ThreadPoolExecutor,
+        sha: str) -> dict[int, concurrent.futures.Future]:
+      # we always audit all known locations of the image
+      img_ids = location_ids.get(sha)
+      if img_ids is None:
+        img_ids = location_ids[sha] = sorted({loc[2] for loc in self.blobs[sha]['loc'].keys()})
+      for img_id in img_ids:  # a location is checked (its page read) at most once in a run
+        if img_id not in location_checks_done:
+          location_checks_done[img_id] = pool.submit(_AuditLocation, img_id, self.blobs[sha]['sz'])
+      return {img_id: location_checks_done[img_id] for img_id in img_ids}
+
+    def _CheckAhead(pool: concurrent.futures.ThreadPoolExecutor) -> None:
+      nonlocal next_check
+      while len(checks) < _AUDIT_CHECK_AHEAD and next_check < len(audit_ids):
+        n_ahead = next_check
+        next_check += 1
+        ahead_sha, skip = _LastAudit(audit_ids[n_ahead][1])
+        if not skip and ahead_sha not in checking_shas:
+          checks[n_ahead] = _CheckLocations(pool, ahead_sha)
+          checking_shas.add(ahead_sha)
+
+    try:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_AUDIT_WORKERS) as audit_pool:
+        for n_audit, (folder_id, original_id) in enumerate(audit_ids):
+          if not n_audit or folder_id != audit_ids[n_audit - 1][0]:
+            logging.info('Audit folder %s', self.AlbumStr(user_id, folder_id))
+          _CheckAhead(audit_pool)
+          location_checks = checks.pop(n_audit, None)
+          # audit this image, unless it was recently audited (maybe just now, as a repeated image)
+          sha, skip = _LastAudit(original_id)
+          if location_checks is not None:
+            checking_shas.discard(sha)
+          if skip:
+            skipped_count += 1
+            continue
+          if location_checks is None:  # was not checked ahead (repeated image): check it now
+            location_checks = _CheckLocations(audit_pool, sha)
+          now = base.INT_TIME()  # (the time of this image's audit, for all its locations)
+          for img_id, location_check in location_checks.items():
+            failure = location_check.result()
+            if failure is not None:
+              self.blobs[sha]['gone'][img_id] = (now, failure[0], failure[1])
               problem_count += 1
-              logging.warning('Image %d: ERROR on binary %r page', img_id, full_res_url)
               continue  # stop on first error for this img_id: do not update date
-          # all went well for this img_id, we should also update the date
-          self.blobs[sha]['date'] = base.INT_TIME()
-        # we finished auditing this blob for all its locations
-        if self.blobs[sha]['gone']:
-          logging.warning('Image %d (%s) has errors for IDs %r',
-                          original_id, sha, set(self.blobs[sha]['gone'].keys()))
-        else:
-          logging.info('Image %d (%s) is OK', original_id, sha)
-        # checkpoint database, if needed
-        checked_count += 1
-        if checkpoint_size and not checked_count % checkpoint_size:
-          self.Save()
+            # all went well for this img_id, we should also update the date
+            self.blobs[sha]['date'] = now
+          # we finished auditing this blob for all its locations
+          if self.blobs[sha]['gone']:
+            logging.warning('Image %d (%s) has errors for IDs %r',
+                            original_id, sha, set(self.blobs[sha]['gone'].keys()))
+          else:
+            logging.info('Image %d (%s) is OK', original_id, sha)
+          # checkpoint database, if checked images since last one accumulate to threshold
+          checked_count += 1
+          if (checkpoint_size and checked_count - last_checkpoint[0] >= checkpoint_size and
+              time.monotonic() - last_checkpoint[1] >= CHECKPOINT_MIN_INTERVAL):
+            self.Save(wait=False)  # the files are written while the audit goes on
+            last_checkpoint = (checked_count, time.monotonic())
+    finally:
+      self._StopSaves()  # (re-raises the errors of background saves)
     # finished audit, mark user as audited
     self.users[user_id]['date_audit'] = base.INT_TIME()
     self.Save()
     logging.info(
-        'Audit for user %s finished, %d images checked, with %d image errors',
-        self.UserStr(user_id), checked_count, problem_count)
+        'Audit for user %s finished, %d images checked (%d recently audited were SKIPPED), '
+        'with %d image errors', self.UserStr(user_id), checked_count, skipped_count, problem_count)
 
   def ExportAll(self, re_number_files: bool = False) -> int:
     """Export all tags to disk.
@@ -2056,7 +2599,7 @@ class FapDatabase:
     """
     indexed_dict: dict[tuple[int, int, int], tuple[str, str]] = {}
     for tag_sha in {  # create intermediary set to de-dup
-        sha for sha, blob in self.blobs.items() if tag_ids.intersection(blob['tags'])}:
+        sha for sha, blob in self.blobs.items() if not tag_ids.isdisjoint(blob['tags'])}:
       # search for user/album/id to use
       all_loc = sorted(self.blobs[tag_sha]['loc'].keys())
       for user_id, album_id, img in all_loc:
@@ -2073,6 +2616,64 @@ class FapDatabase:
     return [indexed_dict[k] for k in sorted(indexed_dict.keys())]
 
 
+def _FetchImage(img_id: int) -> tuple[str, str, str, bytes, str]:
+  """Get full resolution image data for `img_id` (only does network work: is thread-safe).
+
+  Args:
+    img_id: The imagefap image ID
+
+  Returns:
+    (full-res URL, sanitized image name, extension, image bytes, image SHA256 hexdigest)
+
+  Raises:
+    fapbase.Error404: if image could not be found, with image ID & name (if known) filled in
+  """
+  sanitized_image_name: str = 'unknown'
+  try:
+    # get image's full resolution URL + name
+    url_path, sanitized_image_name, extension = fapbase.ExtractFullImageURL(img_id)
+    # get the binary data so we can compute the SHA for this image
+    image_bytes, sha = fapbase.GetBinary(url_path)
+  except fapbase.Error404 as err:
+    err.image_id = img_id
+    err.image_name = sanitized_image_name  # this might be None or this might be filled in
+    raise
+  return (url_path, sanitized_image_name, extension, image_bytes, sha)
+
+
+def _AuditLocation(img_id: int, blob_size: int) -> Optional[tuple[_FailureLevel, str]]:
+  """Check that image `img_id` is still online, with the expected size (network only: thread-safe).
+
+  Args:
+    img_id: The imagefap image ID (one of the locations of a blob)
+    blob_size: The size we have on record for the blob, in bytes
+
+  Returns:
+    None if image is OK; otherwise (failure level, URL that failed)
+  """
+  # this is one known location of this image, so read the image page
+  # we can't use the full-res URL directly because it expires;
+  # also, using FapHTMLRead() here will help pace the audit with pauses
+  url: str = fapbase.IMG_URL(img_id)
+  try:
+    img_html = fapbase.FapHTMLRead(url)
+  except fapbase.Error as err:  # Error, not just Error404: here we want to capture all
+    logging.warning('Image %d: ERROR on %r page: %s', img_id, url, err)
+    return (_FailureLevel.IMAGE_PAGE, url)
+  # we have a page, so extract the full-res URL
+  full_res_match = fapbase.FULL_IMAGE(img_id).search(img_html)  # (we only need the 1st match)
+  if full_res_match is None:
+    logging.warning('Image %d: ERROR on %r full-res extraction', img_id, url)
+    return (_FailureLevel.URL_EXTRACTION, url)
+  full_res_url: str = full_res_match.group(1)
+  # finally, check the actual image is there, with the right size, but avoid data transfer
+  status_code, content_length = fapbase.URLContentLength(full_res_url)
+  if status_code != 200 or content_length != blob_size:
+    logging.warning('Image %d: ERROR on binary %r page', img_id, full_res_url)
+    return (_FailureLevel.FULL_RES, full_res_url)
+  return None
+
+
 def _ThumbnailFrames(
     img_frames: Iterator[Image.Image], sha: str, width: int, height: int) -> Iterator[Image.Image]:
   """Convert a iterator of image frames to an iterator of thumbnail frames for desired dimensions.
@@ -2091,9 +2692,8 @@ def _ThumbnailFrames(
   try:
     for thumb_count, frame in enumerate(img_frames):
       try:
-        thumbnail = frame.copy()
-        thumbnail.thumbnail((width, height), Image.LANCZOS)
-        yield thumbnail
+        # resize() makes the (small) new frame directly, without a full size copy of each frame
+        yield frame.resize((width, height), Image.LANCZOS, reducing_gap=_THUMBNAIL_REDUCING_GAP)
         first_frame_done = True
       except OSError as err:
         err_msg = f'Thumbnail error in frame {thumb_count + 1}, image {sha!r}: {err}'
@@ -2107,6 +2707,200 @@ def _ThumbnailFrames(
     logging.error(err_msg)           # but only log subsequent errors (in secondary frames)
 
 
+def StatsStrs(
+    values: np.ndarray, humanize: Callable[[int], str]) -> tuple[str, str, str, str]:
+  """Humanized (min, max, mean, standard deviation) of `values`, with '-' for undefined ones.
+
+  Args:
+    values: Numeric np.ndarray
+    humanize: Formatter for the (int) values, like base.HumanizedBytes
+
+  Returns:
+    (min, max, mean, standard deviation) strings; deviation only defined for 3+ values
+  """
+  n_values = len(values)
+  if not n_values:
+    return ('-', '-', '-', '-')
+  return (humanize(int(values.min())), humanize(int(values.max())), humanize(int(values.mean())),
+          humanize(int(values.std(ddof=1))) if n_values > 2 else '-')
+
+
+def _AtomicWrite(file_path: str, *bin_chunks) -> None:
+  """Write bytes-like chunks to a temp file, sync it, then atomically move it into `file_path`."""
+  temp_path = file_path + '.tmp'
+  with open(temp_path, 'wb') as file_obj:
+    file_obj.writelines(bin_chunks)
+    file_obj.flush()
+    os.fsync(file_obj.fileno())  # data must be on disk before the rename makes it visible
+  os.replace(temp_path, file_path)
+
+
+def _SyncDirectory(dir_path: str) -> None:
+  """Sync a directory to disk, so the files recently renamed into it stay renamed after a crash."""
+  dir_fd = os.open(dir_path, os.O_RDONLY)
+  try:
+    os.fsync(dir_fd)
+  finally:
+    os.close(dir_fd)
+
+
+def _DumpShard(obj: Any) -> tuple[bytes, list]:
+  """Pickle `obj` with protocol 5, taking big binary buffers (numpy arrays) out-of-band.
+
+  The numpy arrays (like the blobs' 'cnn') are not copied into the pickle stream: their memory
+  is handed to us as pickle.PickleBuffer objects and written as-is after a small header. The
+  header also has the digest of the pickle stream, so _LoadShard() can tell if a buffers file
+  really belongs with the pickle (they are two files, and a save can be interrupted between them),
+  and the digest of the buffers, so the shard digest never has to read all the buffers on load.
+
+  Args:
+    obj: Object to pickle
+
+  Returns:
+    (pickle stream, list of bytes-like chunks for the buffers file; empty list if no buffers)
+  """
+  buffers: list[pickle.PickleBuffer] = []
+  pickle_data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+  if not buffers:
+    return (pickle_data, [])
+  raw_buffers = [b.raw() for b in buffers]
+  buffers_digest = hashlib.blake2b()
+  for raw_buffer in raw_buffers:
+    buffers_digest.update(raw_buffer)
+  header = (struct.pack(f'<{len(raw_buffers) + 1}Q', len(raw_buffers),
+                        *(r.nbytes for r in raw_buffers)) +
+            hashlib.blake2b(pickle_data).digest() + buffers_digest.digest())
+  return (pickle_data, [header] + raw_buffers)
+
+
+def _BuffersHeader(buffers_data) -> Union[bytes, memoryview]:
+  """The header of a buffers file written by _DumpShard(), without reading the buffers after it.
+
+  Args:
+    buffers_data: The bytes-like buffers file contents; empty if no buffers
+
+  Returns:
+    header: buffers lengths, pickle digest, and buffers digest; empty if no buffers
+  """
+  if not buffers_data:
+    return b''
+  buffers_view = memoryview(buffers_data)
+  n_buffers: int = struct.unpack_from('<Q', buffers_view)[0]
+  return buffers_view[:(8 * (n_buffers + 1) + 2 * _DB_BUFFERS_DIGEST_SIZE)]
+
+
+def _HexToBytes(value: Any) -> Any:
+  """Convert a hexadecimal string to bytes, if it can be converted back to the exact same string."""
+  if not isinstance(value, str):
+    return value
+  try:
+    bin_value = bytes.fromhex(value)
+  except ValueError:
+    return value  # not hexadecimal: keep the string
+  return bin_value if bin_value.hex() == value else value
+
+
+def _BlobsShard(sha: str) -> int:
+  """The number of the blobs shard that `sha` is saved in, from 0 to _BLOBS_SHARDS - 1."""
+  try:
+    return int(sha[:2], 16) * _BLOBS_SHARDS // 256  # SHAs are uniform, so shards are balanced
+  except ValueError:
+    return 0  # not an hexadecimal SHA: any fixed shard will do
+
+
+def _EncodeBlobs(blobs: _BlobType) -> tuple[str, tuple[str, ...], dict[Union[str, bytes], Any]]:
+  """Encode the blobs into a compact form for pickling: one tuple per blob, instead of a dict.
+
+  Every blob has the same keys, so instead of pickling the keys for every blob we pickle them
+  once (`_BLOB_FIELDS`) and the values as tuples in that order. The SHA keys and the hexadecimal
+  perceptual hashes are stored as bytes (half the size). Blobs that don't have exactly the
+  expected keys are kept as dicts, so the codec never loses data.
+
+  Args:
+    blobs: The blobs dict
+
+  Returns:
+    (_BLOBS_CODEC_TAG, _BLOB_FIELDS, {sha_bytes: tuple_of_values_or_blob_dict})
+  """
+  n_fields, get_fields = len(_BLOB_FIELDS), operator.itemgetter(*_BLOB_FIELDS)
+  hex_positions = [i for i, f in enumerate(_BLOB_FIELDS) if f in _BLOB_HEX_FIELDS]
+  encoded: dict[Union[str, bytes], Any] = {}
+  for sha, blob in blobs.items():
+    try:
+      if len(blob) != n_fields:
+        raise KeyError(sha)
+      values = list(get_fields(blob))
+    except KeyError:
+      encoded[_HexToBytes(sha)] = blob  # unexpected keys: keep as dict
+      continue
+    for i in hex_positions:
+      values[i] = _HexToBytes(values[i])
+    encoded[_HexToBytes(sha)] = tuple(values)
+  return (_BLOBS_CODEC_TAG, _BLOB_FIELDS, encoded)
+
+
+def _DecodeBlobs(obj: Any) -> _BlobType:
+  """Decode blobs encoded by _EncodeBlobs().
+
+  Args:
+    obj: The un-pickled blobs shard object
+
+  Returns:
+    blobs dict
+
+  Raises:
+    Error: if `obj` is not in the _EncodeBlobs() format
+  """
+  if not isinstance(obj, tuple) or not obj or obj[0] != _BLOBS_CODEC_TAG:
+    raise Error('Invalid blobs DB shard')
+  _, fields, encoded = obj
+  hex_fields = [f for f in fields if f in _BLOB_HEX_FIELDS]
+  blobs: _BlobType = {}
+  for key, values in encoded.items():
+    sha: str = key.hex() if isinstance(key, bytes) else key  # (str: SHA was not hexadecimal)
+    if isinstance(values, dict):
+      blobs[sha] = values  # type: ignore
+      continue
+    blob = dict(zip(fields, values))
+    for field in hex_fields:
+      if isinstance(blob[field], bytes):
+        blob[field] = blob[field].hex()
+    blob['ext'] = sys.intern(blob['ext'])  # a handful of extensions, shared by all the blobs
+    blobs[sha] = blob  # type: ignore
+  return blobs
+
+
+def _LoadShard(pickle_data: bytes, buffers_data) -> Any:
+  """Un-pickle an object saved by _DumpShard(), with arrays as zero-copy views into the buffers.
+
+  Args:
+    pickle_data: The pickle stream
+    buffers_data: The bytes-like buffers file contents; empty if no buffers
+
+  Returns:
+    un-pickled object
+
+  Raises:
+    Error: if the pickle needs buffers but `buffers_data` was not saved with it
+  """
+  buffers: Optional[list[memoryview]] = None
+  if buffers_data:
+    buffers_view = memoryview(buffers_data)
+    offset: int = len(_BuffersHeader(buffers_view))
+    pickle_digest = buffers_view[(offset - 2 * _DB_BUFFERS_DIGEST_SIZE):
+                                 (offset - _DB_BUFFERS_DIGEST_SIZE)]
+    if pickle_digest == hashlib.blake2b(pickle_data).digest():  # else: not ours, so refused
+      buffers = []
+      n_buffers: int = struct.unpack_from('<Q', buffers_view)[0]
+      for length in struct.unpack_from(f'<{n_buffers}Q', buffers_view, 8):
+        buffers.append(buffers_view[offset:(offset + length)])
+        offset += length
+  try:
+    return pickle.loads(pickle_data, buffers=buffers)
+  except pickle.UnpicklingError as err:
+    raise Error('DB shard does not match its buffers file') from err
+
+
 def GetDatabaseTimestamp(db_path: str = DEFAULT_DB_DIRECTORY) -> int:
   """Get the (int) timestamp that the database file was last modified.
 
@@ -2120,6 +2914,8 @@ def GetDatabaseTimestamp(db_path: str = DEFAULT_DB_DIRECTORY) -> int:
     Error: if database file does not already exist
   """
   db_file = os.path.join(os.path.expanduser(db_path), _DEFAULT_DB_NAME)
-  if not os.path.exists(db_file):
-    raise Error(f'Database file not found: {db_file!r}')
-  return math.ceil(os.path.getmtime(db_file))
+  try:
+    db_stat = os.stat(db_file)  # (a single stat() call for both existence and time)
+  except FileNotFoundError as err:
+    raise Error(f'Database file not found: {db_file!r}') from err
+  return math.ceil(db_stat.st_mtime)
@@ -12,10 +12,13 @@
 import base64
 import copy
 import hashlib
+import itertools
 import os
 import os.path
 # import pdb
+import sys
 import tempfile
+from typing import Any
 import unittest
 from unittest import mock
 
@@ -37,6 +40,10 @@ _TESTDATA_PATH = os.path.join(os.path.dirname(__file__), 'testdata/')
 class TestFapDatabase(unittest.TestCase):
   """Tests for fapdata.py."""
 
+  def setUp(self) -> None:
+    """Set up."""
+    fapbase._LISTING_CACHE.clear()  # pages read in one test must not be served in the next
+
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
   @mock.patch('fapfavorites.fapdata.os.mkdir')
   def test_Constructor(self, mock_mkdir: mock.MagicMock, mock_is_dir: mock.MagicMock) -> None:
@@ -156,6 +163,171 @@ class TestFapDatabase(unittest.TestCase):
     del os.environ['IMAGEFAP_FAVORITES_DB_PATH']
     del os.environ['IMAGEFAP_FAVORITES_DB_KEY']
 
+  @mock.patch('fapfavorites.fapdata.getpass.getpass')
+  def test_SaveShards(self, mock_getpass: mock.MagicMock) -> None:
+    """Test."""
+    self.maxDiff = None
+    mock_getpass.side_effect = ['', '']
+    with tempfile.TemporaryDirectory() as db_path:
+      db = fapdata.FapDatabase(db_path)
+      db.Load()
+      # first save writes all the shards and the manifest
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.Save()
+        self.assertEqual(
+            write.call_count, len(fapdata._DB_MAIN_KEYS) - 1 + fapdata._BLOBS_SHARDS + 1)
+        write.assert_called_with(os.path.join(db_path, 'imagefap.database'), mock.ANY)  # last
+      for db_key in fapdata._DB_MAIN_KEYS - {'blobs'}:
+        self.assertTrue(os.path.exists(os.path.join(db_path, f'imagefap.{db_key}.db')))
+      for n_shard in range(fapdata._BLOBS_SHARDS):
+        self.assertTrue(os.path.exists(os.path.join(db_path, f'imagefap.blobs.{n_shard:02x}.db')))
+      self.assertFalse(os.path.exists(os.path.join(db_path, 'imagefap.blobs.db')))
+      # nothing changed: no shard is written
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.Save()
+        write.assert_not_called()
+      # a failed write does not mark the shard as saved: the next save writes it again
+      db.users[10] = copy.deepcopy(_USERS[10])
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', side_effect=OSError('disk full')):
+        with self.assertRaisesRegex(OSError, r'disk full'):
+          db.Save()
+      # only the changed shard is written (and the manifest)
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.Save()
+        self.assertListEqual(
+            write.call_args_list,
+            [mock.call(os.path.join(db_path, 'imagefap.users.db'), mock.ANY),
+             mock.call(os.path.join(db_path, 'imagefap.database'), mock.ANY)])
+      db = fapdata.FapDatabase(db_path)
+      self.assertTrue(db.Load())
+      self.assertDictEqual(db.users, _USERS)
+      # an old monolithic DB is loaded and migrated to shards on next save
+      base.BinSerialize(db._db, file_path=os.path.join(db_path, 'imagefap.database'),
+                        compress=False, key=None)
+      db = fapdata.FapDatabase(db_path)
+      self.assertTrue(db.Load())
+      self.assertDictEqual(db.users, _USERS)
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.Save()
+        self.assertEqual(
+            write.call_count, len(fapdata._DB_MAIN_KEYS) - 1 + fapdata._BLOBS_SHARDS + 1)
+      # a new blob only writes its own blobs shard (and the manifest)
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.blobs['ff' * 32] = {'sz': 2}  # type: ignore
+        db.Save()
+        self.assertListEqual(
+            write.call_args_list,
+            [mock.call(os.path.join(db_path, 'imagefap.blobs.3f.db'), mock.ANY),
+             mock.call(os.path.join(db_path, 'imagefap.database'), mock.ANY)])
+      # arrays of a vanilla DB are loaded as read-only views into the mapped buffers file
+      db.blobs['abc'] = {'cnn': np.arange(4, dtype=np.float32)}  # type: ignore
+      db.blobs['0a' * 32] = {'sz': 1}  # type: ignore
+      db.image_ids_index[100] = '0a' * 32
+      db.Save()
+      db = fapdata.FapDatabase(db_path)
+      self.assertTrue(db.Load())
+      self.assertIs(db.image_ids_index[100], next(k for k in db.blobs if k == '0a' * 32))
+      np.testing.assert_array_equal(db.blobs['abc']['cnn'], np.arange(4, dtype=np.float32))
+      self.assertFalse(db.blobs['abc']['cnn'].flags.writeable)
+      db.blobs['abc']['cnn'] = np.arange(5, dtype=np.float32)
+      db.Save()  # buffers file is replaced while still mapped
+      saved_digests = db._shard_digests
+      db = fapdata.FapDatabase(db_path)
+      self.assertTrue(db.Load())
+      self.assertDictEqual(db._shard_digests, saved_digests)  # (only buffers headers were read)
+      np.testing.assert_array_equal(db.blobs['abc']['cnn'], np.arange(5, dtype=np.float32))
+      # a shard that loses its arrays has its buffers file removed (after the manifest is saved)
+      buffers_path = os.path.join(db_path, f'imagefap.blobs.{fapdata._BlobsShard("abc"):02x}.db')
+      buffers_path += fapdata._DB_BUFFERS_SUFFIX
+      self.assertTrue(os.path.exists(buffers_path))
+      db.blobs['abc']['cnn'] = None  # type: ignore
+      db.Save()
+      self.assertFalse(os.path.exists(buffers_path))
+      db.blobs['abc']['cnn'] = np.arange(5, dtype=np.float32)
+      db.Save()
+      # background save: DB is serialized before returning, so later changes are not saved
+      db.users[10] = copy.deepcopy(_USERS[10])
+      db.Save(wait=False)
+      db.users[10]['name'] = 'changed-later'
+      db._WaitForSave()
+      saved_db = fapdata.FapDatabase(db_path)
+      self.assertTrue(saved_db.Load())
+      self.assertDictEqual(saved_db.users, _USERS)
+      db.Save()
+      saved_db = fapdata.FapDatabase(db_path)
+      self.assertTrue(saved_db.Load())
+      self.assertEqual(saved_db.users[10]['name'], 'changed-later')
+      # a failed background save is re-raised when stopping, and the next save writes it again
+      db.users[10]['name'] = 'failed-in-background'
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', side_effect=OSError('disk full')):
+        db.Save(wait=False)
+        with self.assertRaisesRegex(OSError, r'disk full'):
+          db._StopSaves()
+      self.assertIsNone(db._save_pool)
+      with mock.patch('fapfavorites.fapdata._AtomicWrite', wraps=fapdata._AtomicWrite) as write:
+        db.Save()
+        self.assertListEqual(
+            write.call_args_list,
+            [mock.call(os.path.join(db_path, 'imagefap.users.db'), mock.ANY),
+             mock.call(os.path.join(db_path, 'imagefap.database'), mock.ANY)])
+      saved_db = fapdata.FapDatabase(db_path)
+      self.assertTrue(saved_db.Load())
+      self.assertEqual(saved_db.users[10]['name'], 'failed-in-background')
+    del os.environ['IMAGEFAP_FAVORITES_DB_PATH']
+
+  def test_BlobsCodec(self) -> None:
+    """Test."""
+    self.maxDiff = None
+    blobs = copy.deepcopy(_BLOBS)
+    for blob in blobs.values():
+      blob['cnn'] = np.arange(4, dtype=np.float32)
+    blobs['partial'] = {'tags': {1}, 'sz': 10}  # type: ignore
+    blobs['0aaef1becbd966a2adcb970069f6cdaa62ee832fbb24e3c827a39fbc463c0e19']['diff'] = 'NotHex'
+    sha = 'ed1441656a734052e310f30837cc706d738813602fcc468132aebaf0f316870e'
+    blobs[sha]['ext'] = ''.join(['jp', 'g'])  # a new (not interned) string, like after un-pickling
+    encoded = fapdata._EncodeBlobs(blobs)
+    self.assertEqual(encoded[0], fapdata._BLOBS_CODEC_TAG)
+    self.assertIsInstance(encoded[2][bytes.fromhex(sha)], tuple)
+    self.assertNotIn(sha, encoded[2])
+    self.assertEqual(encoded[2][bytes.fromhex(sha)][fapdata._BLOB_FIELDS.index('percept')],
+                     bytes.fromhex(blobs[sha]['percept']))
+    self.assertIs(encoded[2]['partial'], blobs['partial'])
+    decoded = fapdata._DecodeBlobs(encoded)
+    self.assertListEqual(list(decoded.keys()), list(blobs.keys()))
+    for k, blob in blobs.items():
+      self.assertListEqual(sorted(decoded[k].keys()), sorted(blob.keys()))
+      for field, value in blob.items():
+        if field == 'cnn':
+          np.testing.assert_array_equal(decoded[k][field], value)  # type: ignore
+        else:
+          self.assertEqual(decoded[k][field], value)  # type: ignore
+    self.assertIs(decoded[sha]['ext'], sys.intern('jpg'))  # extensions are shared
+    with self.assertRaisesRegex(fapdata.Error, r'Invalid blobs DB shard'):
+      fapdata._DecodeBlobs(blobs)
+
+  def test_DumpShard(self) -> None:
+    """Test."""
+    self.maxDiff = None
+    obj = {'foo': {'cnn': np.arange(6, dtype=np.float32), 'sz': 5},
+           'bar': {'cnn': np.arange(2, 5, dtype=np.float32), 'sz': 6}}
+    pickle_data, buffer_chunks = fapdata._DumpShard(obj)
+    self.assertEqual(len(buffer_chunks), 3)  # header + 2 arrays out-of-band
+    self.assertEqual(fapdata._BuffersHeader(b''.join(buffer_chunks)), buffer_chunks[0])
+    self.assertEqual(fapdata._BuffersHeader(b''), b'')
+    loaded = fapdata._LoadShard(pickle_data, b''.join(buffer_chunks))
+    self.assertListEqual(sorted(loaded.keys()), ['bar', 'foo'])
+    np.testing.assert_array_equal(loaded['foo']['cnn'], obj['foo']['cnn'])
+    np.testing.assert_array_equal(loaded['bar']['cnn'], obj['bar']['cnn'])
+    self.assertEqual(loaded['bar']['sz'], 6)
+    other_pickle, other_chunks = fapdata._DumpShard({'foo': {'cnn': np.arange(7, dtype=np.int8)}})
+    with self.assertRaisesRegex(fapdata.Error, r'does not match its buffers'):
+      fapdata._LoadShard(other_pickle, b''.join(buffer_chunks))  # buffers of another pickle
+    pickle_data, buffer_chunks = fapdata._DumpShard({'foo': 1})
+    self.assertListEqual(buffer_chunks, [])
+    self.assertDictEqual(fapdata._LoadShard(pickle_data, b''), {'foo': 1})
+    self.assertDictEqual(  # stale buffers file (shard has no buffers anymore) is ignored
+        fapdata._LoadShard(pickle_data, b''.join(other_chunks)), {'foo': 1})
+
   def test_SHAFromFileName(self) -> None:
     """Test."""
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
@@ -176,6 +348,26 @@ class TestFapDatabase(unittest.TestCase):
       db._SHAFromFileName(
           '434FEF877249ACFD67CF5c37a082898bf151b2b30126d5f618656e1b073c0278')
 
+  def test_BlobColumns(self) -> None:
+    """Test."""
+    db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
+    columns = db.BlobColumns()
+    self.assertListEqual(list(columns['rows'].keys()), list(db.blobs.keys()))
+    self.assertListEqual(columns['sz'].tolist(), [b['sz'] for b in db.blobs.values()])
+    self.assertListEqual(columns['width'].tolist(), [b['width'] for b in db.blobs.values()])
+    self.assertEqual(int(columns['animated'].sum()), 1)
+    self.assertEqual(int(columns['gone'].sum()), 0)
+    self.assertListEqual(columns['n_loc'].tolist(), [len(b['loc']) for b in db.blobs.values()])
+    rows = db.BlobRows(columns, [109, 102, 999, 102])  # 999 is not in index: skipped
+    self.assertListEqual(columns['sz'][rows].tolist(), [444973, 54643, 54643])
+    self.assertListEqual(db.BlobRows(columns, []).tolist(), [])
+
+  def test_StatsStrs(self) -> None:
+    """Test."""
+    self.assertTupleEqual(fapdata.StatsStrs(np.array([], dtype=np.int64), str), ('-',) * 4)
+    self.assertTupleEqual(fapdata.StatsStrs(np.array([3, 5]), str), ('3', '5', '4', '-'))
+    self.assertTupleEqual(fapdata.StatsStrs(np.array([3, 5, 10]), str), ('3', '10', '6', '3'))
+
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
   def test_GetTag(self, mock_is_dir: mock.MagicMock) -> None:
     """Test."""
@@ -207,6 +399,14 @@ class TestFapDatabase(unittest.TestCase):
       db.GetTag(11)
     with self.assertRaisesRegex(fapdata.Error, r'tag 3 \(of 33\) is empty'):
       db.GetTag(33)
+    # direct changes to the tags structure are picked up, even after the index is built
+    db._db['tags'] = copy.deepcopy(_TEST_TAGS_2)
+    self.assertEqual(db.TagLineageStr(246), 'two/two-four/deep (246)')
+    db.tags[2]['tags'][25] = {'name': 'new', 'tags': {}}  # type: ignore
+    self.assertEqual(db.TagLineageStr(25), 'two/new (25)')
+    del db.tags[2]['tags'][24]['tags'][246]               # type: ignore
+    with self.assertRaisesRegex(fapdata.Error, r'246 was not found'):
+      db.GetTag(246)
 
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
   def test_TagsWalk(self, mock_is_dir: mock.MagicMock) -> None:
@@ -228,6 +428,10 @@ class TestFapDatabase(unittest.TestCase):
         list((i, n, d) for i, n, d, _ in db.TagsWalk(
             start_tag=_TEST_TAGS_2[2]['tags'])),  # type: ignore
         [(24, 'two-four', 0), (246, 'deep', 1), (22, 'two-two', 0)])
+    self.assertDictEqual(
+        db.TagLineageStrs(),
+        {tid: db.TagLineageStr(tid) for tid, _, _, _ in db.TagsWalk()})
+    self.assertEqual(db.TagLineageStrs(add_id=False)[246], 'two/two-four/deep')
     db._db['blobs'] = {  # type: ignore
         'a': {'tags': {1, 2, 33}, 'sz': 10}, 'b': {'tags': {246, 33}, 'sz': 55}}
     self.assertListEqual(db.PrintTags(), _PRINTED_TAGS)
@@ -372,8 +576,8 @@ class TestFapDatabase(unittest.TestCase):
     self.assertListEqual(
         mock_read.call_args_list,
         [mock.call('https://www.imagefap.com/showfavorites.php?userid=11&page=0&folderid=22'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=20'),
          mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=0&folderid=20')])
+    # (the folder check re-used the page that was just read to get the name)
 
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
   @mock.patch('fapfavorites.fapbase.FapHTMLRead')
@@ -416,7 +620,7 @@ class TestFapDatabase(unittest.TestCase):
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
   @mock.patch('fapfavorites.fapdata.base.INT_TIME')
   @mock.patch('fapfavorites.fapbase.FapHTMLRead')
-  @mock.patch('fapfavorites.fapbase.CheckFolderIsForImages')
+  @mock.patch('fapfavorites.fapbase.FilterImagesFolders')
   @mock.patch('fapfavorites.fapdata.FapDatabase._CheckWorkHysteresis')
   def test_AddAllUserFolders(
       self, hysteresis: mock.MagicMock, is_images: mock.MagicMock,
@@ -426,13 +630,14 @@ class TestFapDatabase(unittest.TestCase):
     is_dir.return_value = True
     int_time.return_value = 1001
     hysteresis.side_effect = [False, True]
-    html_read.side_effect = ['page-0', 'page-1', 'page-2']
-    is_images.side_effect = [None, None, fapdata.Error()]
+    html_read.side_effect = lambda url: f'page-{url.split("=")[-1]}'  # pages are read concurrently
+    is_images.side_effect = [{15}, {25}]
     # get_pics.return_value = ([100, 101, 102, 103, 104], 2, 3)
     fapbase.FIND_FOLDERS = fapbase_test.MockRegex({
         'page-0': [('15', 'fav-15'), ('20', 'fav-15')],
         'page-1': [('25', 'fav-25'), ('30', 'fav-30')],
-        'page-2': []})
+        'page-2': [],
+        'page-3': [('35', 'fav-35')]})  # read ahead, but never looked at
     db = fapdata.FapDatabase('/xxx/')
     with self.assertRaisesRegex(fapdata.Error, r'user was not added'):
       db.AddAllUserFolders(10, False)
@@ -446,14 +651,15 @@ class TestFapDatabase(unittest.TestCase):
         hysteresis.call_args_list,
         [mock.call(False, 400, 'Getting all image favorites for user user-10 (10)'),
          mock.call(True, 400, 'Getting all image favorites for user user-10 (10)')])
-    self.assertListEqual(
+    self.assertCountEqual(
         html_read.call_args_list,
         [mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=0'),
          mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=1'),
-         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=2')])
+         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=2'),
+         mock.call('https://www.imagefap.com/showfavorites.php?userid=10&page=3')])
     self.assertListEqual(
         is_images.call_args_list,
-        [mock.call(10, 15), mock.call(10, 25), mock.call(10, 30)])
+        [mock.call(10, [15]), mock.call(10, [25, 30])])
     fapbase.FIND_FOLDERS = None  # set to None for safety
 
   @mock.patch('fapfavorites.fapdata.os.path.isdir')
@@ -514,23 +720,30 @@ class TestFapDatabase(unittest.TestCase):
       f_name = os.path.join(_TESTDATA_PATH, name)
       with open(f_name, 'rb') as f_obj:
         test_images[name] = f_obj.read()
-    # prepare side effects
-    get_bin.side_effect = [(test_images[name], hashlib.sha256(test_images[name]).hexdigest())
-                           for name in test_names] + [fapbase.Error404('url-110')]
-    img_url.side_effect = [('url-100', '100.jpg', 'jpg'),  # this is for album 10/20
-                           ('url-101', '101.jpg', 'jpg'),
-                           ('url-102', '102.jpg', 'jpg'),
-                           ('url-103', '103.jpg', 'jpg'),
-                           ('url-104', '104.png', 'png'),  # 104 is actually a JPG!
-                           ('url-105', '105.jpg', 'jpg'),  # 105 is identical to 100
-                           ('url-106', '106.jpg', 'jpg'),
-                           ('url-107', '107.png', 'png'),
-                           ('url-108', '108.png', 'png'),
-                           ('url-109', '109.gif', 'gif'),
-                           ('url-110', '110.jpg', 'jpg'),  # this last one will 404
-                           ('url-104', '104.png', 'png'),  # this is for album 10/30
-                           ('url-105', '105.jpg', 'jpg'),
-                           fapbase.Error404('url-106')]    # this last one will 404
+    # prepare side effects (by URL/ID, as new images are fetched concurrently)
+    bin_results: dict[str, Any] = {
+        f'url-{name.split(".", maxsplit=1)[0]}': (
+            test_images[name], hashlib.sha256(test_images[name]).hexdigest())
+        for name in test_names}
+    bin_results['url-110'] = fapbase.Error404('url-110')
+    get_bin.side_effect = lambda url: _ResultOrRaise(bin_results[url])
+    url_results: dict[int, list[Any]] = {
+        100: [('url-100', '100.jpg', 'jpg')],  # this is for album 10/20
+        101: [('url-101', '101.jpg', 'jpg')],
+        102: [('url-102', '102.jpg', 'jpg')],
+        103: [('url-103', '103.jpg', 'jpg')],
+        104: [('url-104', '104.png', 'png'),   # 104 is actually a JPG!
+              ('url-104', '104.png', 'png')],  # (2nd call is for album 10/30)
+        105: [('url-105', '105.jpg', 'jpg'),   # 105 is identical to 100
+              ('url-105', '105.jpg', 'jpg')],
+        106: [('url-106', '106.jpg', 'jpg'),
+              fapbase.Error404('url-106')],    # this last one will 404
+        107: [('url-107', '107.png', 'png')],
+        108: [('url-108', '108.png', 'png')],
+        109: [('url-109', '109.gif', 'gif')],
+        110: [('url-110', '110.jpg', 'jpg')],  # this one will 404 on binary fetch
+    }
+    img_url.side_effect = lambda img_id: _ResultOrRaise(url_results[img_id].pop(0))
     with tempfile.TemporaryDirectory() as db_path:
       db = fapdata.FapDatabase(db_path, create_if_needed=True)  # create a password-less DB
       # test error case
@@ -577,7 +790,32 @@ class TestFapDatabase(unittest.TestCase):
       self.assertEqual(
           len(db.GetThumbnail('dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180')),
           11890)
-      self.assertListEqual(db.PrintStats(), (_PRINTED_STATS_FULL % db_path).splitlines()[1:])
+      self.assertEqual(
+          db.GetBlobSize('dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180'), 89216)
+      self.assertEqual(
+          db.GetThumbnailSize('dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180'),
+          11890)
+      db._file_sizes = db._ScanFileSizes()  # same answers from one scan of the dirs, no stat()
+      with mock.patch('os.path.getsize') as getsize, mock.patch('os.path.exists') as exists:
+        self.assertTrue(
+            db.HasBlob('4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207'))
+        self.assertEqual(
+            db.GetBlobSize('dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180'),
+            89216)
+        self.assertEqual(
+            db.GetThumbnailSize(
+                'dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180'), 11890)
+        getsize.assert_not_called()
+        exists.assert_not_called()
+      db._file_sizes = None
+      self.assertTrue(
+          db.VerifyBlob('dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180'))
+      db_size = sum(os.path.getsize(os.path.join(db_path, f))
+                    for f in os.listdir(db_path) if f.startswith('imagefap.'))
+      self.assertListEqual(
+          db.PrintStats(),
+          (_PRINTED_STATS_FULL % (
+              db_path, base.HumanizedBytes(db_size), (100.0 * db_size) / 893851)).splitlines()[1:])
       self.assertListEqual(db.PrintUsersAndFavorites(), _PRINTED_USERS_FULL)
       db._db['tags'][1] = {'name': 'one', 'tags': {}}
       db.blobs['dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180']['tags'] = {1}
@@ -589,12 +827,12 @@ class TestFapDatabase(unittest.TestCase):
            mock.call(True, 500, 'Downloading album user-10/fav-20 (10/20) images'),
            mock.call(True, 1675368670, 'Downloading album user-10/fav-20 (10/20) images'),
            mock.call(True, 600, 'Downloading album user-10/fav-30 (10/30) images')])
-      self.assertListEqual(
+      self.assertCountEqual(
           img_url.call_args_list,
           [mock.call(100), mock.call(101), mock.call(102), mock.call(103), mock.call(104),
            mock.call(105), mock.call(106), mock.call(107), mock.call(108), mock.call(109),
            mock.call(110), mock.call(104), mock.call(105), mock.call(106)])
-      self.assertListEqual(
+      self.assertCountEqual(
           get_bin.call_args_list,
           [mock.call('url-100'), mock.call('url-101'), mock.call('url-102'), mock.call('url-103'),
            mock.call('url-104'), mock.call('url-105'), mock.call('url-106'), mock.call('url-107'),
@@ -623,7 +861,24 @@ class TestFapDatabase(unittest.TestCase):
       self.assertDictEqual(db.blobs, {})
       self.assertDictEqual(db.image_ids_index, {})
 
+  @mock.patch('fapfavorites.fapdata.os.remove')
+  def test_DeleteAlbum(self, remove: mock.MagicMock) -> None:
+    """Test."""
+    self.maxDiff = None
+    db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
+    self.assertTupleEqual(db.DeleteAlbum(10, 30), (0, 0))  # all its images are also in album 20
+    self.assertListEqual(sorted(db.image_ids_index.keys()), list(range(100, 110)))
+    self.assertEqual(len(db.blobs), 9)
+    remove.assert_not_called()
+    db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
+    self.assertTupleEqual(db.DeleteAlbum(10, 20), (6, 1))
+    self.assertListEqual(sorted(db.image_ids_index.keys()), [104, 105, 106])  # used by album 30
+    self.assertEqual(len(db.blobs), 3)
+    self.assertEqual(remove.call_count, 12)  # blob + thumbnail for each deleted blob
+    self.assertListEqual(sorted(db.favorites[10].keys()), [30])
+
   @mock.patch('fapfavorites.fapdata.FapDatabase._UsersIntegrityCheck')
+  @mock.patch('fapfavorites.fapdata.FapDatabase._RebuildImageIdsIndex')
   @mock.patch('fapfavorites.fapdata.FapDatabase._AlbumIdsIntegrityCheck')
   @mock.patch('fapfavorites.fapdata.FapDatabase._CheckForIndexOrphans')
   @mock.patch('fapfavorites.fapdata.FapDatabase._CheckLocationIntegrity')
@@ -631,19 +886,33 @@ class TestFapDatabase(unittest.TestCase):
   @mock.patch('fapfavorites.fapdata.FapDatabase.Save')
   def test_AlbumIntegrityCheck(
       self, save: mock.MagicMock, tags: mock.MagicMock, location: mock.MagicMock,
-      index: mock.MagicMock, albums: mock.MagicMock, users: mock.MagicMock) -> None:
+      index: mock.MagicMock, albums: mock.MagicMock, rebuild: mock.MagicMock,
+      users: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
     albums.return_value = {1, 2, 3}
     db.AlbumIntegrityCheck()
     users.assert_called_once_with()
+    rebuild.assert_called_once_with()
     albums.assert_called_once_with()
     index.assert_called_once_with({1, 2, 3})
     location.assert_called_once_with()
     tags.assert_called_once_with()
     save.assert_called_once_with()
 
+  def test_RebuildImageIdsIndex(self) -> None:
+    """Test."""
+    self.maxDiff = None
+    db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
+    index_obj = db.image_ids_index
+    del db.image_ids_index[103]                # missing from index
+    db.image_ids_index[999] = 'orphaned-sha'   # in index but in no blob location
+    db.image_ids_index[100] = 'wrong-sha'      # points to the wrong blob
+    db._RebuildImageIdsIndex()
+    self.assertDictEqual(db.image_ids_index, _INDEX)
+    self.assertIs(db.image_ids_index, index_obj)
+
   @mock.patch('fapfavorites.fapdata.FapDatabase._FileOrphanedCheck')
   @mock.patch('fapfavorites.fapdata.FapDatabase._SHAOrphanedCheck')
   def test_BlobIntegrityCheck(
@@ -652,8 +921,11 @@ class TestFapDatabase(unittest.TestCase):
     self.maxDiff = None
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
     db.BlobIntegrityCheck()
-    sha_orphaned.assert_called_once_with()
+    sha_orphaned.assert_called_once_with(verify_hashes=False)
     file_orphaned.assert_called_once_with()
+    sha_orphaned.reset_mock()
+    db.BlobIntegrityCheck(verify_hashes=True)
+    sha_orphaned.assert_called_once_with(verify_hashes=True)
 
   @mock.patch('fapfavorites.fapdata.FapDatabase.AddUserByID')
   def test_UsersIntegrityCheck(self, add_user: mock.MagicMock) -> None:
@@ -780,13 +1052,15 @@ class TestFapDatabase(unittest.TestCase):
 
   @mock.patch('fapfavorites.fapdata.FapDatabase.HasBlob')
   @mock.patch('fapfavorites.fapdata.FapDatabase.HasThumbnail')
-  @mock.patch('fapfavorites.fapdata.FapDatabase.GetBlob')
-  @mock.patch('fapfavorites.fapdata.FapDatabase.GetThumbnail')
+  @mock.patch('fapfavorites.fapdata.FapDatabase.GetBlobSize')
+  @mock.patch('fapfavorites.fapdata.FapDatabase.GetThumbnailSize')
+  @mock.patch('fapfavorites.fapdata.FapDatabase.VerifyBlob')
   @mock.patch('fapfavorites.fapdata.FapDatabase.Save')
   @mock.patch('fapfavorites.fapdata.FapDatabase._CreateFilesOnDiskAndProposeBlob')
   def test_SHAOrphanedCheck(
-      self, propose_blob: mock.MagicMock, save: mock.MagicMock, get_thumb: mock.MagicMock,
-      get_blob: mock.MagicMock, has_thumb: mock.MagicMock, has_blob: mock.MagicMock) -> None:
+      self, propose_blob: mock.MagicMock, save: mock.MagicMock, verify_blob: mock.MagicMock,
+      get_thumb: mock.MagicMock, get_blob: mock.MagicMock, has_thumb: mock.MagicMock,
+      has_blob: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
     # correct keys and sizes are as follows:
@@ -802,10 +1076,11 @@ class TestFapDatabase(unittest.TestCase):
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
     has_blob.side_effect = [True, True, False, True, True, True, True, True, True]
     has_thumb.side_effect = [True, True, True, False, True, True, True, True, True]
-    get_blob.side_effect = ['0' * 54643, '3' * 45309, '9' * 39147, 'd' * 99,
-                            'e' * 56583, 'e' * 444973, 'e' * 43144]
-    get_thumb.side_effect = ['0' * 54643, '3' * 45309, '9' * 39147, 'd' * 11890,
-                             fapdata.base.bin_fernet.InvalidToken, 'e' * 99, 'e' * 43144]
+    get_blob.side_effect = [54643, 45309, 39147, 99, 56583, 444973, 43144]
+    get_thumb.side_effect = [54643, 45309, 39147, 11890,
+                             fapdata.base.bin_fernet.InvalidToken, 99, 43144]
+    verify_blob.return_value = True
+    db._key = None  # not encrypted, so blobs with correct sizes get their SHA verified (if asked)
     propose_blob.side_effect = [
         ('4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207',
          {'loc': {}, 'tags': {}, 'gone': {}, 'flag': True}),
@@ -817,7 +1092,7 @@ class TestFapDatabase(unittest.TestCase):
         ('e221b76f559461769777a772a58e44960d85ffec73627d9911260ae13825e60e',
          {'loc': {}, 'tags': {}, 'gone': {}, 'flag': True}),
         fapbase.Error404('url')]
-    db._SHAOrphanedCheck()
+    db._SHAOrphanedCheck(verify_hashes=True)
     for sha in ['4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207',
                 '74bab8c9b692a582f7b90c27a0d80fe0a073f70991c1c8aa1815745127e5c449',
                 'dfc28d8c6ba0553ac749780af2d0cdf5305798befc04a1569f63657892a2e180',
@@ -835,6 +1110,7 @@ class TestFapDatabase(unittest.TestCase):
                  mock.call('ed257bbbcb316f05f852f80b705d0c911e8ee51c7962fa207962b40a653fd5f9')]
     self.assertListEqual(get_blob.call_args_list, get_calls)
     self.assertListEqual(get_thumb.call_args_list, get_calls)
+    self.assertListEqual(verify_blob.call_args_list, [get_calls[i] for i in (0, 1, 2, 6)])
     self.assertListEqual(
         propose_blob.call_args_list,
         [mock.call(10, 20, 107), mock.call(10, 20, 104), mock.call(10, 20, 106),
@@ -897,33 +1173,39 @@ class TestFapDatabase(unittest.TestCase):
          mock.call(
              '/foo/thumbs/434FEF877249ACFD67CF5c37a082898bf151b2b30126d5f618656e1b073c0279.jpg')])
 
+  @mock.patch('fapfavorites.fapdata.time.monotonic')
   @mock.patch('fapfavorites.fapdata.base.INT_TIME')
-  @mock.patch('fapfavorites.fapdata.requests.get')
+  @mock.patch('fapfavorites.fapbase.URLContentLength')
   @mock.patch('fapfavorites.fapbase.FapHTMLRead')
   @mock.patch('fapfavorites.fapdata.FapDatabase.Save')
   def test_Audit(
       self, mock_save: mock.MagicMock, mock_read: mock.MagicMock, mock_get: mock.MagicMock,
-      int_time: mock.MagicMock) -> None:
+      int_time: mock.MagicMock, monotonic: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
     int_time.return_value = 1676368670
+    monotonic.side_effect = itertools.count(0.0, 10.0)  # 10s between checks: 5 images is >30s
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
     with self.assertRaisesRegex(fapdata.Error, r'Unknown user'):
       db.Audit(99, 5, False)
-    mock_read.side_effect = ['page-100', 'page-105', 'page-101', 'page-102',
-                             fapbase.Error404('page-103'), 'page-104', 'page-106', 'page-107',
-                             fapbase.Error404('page-108'), 'page-109']  # 103 & 108 fail here
-    fapbase.FULL_IMAGE = fapbase_test.MockRegex({
+    read_results: dict[str, Any] = {  # (locations are checked concurrently: key by URL)
+        f'https://www.imagefap.com/photo/{i}/': f'page-{i}' for i in range(100, 110)}
+    read_results['https://www.imagefap.com/photo/103/'] = fapbase.Error404('page-103')
+    read_results['https://www.imagefap.com/photo/108/'] = fapbase.Error404('page-108')
+    mock_read.side_effect = lambda url: _ResultOrRaise(read_results[url])  # 103 & 108 fail here
+    fapbase.FULL_IMAGE = lambda unused_id: fapbase_test.MockRegex({
         'page-100': ['url-100'], 'page-101': ['url-101'], 'page-102': [],
         'page-104': ['url-104'], 'page-105': ['url-105'], 'page-106': [],
         'page-107': ['url-107'], 'page-109': []})  # 102 & 106 & 109 fail here
-    mock_get.side_effect = [_MockRequestsGet(200, 56583),  # id 100, correct size
-                            _MockRequestsGet(200, 56583),  # id 105, correct size
-                            _MockRequestsGet(200, 39147),  # id 101, correct size
-                            _MockRequestsGet(404, 1),      # id 104, error 404
-                            _MockRequestsGet(200, 99)]     # id 107, INCORRECT size
+    get_results: dict[str, tuple[int, int]] = {
+        'url-100': (200, 56583),  # id 100, correct size
+        'url-105': (200, 56583),  # id 105, correct size
+        'url-101': (200, 39147),  # id 101, correct size
+        'url-104': (404, 1),      # id 104, error 404
+        'url-107': (200, 99)}     # id 107, INCORRECT size
+    mock_get.side_effect = lambda url: get_results[url]
     db.Audit(10, 5, False)
-    self.assertListEqual(
+    self.assertCountEqual(
         mock_read.call_args_list,
         [mock.call('https://www.imagefap.com/photo/100/'),
          mock.call('https://www.imagefap.com/photo/105/'),
@@ -935,14 +1217,14 @@ class TestFapDatabase(unittest.TestCase):
          mock.call('https://www.imagefap.com/photo/107/'),
          mock.call('https://www.imagefap.com/photo/108/'),
          mock.call('https://www.imagefap.com/photo/109/')])
-    self.assertListEqual(
+    self.assertCountEqual(
         mock_get.call_args_list,
-        [mock.call('url-100', stream=True, timeout=None),
-         mock.call('url-105', stream=True, timeout=None),
-         mock.call('url-101', stream=True, timeout=None),
-         mock.call('url-104', stream=True, timeout=None),
-         mock.call('url-107', stream=True, timeout=None)])
-    self.assertListEqual(mock_save.call_args_list, [mock.call(), mock.call()])
+        [mock.call('url-100'),
+         mock.call('url-105'),
+         mock.call('url-101'),
+         mock.call('url-104'),
+         mock.call('url-107')])
+    self.assertListEqual(mock_save.call_args_list, [mock.call(wait=False), mock.call()])
     self.assertEqual(db.users[10]['date_audit'], 1676368670)
     self.assertDictEqual(db.blobs, _BLOBS_AUDITED)
     fapbase.FULL_IMAGE = None  # set to None for safety
@@ -968,10 +1250,12 @@ class TestFapDatabase(unittest.TestCase):
   @mock.patch('os.listdir')
   @mock.patch('fapfavorites.fapdata.FapDatabase.GetBlob')
   @mock.patch('fapfavorites.fapbase.hashlib.sha256')
+  @mock.patch('fapfavorites.fapbase.FileSHA256')
+  @mock.patch('os.path.getsize')
   def test_ExportTag_No_Renumber(
-      self, digest: mock.MagicMock, get_blob: mock.MagicMock, listdir: mock.MagicMock,
-      remove: mock.MagicMock, mkdir: mock.MagicMock, exists: mock.MagicMock,
-      isdir: mock.MagicMock) -> None:
+      self, getsize: mock.MagicMock, file_digest: mock.MagicMock, digest: mock.MagicMock,
+      get_blob: mock.MagicMock, listdir: mock.MagicMock, remove: mock.MagicMock,
+      mkdir: mock.MagicMock, exists: mock.MagicMock, isdir: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
     db = _TestDBFactory()  # pylint: disable=no-value-for-parameter
@@ -992,9 +1276,10 @@ class TestFapDatabase(unittest.TestCase):
 
     digest.side_effect = [
         _Sha256('0aaef1becbd966a2adcb970069f6cdaa62ee832fbb24e3c827a39fbc463c0e19'),  # 1st file
-        _Sha256('0aaef1becbd966a2adcb970069f6cdaa62ee832fbb24e3c827a39fbc463c0e19'),
-        _Sha256('4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207'),  # 2nd file
-        _Sha256('no')]
+        _Sha256('4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207')]  # 2nd file
+    file_digest.side_effect = [
+        '0aaef1becbd966a2adcb970069f6cdaa62ee832fbb24e3c827a39fbc463c0e19', 'no']
+    getsize.return_value = len(b'file')
     op = mock.mock_open(read_data=b'some data')
     with mock.patch('builtins.open', op):
       self.assertEqual(db.ExportTag(22), 2)
@@ -1010,18 +1295,18 @@ class TestFapDatabase(unittest.TestCase):
         exists.call_args_list,
         [mock.call('/foo/tag_export/two/two-two/102.jpg'),
          mock.call('/foo/tag_export/two/two-two/107.png')])
+    self.assertListEqual(digest.call_args_list, [mock.call(b'file'), mock.call(b'file')])
     self.assertListEqual(
-        digest.call_args_list,
-        [mock.call(b'file'), mock.call(b'some data'), mock.call(b'file'), mock.call(b'some data')])
+        file_digest.call_args_list,
+        [mock.call('/foo/tag_export/two/two-two/102.jpg'),
+         mock.call('/foo/tag_export/two/two-two/107.png')])
     self.assertListEqual(
         get_blob.call_args_list,
         [mock.call('0aaef1becbd966a2adcb970069f6cdaa62ee832fbb24e3c827a39fbc463c0e19'),
          mock.call('4c49275f4bb6ed2fd502a51a0fc3b24661483c1aa9d4acc1dc91f035877df207')])
     self.assertListEqual(
         op.call_args_list,
-        [mock.call('/foo/tag_export/two/two-two/102.jpg', 'rb'),
-         mock.call('/foo/tag_export/two/two-two/107.png', 'rb'),
-         mock.call('/foo/tag_export/two/two-two/4c49275f4b-107.png', 'wb')])
+        [mock.call('/foo/tag_export/two/two-two/4c49275f4b-107.png', 'wb')])
     handle = op()
     self.assertListEqual(handle.write.call_args_list, [mock.call(b'file')])
     listdir.assert_not_called()
@@ -1075,34 +1360,25 @@ class TestFapDatabase(unittest.TestCase):
          mock.call('/foo/tag_export/two/two-two/00002-107.png')])
     digest.assert_not_called()
 
-  @mock.patch('os.path.exists')
-  @mock.patch('os.path.getmtime')
-  def test_GetDatabaseTimestamp(self, getmtime: mock.MagicMock, exists: mock.MagicMock) -> None:
+  @mock.patch('os.stat')
+  def test_GetDatabaseTimestamp(self, mock_stat: mock.MagicMock) -> None:
     """Test."""
     self.maxDiff = None
-    exists.side_effect = [True, False]
-    getmtime.return_value = 100.93
+    mock_stat.side_effect = [mock.MagicMock(st_mtime=100.93), FileNotFoundError('/foo/bar')]
     self.assertEqual(fapdata.GetDatabaseTimestamp(), 101)
-    with self.assertRaisesRegex(fapdata.Error, r''):
+    with self.assertRaisesRegex(fapdata.Error, r'Database file not found'):
       fapdata.GetDatabaseTimestamp('/foo/bar')
     self.assertListEqual(
-        exists.call_args_list,
+        mock_stat.call_args_list,
         [mock.call(os.path.expanduser('~/Downloads/imagefap/imagefap.database')),
          mock.call('/foo/bar/imagefap.database')])
-    getmtime.assert_called_once_with(os.path.expanduser('~/Downloads/imagefap/imagefap.database'))
-
-
-class _MockRequestsGet:
-
-  def __init__(self, status_code: int, content_length: int):
-    self.status_code = status_code
-    self.headers = {'Content-Length': content_length}
 
-  def __enter__(self):
-    return self
 
-  def __exit__(self, unused_type, unused_value, unused_traceback):
-    pass
+def _ResultOrRaise(result: Any) -> Any:
+  """Return `result`, or raise it if it is an exception (for use in lambdas)."""
+  if isinstance(result, Exception):
+    raise result
+  return result
 
 
 @mock.patch('fapfavorites.fapdata.os.path.isdir')
@@ -1677,7 +1953,7 @@ TAG_ID: TAG_NAME (NUMBER_OF_IMAGES_WITH_TAG / SIZE_OF_IMAGES_WITH_TAG)
 """.splitlines()[1:]
 
 _PRINTED_STATS_FULL = """
-Database is located in '%s/imagefap.database', and is 23.34kb (2.674%% of total images size)
+Database is located in '%s/imagefap.database', and is %s (%0.3f%% of total images size)
 872.90kb total (unique) images size (38.23kb min, 434.54kb max, 96.99kb mean with 127.52kb standard deviation, 1 are animated)
 Pixel size (width, height): 22.49k pixels min (130, 173), 66.60k pixels max (300, 222), 39.38k mean with 13.51k standard deviation
 657.91kb total thumbnail size (11.61kb min, 295.06kb max, 73.10kb mean with 84.74kb standard deviation), 75.4%% of total images size
@@ -97,16 +97,18 @@ def _LocalOperation(database: fapdata.FapDatabase, local_dir: str) -> None:
   logging.info('Read a total of %s from local disk', base.HumanizedBytes(total_sz))
 
 
-def _AuditOperation(database: fapdata.FapDatabase, user_id: int, force_audit: bool) -> None:
+def _AuditOperation(
+    database: fapdata.FapDatabase, user_id: int, force_audit: bool, verify_hashes: bool) -> None:
   """Implement `audit` user operation: Check consistency and user images for continued existence.
 
   Args:
     database: Active fapdata.FapDatabase
     user_id: User ID
     force_audit: If True will audit even if recently audited
+    verify_hashes: If True will also check the (not encrypted) blob data against its SHA256
   """
   print('Checking DATABASE INTEGRITY')
-  database.BlobIntegrityCheck()
+  database.BlobIntegrityCheck(verify_hashes=verify_hashes)
   database.AlbumIntegrityCheck()
   print('Executing AUDIT command')
   database.Audit(user_id, fapdata.AUDIT_CHECKPOINT_LENGTH, force_audit)
@@ -142,6 +144,10 @@ def _AuditOperation(database: fapdata.FapDatabase, user_id: int, force_audit: bo
     help='Ignore recency check for download/audit of favorite images? Default '
          'is False ("no"). This will force a download/audit even if the album/image '
          'is fresh in the database')
+@click.option(
+    '--verify-hashes/--no-verify-hashes', 'verify_hashes', default=False,
+    help='Read every (not encrypted) blob during `audit` and check it against its SHA256? '
+         'Default is False ("no"). This reads all the images from disk, so it is slow')
 @base.Timed('Imagefap favorites.py')
 def Main(operation: str,  # noqa: C901
          user_name: str,
@@ -150,7 +156,8 @@ def Main(operation: str,  # noqa: C901
          folder_id: int,
          local_dir: str,
          output_path: str,
-         force_download: bool) -> None:  # noqa: D301
+         force_download: bool,
+         verify_hashes: bool) -> None:  # noqa: D301
   """Download imagefap.com image favorites (picture folder).
 
   ATTENTION: The script will deliberately pace its image fetching, taking
@@ -175,7 +182,8 @@ def Main(operation: str,  # noqa: C901
   in the DB are missing from the site. This will *not* download any new images
   but will re-check the existence of images in the database for that user.
   Images that were read from local disk will not be audited. Use `audit`
-  sparingly, as it is rather wasteful.
+  sparingly, as it is rather wasteful. Add --verify-hashes to also read every
+  image file on disk and check it against its SHA256 (slow).
 
   Typical examples:
 
@@ -208,6 +216,8 @@ def Main(operation: str,  # noqa: C901
   success_message: str = f'{base.TERM_WARNING}premature end? user paused?'
   try:
     # check inputs
+    if verify_hashes and operation.lower() != 'audit':
+      raise AttributeError('Only use flag --verify-hashes with `audit` operation')
     if local_dir:
       if operation.lower() != 'read':
         raise AttributeError('Only use flag --local with `read` operation')
@@ -249,7 +259,7 @@ def Main(operation: str,  # noqa: C901
       else:
         _ReadOperation(database, user_id, folder_id, force_download)
     elif operation.lower() == 'audit':
-      _AuditOperation(database, user_id, force_download)
+      _AuditOperation(database, user_id, force_download, verify_hashes)
     else:
       raise NotImplementedError(f'Unrecognized/Unimplemented operation {operation!r}')
     success_message = f'{base.TERM_GREEN}success'
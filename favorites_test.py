@@ -42,6 +42,9 @@ class TestFavorites(unittest.TestCase):
     with self.assertRaisesRegex(AttributeError, r'flags together with --local'):
       favorites.Main(  # pylint: disable=no-value-for-parameter
           ['read', '--user', 'foo', '--local', 'bar', '--output', '/path/'])
+    with self.assertRaisesRegex(AttributeError, r'use flag --verify-hashes with `audit`'):
+      favorites.Main(  # pylint: disable=no-value-for-parameter
+          ['read', '--user', 'foo', '--verify-hashes', '--output', '/path/'])
 
   @mock.patch('fapfavorites.favorites.fapdata.os.path.isdir')
   @mock.patch('fapfavorites.favorites.fapbase.ConvertUserName')
@@ -336,7 +339,7 @@ class TestFavorites(unittest.TestCase):
     load.assert_called_once_with()
     add_user_by_name.assert_called_once_with('"foo-user"')
     album_integrity.assert_called_once_with()
-    blob_integrity.assert_called_once_with()
+    blob_integrity.assert_called_once_with(verify_hashes=False)
     audit.assert_called_once_with(10, 100, False)
     save.assert_not_called()
     convert_favorites.assert_not_called()
@@ -350,6 +353,15 @@ class TestFavorites(unittest.TestCase):
     download_favorites.assert_not_called()
     add_all.assert_not_called()
     add_local.assert_not_called()
+    # the blobs can also be checked against their SHA256
+    blob_integrity.reset_mock()
+    try:
+      favorites.Main(  # pylint: disable=no-value-for-parameter
+          ['audit', '--user', '"foo-user"', '--verify-hashes', '--output', '/path/'])
+    except SystemExit as err:
+      if err.code:  # pylint: disable=using-constant-test
+        raise
+    blob_integrity.assert_called_once_with(verify_hashes=True)
 
 
 SUITE = unittest.TestLoader().loadTestsFromTestCase(TestFavorites)
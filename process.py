@@ -118,8 +118,9 @@ def _RunExport(database: fapdata.FapDatabase, tag_name: str, renumber_files: boo
   if not tag_name:
     database.ExportAll(re_number_files=renumber_files)
     return
+  lower_name = tag_name.lower()  # (lowercase the searched name only once)
   for tid, name, _, _ in database.TagsWalk():
-    if tag_name.lower() == name.lower():
+    if name.lower() == lower_name:
       database.ExportTag(tid, re_number_files=renumber_files)
       break
   else:
@@ -3,7 +3,6 @@
 import functools
 import logging
 # import pdb
-import statistics
 from typing import Any, Optional
 
 from django import http
@@ -140,24 +139,18 @@ def ServeUsers(request: http.HttpRequest) -> http.HttpResponse:
   total_thumbs: int = 0
   total_failed: int = 0
   total_albums: int = 0
+  columns = db.BlobColumns()  # numpy columns: sums & statistics without going over the dicts
   for uid, user in db.users.items():
-    file_sizes: list[int] = [
-        db.blobs[db.image_ids_index[i]]['sz']
-        for f in db.favorites.get(uid, {}).values()
-        for i in f['images'] if i in db.image_ids_index]
-    thumbs_sizes: list[int] = [
-        db.blobs[db.image_ids_index[i]]['sz_thumb']
-        for f in db.favorites.get(uid, {}).values()
-        for i in f['images'] if i in db.image_ids_index]
-    n_animated = sum(
-        bool(db.blobs[db.image_ids_index[i]]['animated'])
-        for f in db.favorites.get(uid, {}).values()
-        for i in f['images'] if i in db.image_ids_index)
+    rows = db.BlobRows(
+        columns, (i for f in db.favorites.get(uid, {}).values() for i in f['images']))
+    file_sizes, thumbs_sizes = columns['sz'][rows], columns['sz_thumb'][rows]
+    n_animated = int(columns['animated'][rows].sum())
     unique_failed: set[int] = set()
     for failed in (f['failed_images'] for f in db.favorites.get(uid, {}).values()):
       unique_failed.update(img for img, _, _, _ in failed)
     n_img = len(file_sizes)
     n_albums = len(db.favorites.get(uid, {}))
+    min_sz, max_sz, mean_sz, dev_sz = fapdata.StatsStrs(file_sizes, base.HumanizedBytes)
     users[uid] = {
         'name': user['name'],
         'date_albums': base.STD_TIME_STRING(user['date_albums']),
@@ -167,21 +160,20 @@ def ServeUsers(request: http.HttpRequest) -> http.HttpResponse:
         'n_failed': len(unique_failed),
         'n_animated': f'{n_animated} ({(100.0 * n_animated / n_img) if n_img else 0.0:0.1f}%)',
         'n_albums': n_albums,
-        'files_sz': base.HumanizedBytes(sum(file_sizes) if file_sizes else 0),
-        'thumbs_sz': base.HumanizedBytes(sum(thumbs_sizes) if thumbs_sizes else 0),
-        'min_sz': base.HumanizedBytes(min(file_sizes)) if file_sizes else '-',
-        'max_sz': base.HumanizedBytes(max(file_sizes)) if file_sizes else '-',
-        'mean_sz': base.HumanizedBytes(int(statistics.mean(file_sizes))) if file_sizes else '-',
-        'dev_sz': base.HumanizedBytes(
-            int(statistics.stdev(file_sizes))) if len(file_sizes) > 2 else '-',
+        'files_sz': base.HumanizedBytes(int(file_sizes.sum())),
+        'thumbs_sz': base.HumanizedBytes(int(thumbs_sizes.sum())),
+        'min_sz': min_sz,
+        'max_sz': max_sz,
+        'mean_sz': mean_sz,
+        'dev_sz': dev_sz,
         'url': fapbase.USER_PAGE_URL(user['name']),
     }
     total_img += n_img
     total_failed += len(unique_failed)
     total_animated += n_animated
     total_albums += n_albums
-    total_sz += sum(file_sizes) if file_sizes else 0
-    total_thumbs += sum(thumbs_sizes) if file_sizes else 0
+    total_sz += int(file_sizes.sum())
+    total_thumbs += int(thumbs_sizes.sum())
   # send to page
   context: dict[str, Any] = {
       'users': users,
@@ -234,22 +226,16 @@ def ServeFavorites(request: http.HttpRequest, user_id: int) -> http.HttpResponse
   total_sz: int = 0
   total_thumbs_sz: int = 0
   total_animated: int = 0
+  columns = db.BlobColumns()  # numpy columns: sums & statistics without going over the dicts
   for fid, name in names:
     obj = db.favorites[user_id][fid]
     count_img = len(obj['images'])
     count_failed = len(obj['failed_images'])
-    count_disappeared = sum(
-        1 for i in obj['images']
-        if i in db.image_ids_index if db.blobs[db.image_ids_index[i]]['gone'])
-    file_sizes: list[int] = [
-        db.blobs[db.image_ids_index[i]]['sz']
-        for i in obj['images'] if i in db.image_ids_index]
-    thumbs_sizes: list[int] = [
-        db.blobs[db.image_ids_index[i]]['sz_thumb']
-        for i in obj['images'] if i in db.image_ids_index]
-    n_animated = sum(
-        int(db.blobs[db.image_ids_index[i]]['animated'])
-        for i in obj['images'] if i in db.image_ids_index)
+    rows = db.BlobRows(columns, obj['images'])
+    count_disappeared = int(columns['gone'][rows].sum())
+    file_sizes, thumbs_sizes = columns['sz'][rows], columns['sz_thumb'][rows]
+    n_animated = int(columns['animated'][rows].sum())
+    min_sz, max_sz, mean_sz, dev_sz = fapdata.StatsStrs(file_sizes, base.HumanizedBytes)
     favorites[fid] = {
         'name': name,
         'pages': obj['pages'],
@@ -258,21 +244,20 @@ def ServeFavorites(request: http.HttpRequest, user_id: int) -> http.HttpResponse
         'failed': count_failed,
         'disappeared': (f'{count_disappeared} ({100.0 * count_disappeared / count_img:0.1f}%)'
                         if count_disappeared else '-'),
-        'files_sz': base.HumanizedBytes(sum(file_sizes) if file_sizes else 0),
-        'min_sz': base.HumanizedBytes(min(file_sizes)) if file_sizes else '-',
-        'max_sz': base.HumanizedBytes(max(file_sizes)) if file_sizes else '-',
-        'mean_sz': base.HumanizedBytes(int(statistics.mean(file_sizes))) if file_sizes else '-',
-        'dev_sz': base.HumanizedBytes(
-            int(statistics.stdev(file_sizes))) if len(file_sizes) > 2 else '-',
-        'thumbs_sz': base.HumanizedBytes(sum(thumbs_sizes) if thumbs_sizes else 0),
+        'files_sz': base.HumanizedBytes(int(file_sizes.sum())),
+        'min_sz': min_sz,
+        'max_sz': max_sz,
+        'mean_sz': mean_sz,
+        'dev_sz': dev_sz,
+        'thumbs_sz': base.HumanizedBytes(int(thumbs_sizes.sum())),
         'n_animated': (f'{n_animated} '
                        f'({(100.0 * n_animated / count_img) if count_img else 0.0:0.1f}%)'),
         'url': fapbase.FOLDER_URL(user_id, fid, 0),
     }
     total_failed += count_failed
     total_disappeared += count_disappeared
-    total_sz += sum(file_sizes) if file_sizes else 0
-    total_thumbs_sz += sum(thumbs_sizes) if thumbs_sizes else 0
+    total_sz += int(file_sizes.sum())
+    total_thumbs_sz += int(thumbs_sizes.sum())
     total_animated += n_animated
   # send to page
   all_img_count = sum(f['count'] for f in favorites.values())
@@ -487,16 +472,16 @@ def _ServeImages(  # noqa: C901
                   if db.blobs[sha]['width'] / db.blobs[sha]['height'] > 1.1]
   if tag_value_1 and not tag_filter_1:
     image_list = [(img, sha) for img, sha in image_list
-                  if not tag_child_ids_1.intersection(db.blobs[sha]['tags'])]
+                  if tag_child_ids_1.isdisjoint(db.blobs[sha]['tags'])]
   elif tag_value_1 and tag_filter_1 == 2:
     image_list = [(img, sha) for img, sha in image_list
-                  if tag_child_ids_1.intersection(db.blobs[sha]['tags'])]
+                  if not tag_child_ids_1.isdisjoint(db.blobs[sha]['tags'])]
   if tag_value_2 and not tag_filter_2:
     image_list = [(img, sha) for img, sha in image_list
-                  if not tag_child_ids_2.intersection(db.blobs[sha]['tags'])]
+                  if tag_child_ids_2.isdisjoint(db.blobs[sha]['tags'])]
   elif tag_value_2 and tag_filter_2 == 2:
     image_list = [(img, sha) for img, sha in image_list
-                  if tag_child_ids_2.intersection(db.blobs[sha]['tags'])]
+                  if not tag_child_ids_2.isdisjoint(db.blobs[sha]['tags'])]
   # stack the hashes in rows of _IMG_COLUMNS columns
   stacked_blobs = [image_list[i:(i + _IMG_COLUMNS)]
                    for i in range(0, len(image_list), _IMG_COLUMNS)]
@@ -510,6 +495,7 @@ def _ServeImages(  # noqa: C901
     stacked_disappeared[-1] += [(0, '') for i in range(_IMG_COLUMNS - len(stacked_disappeared[-1]))]
   # format blob data to be included as auxiliary data
   blobs_data: dict[str, dict[str, dict[str, Any]]] = {}
+  tag_lineages = db.TagLineageStrs(add_id=False)
   for img, sha in image_list:
     blob = db.blobs[sha]
     # find the correct 'loc' entry (to get the name)
@@ -532,7 +518,9 @@ def _ServeImages(  # noqa: C901
         'verdict': blob['loc'][loc][1],
         'sz': base.HumanizedBytes(blob['sz']),
         'dimensions': f'{blob["width"]}x{blob["height"]} (WxH)',
-        'tags': ', '.join(sorted(db.TagLineageStr(t, add_id=False) for t in blob['tags'])),
+        'tags': ', '.join(sorted(
+            tag_lineages[t] if t in tag_lineages else db.TagLineageStr(t, add_id=False)
+            for t in blob['tags'])),
         'has_duplicate': (img, sha) in exact_duplicates,
         'album_duplicate': (img, sha) in album_duplicates,
         'has_percept': (img, sha) in percept_verdicts,
@@ -567,8 +555,7 @@ def _ServeImages(  # noqa: C901
       'count_disappeared': len(disappeared_list),
       'stacked_disappeared': stacked_disappeared,
       'blobs_data': blobs_data,
-      'form_tags': [(tid, name, db.TagLineageStr(tid, add_id=False))
-                    for tid, name, _, _ in db.TagsWalk()],
+      'form_tags': [(tid, name, tag_lineages[tid]) for tid, name, _, _ in db.TagsWalk()],
       'warning_message': warning_message,
       'error_message': error_message,
   }